@@ -0,0 +1,43 @@
+"""Add has_attachments and indexes for search operators
+
+Revision ID: 2b8d4f6e0a13
+Revises: 7c5e1a9b3f20
+Create Date: 2026-10-19 17:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b8d4f6e0a13'
+down_revision: Union[str, None] = '7c5e1a9b3f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing rows can't be backfilled (attachment parts were never stored);
+    # they pick up the flag when they are next fetched from the provider.
+    op.add_column('emails', sa.Column('has_attachments', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+    op.create_index('ix_emails_user_sent_at', 'emails', ['user_id', 'sent_at'], unique=False)
+    op.create_index('ix_emails_user_unread', 'emails', ['user_id', 'sent_at'], unique=False, postgresql_where=sa.text('NOT is_read'))
+    op.create_index('ix_emails_user_starred', 'emails', ['user_id', 'sent_at'], unique=False, postgresql_where=sa.text('is_starred'))
+    op.create_index('ix_emails_user_important', 'emails', ['user_id', 'sent_at'], unique=False, postgresql_where=sa.text('is_important'))
+    op.create_index('ix_emails_user_attachments', 'emails', ['user_id', 'sent_at'], unique=False, postgresql_where=sa.text('has_attachments'))
+    op.create_index('ix_emails_user_trash', 'emails', ['user_id', 'sent_at'], unique=False, postgresql_where=sa.text('is_trash'))
+    op.create_index('ix_emails_labels', 'emails', [sa.text('CAST(labels AS JSONB)')], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_emails_labels', table_name='emails')
+    op.drop_index('ix_emails_user_trash', table_name='emails')
+    op.drop_index('ix_emails_user_attachments', table_name='emails')
+    op.drop_index('ix_emails_user_important', table_name='emails')
+    op.drop_index('ix_emails_user_starred', table_name='emails')
+    op.drop_index('ix_emails_user_unread', table_name='emails')
+    op.drop_index('ix_emails_user_sent_at', table_name='emails')
+    op.drop_column('emails', 'has_attachments')
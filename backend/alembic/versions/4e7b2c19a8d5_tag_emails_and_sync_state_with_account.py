@@ -0,0 +1,38 @@
+"""Tag emails and sync_state with the connected account they belong to
+
+Revision ID: 4e7b2c19a8d5
+Revises: c3a91f0d2b64
+Create Date: 2026-10-19 10:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e7b2c19a8d5'
+down_revision: Union[str, None] = 'c3a91f0d2b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('emails', sa.Column('account_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('fk_emails_account_id', 'emails', 'connected_accounts', ['account_id'], ['id'], ondelete='SET NULL')
+    op.create_index(op.f('ix_emails_account_id'), 'emails', ['account_id'], unique=False)
+
+    op.add_column('sync_state', sa.Column('account_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('fk_sync_state_account_id', 'sync_state', 'connected_accounts', ['account_id'], ['id'], ondelete='CASCADE')
+    op.create_index(op.f('ix_sync_state_account_id'), 'sync_state', ['account_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_sync_state_account_id'), table_name='sync_state')
+    op.drop_constraint('fk_sync_state_account_id', 'sync_state', type_='foreignkey')
+    op.drop_column('sync_state', 'account_id')
+
+    op.drop_index(op.f('ix_emails_account_id'), table_name='emails')
+    op.drop_constraint('fk_emails_account_id', 'emails', type_='foreignkey')
+    op.drop_column('emails', 'account_id')
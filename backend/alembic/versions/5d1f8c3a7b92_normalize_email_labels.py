@@ -0,0 +1,85 @@
+"""Normalize email labels into a system label bitmask and email_labels
+
+Revision ID: 5d1f8c3a7b92
+Revises: 2b8d4f6e0a13
+Create Date: 2026-10-19 18:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1f8c3a7b92'
+down_revision: Union[str, None] = '2b8d4f6e0a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Snapshot of models.email_label.SYSTEM_LABEL_BITS
+SYSTEM_LABEL_BITS = {
+    'INBOX': 1 << 0,
+    'SENT': 1 << 1,
+    'DRAFT': 1 << 2,
+    'SPAM': 1 << 3,
+    'TRASH': 1 << 4,
+    'STARRED': 1 << 5,
+    'IMPORTANT': 1 << 6,
+    'UNREAD': 1 << 7,
+    'CHAT': 1 << 8,
+    'CATEGORY_PERSONAL': 1 << 9,
+    'CATEGORY_SOCIAL': 1 << 10,
+    'CATEGORY_PROMOTIONS': 1 << 11,
+    'CATEGORY_UPDATES': 1 << 12,
+    'CATEGORY_FORUMS': 1 << 13,
+}
+INDEXED_SYSTEM_LABELS = ('SENT', 'DRAFT', 'CATEGORY_PERSONAL', 'CATEGORY_SOCIAL',
+                         'CATEGORY_PROMOTIONS', 'CATEGORY_UPDATES', 'CATEGORY_FORUMS')
+
+
+def upgrade() -> None:
+    op.add_column('emails', sa.Column('system_labels', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('email_labels',
+    sa.Column('email_id', sa.Integer(), nullable=False),
+    sa.Column('label', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['email_id'], ['emails.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('email_id', 'label')
+    )
+    op.create_index('ix_email_labels_user_label', 'email_labels', ['user_id', 'label', 'email_id'], unique=False)
+
+    # Backfill from the JSON label arrays
+    bits = ', '.join(f"('{label}', {bit})" for label, bit in SYSTEM_LABEL_BITS.items())
+    op.execute(f"""
+        UPDATE emails SET system_labels = coalesce((
+            SELECT sum(DISTINCT bits.bit)::int
+            FROM json_array_elements_text(emails.labels) AS l(label)
+            JOIN (VALUES {bits}) AS bits(label, bit) ON bits.label = l.label
+        ), 0)
+        WHERE json_typeof(labels) = 'array'
+    """)
+    names = ', '.join(f"'{label}'" for label in SYSTEM_LABEL_BITS)
+    op.execute(f"""
+        INSERT INTO email_labels (email_id, label, user_id)
+        SELECT DISTINCT emails.id, l.label, emails.user_id
+        FROM emails, json_array_elements_text(emails.labels) AS l(label)
+        WHERE json_typeof(emails.labels) = 'array' AND l.label NOT IN ({names})
+    """)
+
+    for label in INDEXED_SYSTEM_LABELS:
+        op.create_index(f'ix_emails_user_label_{label.lower()}', 'emails', ['user_id', 'sent_at'], unique=False,
+                        postgresql_where=sa.text(f'(system_labels & {SYSTEM_LABEL_BITS[label]}) <> 0'))
+
+    # Superseded by the above
+    op.drop_index('ix_emails_labels', table_name='emails')
+
+
+def downgrade() -> None:
+    op.create_index('ix_emails_labels', 'emails', [sa.text('CAST(labels AS JSONB)')], unique=False, postgresql_using='gin')
+    for label in reversed(INDEXED_SYSTEM_LABELS):
+        op.drop_index(f'ix_emails_user_label_{label.lower()}', table_name='emails')
+    op.drop_index('ix_email_labels_user_label', table_name='email_labels')
+    op.drop_table('email_labels')
+    op.drop_column('emails', 'system_labels')
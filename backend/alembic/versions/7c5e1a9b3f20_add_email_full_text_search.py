@@ -0,0 +1,120 @@
+"""Add full-text search vector and trigram indexes to emails
+
+Revision ID: 7c5e1a9b3f20
+Revises: 9f2d6a4c1e37
+Create Date: 2026-10-19 15:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from html.parser import HTMLParser
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c5e1a9b3f20'
+down_revision: Union[str, None] = '9f2d6a4c1e37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Defaults of services/email_search.py when this revision was written
+SEARCH_CONFIG = 'english'
+SEARCH_BODY_MAX_CHARS = 100000
+
+
+# Frozen copy of services/text_extraction.py's html_to_text, so the backfill
+# doesn't change with the application code
+SKIPPED_TAGS = {"script", "style", "head", "title", "noscript"}
+BLOCK_TAGS = {"br", "p", "div", "td", "th", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6", "table", "blockquote"}
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    if not html:
+        return ""
+    extractor = _TextExtractor()
+    try:
+        extractor.feed(html)
+        extractor.close()
+    except Exception:
+        pass
+    return " ".join("".join(extractor.parts).split())
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.add_column('emails', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+
+    # Backfill existing rows as ingest (services/email_search.py) indexed
+    # them at this revision: the body is body_text, or for HTML-only mail (stored with
+    # body_text "") the visible text of body_html. Rows with a text body are
+    # done in SQL.
+    op.execute(f"""
+        UPDATE emails SET search_vector =
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(subject, '')), 'A') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(from_address, '')), 'B') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(snippet, '')), 'C') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}', left(coalesce(body_text, ''), {SEARCH_BODY_MAX_CHARS})), 'D')
+        WHERE nullif(body_text, '') IS NOT NULL OR nullif(body_html, '') IS NULL
+    """)
+
+    # HTML-only rows need html_to_text, which drops <style>/<script> content
+    # a regex would keep
+    connection = op.get_bind()
+    reindex = sa.text(f"""
+        UPDATE emails SET search_vector =
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(subject, '')), 'A') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(from_address, '')), 'B') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(snippet, '')), 'C') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}', :body), 'D')
+        WHERE id = :id
+    """)
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.text("""
+            SELECT id, body_html FROM emails
+            WHERE id > :last_id AND nullif(body_text, '') IS NULL AND nullif(body_html, '') IS NOT NULL
+            ORDER BY id LIMIT 500
+        """), {"last_id": last_id}).all()
+        if not rows:
+            break
+        connection.execute(reindex, [
+            {"id": email_id, "body": html_to_text(body_html)[:SEARCH_BODY_MAX_CHARS]} for email_id, body_html in rows
+        ])
+        last_id = rows[-1][0]
+
+    op.create_index('ix_emails_search_vector', 'emails', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_emails_from_address_trgm', 'emails', ['from_address'], unique=False, postgresql_using='gin', postgresql_ops={'from_address': 'gin_trgm_ops'})
+    op.create_index('ix_emails_subject_trgm', 'emails', ['subject'], unique=False, postgresql_using='gin', postgresql_ops={'subject': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_emails_subject_trgm', table_name='emails')
+    op.drop_index('ix_emails_from_address_trgm', table_name='emails')
+    op.drop_index('ix_emails_search_vector', table_name='emails')
+    op.drop_column('emails', 'search_vector')
@@ -0,0 +1,59 @@
+"""Add mailbox_counters
+
+Revision ID: 8a3c6e2f9d41
+Revises: 5d1f8c3a7b92
+Create Date: 2026-10-19 19:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a3c6e2f9d41'
+down_revision: Union[str, None] = '5d1f8c3a7b92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('mailbox_counters',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('unread', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('inbox', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('important', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('starred', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('sent', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('personal', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updates', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('promotions', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+    # Backfill; bits as in models.email_label.SYSTEM_LABEL_BITS
+    op.execute("""
+        INSERT INTO mailbox_counters (user_id, total, unread, inbox, important, starred, sent, personal, updates, promotions)
+        SELECT
+            user_id,
+            count(*),
+            count(*) FILTER (WHERE NOT is_read),
+            count(*) FILTER (WHERE (system_labels & 1) <> 0),
+            count(*) FILTER (WHERE is_important),
+            count(*) FILTER (WHERE is_starred),
+            count(*) FILTER (WHERE (system_labels & 2) <> 0),
+            count(*) FILTER (WHERE (system_labels & 512) <> 0),
+            count(*) FILTER (WHERE (system_labels & 4096) <> 0),
+            count(*) FILTER (WHERE (system_labels & 2048) <> 0)
+        FROM emails
+        WHERE NOT is_trash
+        GROUP BY user_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('mailbox_counters')
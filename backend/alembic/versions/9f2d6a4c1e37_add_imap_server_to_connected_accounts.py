@@ -0,0 +1,28 @@
+"""Add IMAP server settings to connected_accounts
+
+Revision ID: 9f2d6a4c1e37
+Revises: 4e7b2c19a8d5
+Create Date: 2026-10-19 11:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f2d6a4c1e37'
+down_revision: Union[str, None] = '4e7b2c19a8d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('connected_accounts', sa.Column('imap_host', sa.String(), nullable=True))
+    op.add_column('connected_accounts', sa.Column('imap_port', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('connected_accounts', 'imap_port')
+    op.drop_column('connected_accounts', 'imap_host')
@@ -0,0 +1,33 @@
+"""Add keyset listing index on emails and make sent_at required
+
+Revision ID: b6e0d2a4f815
+Revises: 8a3c6e2f9d41
+Create Date: 2026-10-19 20:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6e0d2a4f815'
+down_revision: Union[str, None] = '8a3c6e2f9d41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Keyset pagination orders by (sent_at, id), so undated messages get their arrival time
+    op.execute("UPDATE emails SET sent_at = coalesce(received_at, created_at, now()) WHERE sent_at IS NULL")
+    op.alter_column('emails', 'sent_at', existing_type=sa.DateTime(), nullable=False)
+
+    op.create_index('ix_emails_user_listing', 'emails', ['user_id', 'is_trash', sa.text('sent_at DESC'), sa.text('id DESC')], unique=False)
+    op.drop_index('ix_emails_user_sent_at', table_name='emails')
+
+
+def downgrade() -> None:
+    op.create_index('ix_emails_user_sent_at', 'emails', ['user_id', 'sent_at'], unique=False)
+    op.drop_index('ix_emails_user_listing', table_name='emails')
+    op.alter_column('emails', 'sent_at', existing_type=sa.DateTime(), nullable=True)
@@ -0,0 +1,26 @@
+"""Add body_truncated flag to emails
+
+Revision ID: c3a91f0d2b64
+Revises: bd4efb12f8e7
+Create Date: 2026-10-19 09:12:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3a91f0d2b64'
+down_revision: Union[str, None] = 'bd4efb12f8e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('emails', sa.Column('body_truncated', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('emails', 'body_truncated')
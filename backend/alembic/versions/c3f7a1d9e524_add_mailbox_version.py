@@ -0,0 +1,26 @@
+"""Add version to mailbox_counters
+
+Revision ID: c3f7a1d9e524
+Revises: b6e0d2a4f815
+Create Date: 2026-10-19 21:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f7a1d9e524'
+down_revision: Union[str, None] = 'b6e0d2a4f815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('mailbox_counters', sa.Column('version', sa.BigInteger(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('mailbox_counters', 'version')
@@ -0,0 +1,38 @@
+"""Add email_changes log
+
+Revision ID: d8b2e5f1a706
+Revises: c3f7a1d9e524
+Create Date: 2026-10-19 21:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8b2e5f1a706'
+down_revision: Union[str, None] = 'c3f7a1d9e524'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('email_changes',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('email_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(length=10), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'version', 'email_id')
+    )
+    # Nothing before this migration was logged: clients start from the current version
+    op.add_column('mailbox_counters', sa.Column('changes_start', sa.BigInteger(), server_default='0', nullable=False))
+    op.execute("UPDATE mailbox_counters SET changes_start = version")
+
+
+def downgrade() -> None:
+    op.drop_column('mailbox_counters', 'changes_start')
+    op.drop_table('email_changes')
@@ -0,0 +1,44 @@
+"""Add gmail_outbox for write-behind label changes
+
+Revision ID: e4a9c7b3f158
+Revises: d8b2e5f1a706
+Create Date: 2026-10-19 23:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a9c7b3f158'
+down_revision: Union[str, None] = 'd8b2e5f1a706'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('gmail_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('account_id', sa.Integer(), nullable=True),
+    sa.Column('gmail_id', sa.String(), nullable=False),
+    sa.Column('add_labels', sa.JSON(), nullable=False),
+    sa.Column('remove_labels', sa.JSON(), nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['account_id'], ['connected_accounts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_gmail_outbox_next_attempt_at', 'gmail_outbox', ['next_attempt_at'], unique=False)
+    op.create_index('ix_gmail_outbox_user_id', 'gmail_outbox', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_gmail_outbox_user_id', table_name='gmail_outbox')
+    op.drop_index('ix_gmail_outbox_next_attempt_at', table_name='gmail_outbox')
+    op.drop_table('gmail_outbox')
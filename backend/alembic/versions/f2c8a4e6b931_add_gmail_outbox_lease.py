@@ -0,0 +1,26 @@
+"""Add a flush lease to gmail_outbox entries
+
+Revision ID: f2c8a4e6b931
+Revises: e4a9c7b3f158
+Create Date: 2026-10-20 10:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c8a4e6b931'
+down_revision: Union[str, None] = 'e4a9c7b3f158'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('gmail_outbox', sa.Column('leased_until', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('gmail_outbox', 'leased_until')
@@ -1,13 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from database.connection import get_db
 from schemas.auth import GoogleAuthRequest, TokenResponse
 from services.auth_service import AuthService
-from services.auth_middleware import create_access_token, get_user_from_google_token, get_current_user
+from services.auth_middleware import create_access_token, get_user_from_google_token, get_current_user, fetch_google_userinfo
 from models.user import User
 from models.sync_state import SyncState
-import httpx
+from services.token_broker import invalidate_cached_token
+from services.http_client import get_http_client
 import os
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -33,7 +34,7 @@ class UserResponse(BaseModel):
 @router.post("/google", response_model=TokenResponse)
 async def google_auth(
     auth_request: GoogleAuthRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Exchange Google OAuth code for access token and create/update user
@@ -59,8 +60,7 @@ async def google_auth(
             "redirect_uri": auth_request.redirect_uri or "http://localhost:3000/auth/callback",
         }
 
-        async with httpx.AsyncClient() as client:
-            token_response = await client.post(token_url, data=token_data)
+        token_response = await get_http_client().post(token_url, data=token_data)
 
         if token_response.status_code != 200:
             raise HTTPException(
@@ -79,19 +79,14 @@ async def google_auth(
             )
 
         # Get user info from Google
-        user_info_url = f"https://www.googleapis.com/oauth2/v2/userinfo?access_token={access_token}"
+        user_info = await fetch_google_userinfo(access_token)
 
-        async with httpx.AsyncClient() as client:
-            user_response = await client.get(user_info_url)
-
-        if user_response.status_code != 200:
+        if user_info is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Failed to get user information"
             )
 
-        user_info = user_response.json()
-
         # Create or update user in database
         auth_service = AuthService(db)
         user = await auth_service.create_or_update_user(
@@ -130,7 +125,7 @@ async def google_auth(
 async def google_token_auth(
     request: GoogleTokenRequest,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Authenticate user with Google access token (for multi-user support)
@@ -138,7 +133,7 @@ async def google_token_auth(
     """
     try:
         # Get or create user from Google token
-        user, is_new_user = get_user_from_google_token(request.google_access_token, db, request.google_refresh_token)
+        user, is_new_user = await get_user_from_google_token(request.google_access_token, db, request.google_refresh_token)
 
         # Create JWT token for our backend
         access_token = create_access_token(user.id)
@@ -151,7 +146,7 @@ async def google_token_auth(
                 total_emails_synced=0
             )
             db.add(sync_state)
-            db.commit()
+            await db.commit()
 
             # Schedule background email sync for new user
             background_tasks.add_task(sync_user_emails_background, user.id, request.google_access_token)
@@ -211,9 +206,11 @@ def sync_user_emails_background(user_id: int, google_token: str):
             if user:
                 user.google_access_token = google_token
                 db.commit()
+                invalidate_cached_token("user", user.id)
 
                 # Import sync worker
                 from sync_worker import GmailSyncWorker
+                from services.http_client import close_http_client
                 import asyncio
 
                 # Run sync worker for this user
@@ -221,6 +218,9 @@ def sync_user_emails_background(user_id: int, google_token: str):
                 loop = asyncio.new_event_loop()
                 asyncio.set_event_loop(loop)
                 loop.run_until_complete(worker.sync_user_emails(user))
+                loop.run_until_complete(close_http_client())
+                loop.close()
+                worker.close()
 
                 print(f"✅ Background sync completed for user {user.email}")
 
@@ -1,21 +1,28 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, timedelta
 from database.connection import get_db
-from models.user import User
 from models.connected_account import ConnectedAccount
-from services.auth_middleware import get_current_user
-import httpx
+from services.auth_middleware import get_current_principal, Principal, fetch_google_userinfo
+from services.http_client import get_http_client
+from services.imap_provider import ImapConnection, IMAP_PORTS, ALLOW_PRIVATE_HOSTS
+from services.credential_cipher import encrypt_credential, CredentialError
+from services.token_broker import get_token_broker, invalidate_cached_token, TokenRefreshError
 
 router = APIRouter(prefix="/connected-accounts", tags=["connected_accounts"])
 
 class ConnectedAccountCreate(BaseModel):
-    provider: str  # 'gmail' or 'outlook'
-    access_token: str
+    provider: str  # 'gmail', 'outlook' or 'imap'
+    access_token: str  # IMAP: the account password (stored encrypted)
     refresh_token: Optional[str] = None
     expires_in: Optional[int] = None
+    # IMAP only
+    email: Optional[str] = None
+    imap_host: Optional[str] = None
+    imap_port: Optional[int] = 993
 
 class ConnectedAccountResponse(BaseModel):
     id: int
@@ -31,56 +38,83 @@ class ConnectedAccountResponse(BaseModel):
 
 @router.get("", response_model=List[ConnectedAccountResponse])
 async def get_connected_accounts(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """Get all connected accounts for the current user"""
-    accounts = db.query(ConnectedAccount).filter(
+    result = await db.scalars(select(ConnectedAccount).filter(
         ConnectedAccount.user_id == current_user.id,
         ConnectedAccount.is_active == True
-    ).all()
+    ))
 
-    return accounts
+    return result.all()
 
 @router.post("", response_model=ConnectedAccountResponse)
 async def add_connected_account(
     account_data: ConnectedAccountCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """Add a new connected account for the current user"""
     try:
         # Get account email from provider's API
         email = None
         display_name = None
+        # What's stored in access_token (the IMAP password is encrypted)
+        stored_token = account_data.access_token
 
         if account_data.provider in ['gmail', 'google']:
             # Get Google user info
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    "https://www.googleapis.com/oauth2/v2/userinfo",
-                    headers={"Authorization": f"Bearer {account_data.access_token}"}
-                )
-                if response.status_code == 200:
-                    user_info = response.json()
-                    email = user_info.get("email")
-                    display_name = user_info.get("name")
-                else:
-                    raise HTTPException(status_code=400, detail="Invalid Google access token")
+            user_info = await fetch_google_userinfo(account_data.access_token)
+            if user_info is not None:
+                email = user_info.get("email")
+                display_name = user_info.get("name")
+            else:
+                raise HTTPException(status_code=400, detail="Invalid Google access token")
 
         elif account_data.provider in ['outlook', 'azure-ad']:
             # Get Microsoft user info
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    "https://graph.microsoft.com/v1.0/me",
-                    headers={"Authorization": f"Bearer {account_data.access_token}"}
+            response = await get_http_client().get(
+                "https://graph.microsoft.com/v1.0/me",
+                headers={"Authorization": f"Bearer {account_data.access_token}"}
+            )
+            if response.status_code == 200:
+                user_info = response.json()
+                email = user_info.get("mail") or user_info.get("userPrincipalName")
+                display_name = user_info.get("displayName")
+            else:
+                raise HTTPException(status_code=400, detail="Invalid Microsoft access token")
+
+        elif account_data.provider == 'imap':
+            if not account_data.email or not account_data.imap_host:
+                raise HTTPException(status_code=400, detail="IMAP accounts need email and imap_host")
+
+            try:
+                stored_token = encrypt_credential(account_data.access_token)
+            except CredentialError:
+                raise HTTPException(status_code=503, detail="IMAP accounts aren't enabled on this server")
+
+            imap_port = account_data.imap_port or 993
+            if imap_port not in IMAP_PORTS and not ALLOW_PRIVATE_HOSTS:
+                raise HTTPException(status_code=400, detail="IMAP port must be 993 or 143")
+
+            # Check the credentials with a real login. Every failure gets the same
+            # answer so the endpoint can't be used to probe hosts and ports
+            connection = ImapConnection(account_data.imap_host, imap_port, use_ssl=imap_port != 143)
+            try:
+                await connection.connect()
+                await connection.login(account_data.email, account_data.access_token)
+            except Exception as e:
+                print(f"⚠️  IMAP login check for {account_data.imap_host}:{imap_port} failed: {str(e)}")
+                raise HTTPException(
+                    status_code=400,
+                    detail="Could not log in to the IMAP server (it must be reachable on port 993, or 143 with STARTTLS)"
                 )
-                if response.status_code == 200:
-                    user_info = response.json()
-                    email = user_info.get("mail") or user_info.get("userPrincipalName")
-                    display_name = user_info.get("displayName")
-                else:
-                    raise HTTPException(status_code=400, detail="Invalid Microsoft access token")
+            finally:
+                await connection.logout()
+
+            email = account_data.email
+            display_name = account_data.email
         else:
             raise HTTPException(status_code=400, detail=f"Unsupported provider: {account_data.provider}")
 
@@ -88,21 +122,25 @@ async def add_connected_account(
             raise HTTPException(status_code=400, detail="Could not retrieve email from provider")
 
         # Check if this account already exists for this user
-        existing = db.query(ConnectedAccount).filter(
+        existing = await db.scalar(select(ConnectedAccount).filter(
             ConnectedAccount.user_id == current_user.id,
             ConnectedAccount.provider == account_data.provider,
             ConnectedAccount.email == email
-        ).first()
+        ))
 
         if existing:
             # Update existing account tokens
-            existing.access_token = account_data.access_token
+            existing.access_token = stored_token
             existing.refresh_token = account_data.refresh_token or existing.refresh_token
             existing.is_active = True
+            if account_data.provider == 'imap':
+                existing.imap_host = account_data.imap_host
+                existing.imap_port = account_data.imap_port
             if account_data.expires_in:
                 existing.token_expires_at = datetime.utcnow() + timedelta(seconds=account_data.expires_in)
-            db.commit()
-            db.refresh(existing)
+            await db.commit()
+            await db.refresh(existing)
+            invalidate_cached_token("account", existing.id)
             return existing
 
         # Calculate token expiration
@@ -111,9 +149,9 @@ async def add_connected_account(
             token_expires_at = datetime.utcnow() + timedelta(seconds=account_data.expires_in)
 
         # Check if user has any accounts - if not, make this primary
-        existing_accounts = db.query(ConnectedAccount).filter(
+        existing_accounts = await db.scalar(select(func.count(ConnectedAccount.id)).filter(
             ConnectedAccount.user_id == current_user.id
-        ).count()
+        ))
         is_primary = existing_accounts == 0
 
         # Create new connected account
@@ -122,76 +160,86 @@ async def add_connected_account(
             provider=account_data.provider,
             email=email,
             display_name=display_name,
-            access_token=account_data.access_token,
+            access_token=stored_token,
             refresh_token=account_data.refresh_token,
             token_expires_at=token_expires_at,
+            imap_host=account_data.imap_host if account_data.provider == 'imap' else None,
+            imap_port=account_data.imap_port if account_data.provider == 'imap' else None,
             is_active=True,
             is_primary=is_primary
         )
 
         db.add(new_account)
-        db.commit()
-        db.refresh(new_account)
+        await db.commit()
+        await db.refresh(new_account)
 
         return new_account
 
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to add connected account: {str(e)}")
 
 @router.delete("/{account_id}")
 async def remove_connected_account(
     account_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """Remove a connected account"""
-    account = db.query(ConnectedAccount).filter(
+    account = await db.scalar(select(ConnectedAccount).filter(
         ConnectedAccount.id == account_id,
         ConnectedAccount.user_id == current_user.id
-    ).first()
+    ))
 
     if not account:
         raise HTTPException(status_code=404, detail="Connected account not found")
 
     # Don't allow removing the last account
-    remaining_accounts = db.query(ConnectedAccount).filter(
+    remaining_accounts = await db.scalar(select(func.count(ConnectedAccount.id)).filter(
         ConnectedAccount.user_id == current_user.id,
         ConnectedAccount.id != account_id,
         ConnectedAccount.is_active == True
-    ).count()
+    ))
 
     if remaining_accounts == 0:
         raise HTTPException(status_code=400, detail="Cannot remove the last connected account")
 
     # Soft delete (mark as inactive)
     account.is_active = False
-    db.commit()
+    invalidate_cached_token("account", account.id)
+    await db.commit()
 
     return {"success": True, "message": "Account disconnected successfully"}
 
 @router.get("/{account_id}/token")
 async def get_account_token(
     account_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """Get access token for a specific connected account"""
-    account = db.query(ConnectedAccount).filter(
+    account = await db.scalar(select(ConnectedAccount).filter(
         ConnectedAccount.id == account_id,
         ConnectedAccount.user_id == current_user.id,
         ConnectedAccount.is_active == True
-    ).first()
+    ))
 
     if not account:
         raise HTTPException(status_code=404, detail="Connected account not found")
 
-    # TODO: Check if token is expired and refresh if needed
+    # IMAP accounts store a password, never hand it out
+    if account.provider == 'imap':
+        raise HTTPException(status_code=400, detail="IMAP accounts have no access token")
+
+    try:
+        access_token = await get_token_broker().get_account_token(account.id)
+    except TokenRefreshError as e:
+        raise HTTPException(status_code=502, detail=f"Failed to refresh account token: {str(e)}")
 
     return {
-        "access_token": account.access_token,
+        "access_token": access_token,
         "provider": account.provider,
         "email": account.email
     }
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.connection import get_db
 from services.auth_service import AuthService
-import httpx
+from services.auth_middleware import fetch_google_userinfo
 import os
 from pydantic import BaseModel
 
@@ -14,7 +14,7 @@ class GoogleTokenRequest(BaseModel):
 @router.post("/google-token")
 async def auth_with_google_token(
     token_request: GoogleTokenRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Accept a Google access token directly and create/update user
@@ -23,19 +23,14 @@ async def auth_with_google_token(
         access_token = token_request.access_token
 
         # Get user info from Google
-        user_info_url = f"https://www.googleapis.com/oauth2/v2/userinfo?access_token={access_token}"
+        user_info = await fetch_google_userinfo(access_token)
 
-        async with httpx.AsyncClient() as client:
-            user_response = await client.get(user_info_url)
-
-        if user_response.status_code != 200:
+        if user_info is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid Google access token"
             )
 
-        user_info = user_response.json()
-
         # Create or update user in database
         auth_service = AuthService(db)
         user = await auth_service.create_or_update_user(
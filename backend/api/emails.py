@@ -1,14 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks
-from sqlalchemy.orm import Session
-from database.connection import get_db
-from schemas.email import EmailResponse, EmailList, EmailSend
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, BackgroundTasks, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+from database.connection import get_db, SessionLocal
+from schemas.email import EmailResponse, EmailList, EmailChangeSet, EmailSend, SUMMARY_FIELDS, LIST_FIELDS
 from services.email_service import EmailService
-from services.auth_middleware import get_current_user
+from services.mailbox_counters import counts_response
+from services.auth_middleware import get_current_principal, get_stream_principal, get_read_db, Principal
 from models.user import User
 from models.email import Email
+from models.mailbox_counter import MailboxCounter
 from sync_worker import GmailSyncWorker
-from typing import Optional
-from pydantic import BaseModel
+from services.http_client import close_http_client
+from services.pagination import InvalidCursor
+from services.serialization import fast_response, rows_to_dicts, wants_msgpack
+from services.conditional import mailbox_version, known_mailbox_version, mailbox_etag, etag_matches, cache_headers, not_modified
+from services.search_query import compile_search
+from services.mailbox_events import get_event_hub, counts_event
+from typing import List, Optional, Literal
+from pydantic import BaseModel, Field
 import asyncio
 
 router = APIRouter(prefix="/emails", tags=["emails"])
@@ -19,50 +29,60 @@ class MarkReadRequest(BaseModel):
 class StarRequest(BaseModel):
     is_starred: bool = True
 
+# Emails per bulk action by ID; larger selections go by filter
+BULK_MAX_IDS = 1000
+
+class BulkFilter(BaseModel):
+    """The filters of GET /emails/"""
+    search: Optional[str] = None
+    label: Optional[str] = None
+    is_read: Optional[bool] = None
+    is_starred: Optional[bool] = None
+    account_id: Optional[int] = None
+
+class BulkActionRequest(BaseModel):
+    action: Literal["read", "unread", "star", "unstar", "archive", "trash"]
+    ids: Optional[List[int]] = Field(None, max_length=BULK_MAX_IDS)
+    filter: Optional[BulkFilter] = None
+
+def selected_fields(fields: Optional[str]) -> list:
+    """Summary fields named by a fields= parameter (default SUMMARY_FIELDS)"""
+    if not fields:
+        return SUMMARY_FIELDS
+    selected = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in selected if field not in LIST_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)} (bodies are only returned by GET /emails/{{email_id}})"
+        )
+    return selected
+
 @router.get("/email-counts")
 async def get_email_counts(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get email counts by filter categories for the current user
+
+    Carries an ETag; If-None-Match gets 304 until the mailbox changes
     """
     try:
-        from sqlalchemy import func, and_, String
+        known = known_mailbox_version(current_user.id)
+        if known is not None and etag_matches(request, mailbox_etag(current_user.id, known)):
+            return not_modified(mailbox_etag(current_user.id, known))
 
-        # Base query for user's non-trash emails
-        base_query = db.query(Email).filter(
-            Email.user_id == current_user.id,
-            Email.is_trash == False
-        )
+        # Maintained incrementally by every email write (services/mailbox_counters.py)
+        counter = await db.get(MailboxCounter, current_user.id)
+        etag = mailbox_etag(current_user.id, counter.version if counter else 0)
+        if etag_matches(request, etag):
+            return not_modified(etag)
 
-        # All emails count
-        all_count = base_query.count()
-
-        # Unread emails count
-        unread_count = base_query.filter(Email.is_read == False).count()
-
-        # Count emails by label using text search on JSON string
-        inbox_count = base_query.filter(func.cast(Email.labels, String).like('%"INBOX"%')).count()
-        important_count = base_query.filter(func.cast(Email.labels, String).like('%"IMPORTANT"%')).count()
-        # Use is_starred field instead of label search for better performance
-        starred_count = base_query.filter(Email.is_starred == True).count()
-        sent_count = base_query.filter(func.cast(Email.labels, String).like('%"SENT"%')).count()
-        personal_count = base_query.filter(func.cast(Email.labels, String).like('%"CATEGORY_PERSONAL"%')).count()
-        updates_count = base_query.filter(func.cast(Email.labels, String).like('%"CATEGORY_UPDATES"%')).count()
-        promotions_count = base_query.filter(func.cast(Email.labels, String).like('%"CATEGORY_PROMOTIONS"%')).count()
-
-        return {
-            "all": all_count,
-            "unread": unread_count,
-            "inbox": inbox_count,
-            "important": important_count,
-            "starred": starred_count,
-            "sent": sent_count,
-            "personal": personal_count,
-            "updates": updates_count,
-            "promotions": promotions_count
-        }
+        response.headers.update(cache_headers(etag))
+        return counts_response(counter)
 
     except Exception as e:
         raise HTTPException(
@@ -70,44 +90,165 @@ async def get_email_counts(
             detail=f"Failed to get email counts: {str(e)}"
         )
 
-@router.get("/", response_model=EmailList)
+@router.get("/", response_model=EmailList, response_model_exclude_unset=True)
 async def get_emails(
+    request: Request,
     page: int = Query(1, ge=1),
     per_page: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    count: Literal["exact", "estimate", "none"] = "exact",
+    fields: Optional[str] = None,
     search: Optional[str] = None,
     label: Optional[str] = None,
     is_read: Optional[bool] = None,
     is_starred: Optional[bool] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    account_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
-    Get paginated list of emails for the current user
+    Get paginated list of emails for the current user, optionally for one connected account
+
+    Pass next_cursor from the previous response as cursor to get the next page (page
+    numbers still work but get slower the deeper they go). count=estimate or count=none
+    skips the exact total for listings that no mailbox counter covers.
+
+    Emails are summaries without bodies (use GET /emails/{email_id} for those);
+    fields=id,subject,... narrows or extends the summary fields returned. version is
+    where GET /emails/changes continues from.
+
+    search accepts Gmail-style operators (from:, subject:, after:, before:, older_than:,
+    newer_than:, is:, has:attachment, label:, in:) alongside free text
+
+    Responds with MessagePack instead of JSON when the request accepts application/msgpack.
+    Carries an ETag; If-None-Match gets 304 until the mailbox changes
     """
     email_service = EmailService(db)
+    selected = selected_fields(fields)
+
+    # Read before the listing: if a write lands in between, the page is newer than its
+    # version, and the next revalidation or delta sync just sees that write again.
+    # Relative date searches move with the clock, not the version, so they aren't revalidated
+    cacheable = not (search and compile_search(search).relative)
+    variant = "msgpack" if wants_msgpack(request) else None
+    known = known_mailbox_version(current_user.id)
+    if cacheable and known is not None and etag_matches(request, mailbox_etag(current_user.id, known, variant)):
+        return not_modified(mailbox_etag(current_user.id, known, variant))
+
+    version = await mailbox_version(db, current_user.id)
+    headers = {}
+    if cacheable:
+        etag = mailbox_etag(current_user.id, version, variant)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        headers = cache_headers(etag)
 
-    emails, total = await email_service.get_user_emails(
-        user_id=current_user.id,
-        page=page,
-        per_page=per_page,
-        search=search,
-        label=label,
-        is_read=is_read,
-        is_starred=is_starred
-    )
+    try:
+        result = await email_service.get_user_emails(
+            user_id=current_user.id,
+            page=page,
+            per_page=per_page,
+            search=search,
+            label=label,
+            is_read=is_read,
+            is_starred=is_starred,
+            account_id=account_id,
+            cursor=cursor,
+            count=count,
+            fields=selected
+        )
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    # Shaped as EmailList, but encoded straight from the row tuples (no per-row model validation)
+    return fast_response(request, {
+        "emails": rows_to_dicts(result.emails, selected),
+        "total": result.total,
+        "total_is_estimate": result.total_is_estimate,
+        "next_cursor": result.next_cursor,
+        "version": version,
+        "page": page,
+        "per_page": per_page
+    }, headers)
+
+@router.get("/changes", response_model=EmailChangeSet)
+async def get_email_changes(
+    request: Request,
+    since: int = Query(..., ge=0),
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Get the emails inserted, updated or deleted since a mailbox version
 
-    return EmailList(
-        emails=[EmailResponse.from_orm(email) for email in emails],
-        total=total,
-        page=page,
-        per_page=per_page
+    since is the version of a GET /emails/ response or of the previous changes
+    response; repeat with the returned version while has_more. Emails changed
+    several times are listed once, with their current fields (summary fields,
+    or those named by fields=). 410 means the changes are no longer available
+    and the mailbox should be reloaded.
+    """
+    email_service = EmailService(db)
+    selected = selected_fields(fields)
+
+    changes = await email_service.get_changes(current_user.id, since, selected)
+    if changes is None:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail=f"Changes since version {since} are not available; reload the mailbox"
+        )
+
+    return fast_response(request, {
+        "inserted": rows_to_dicts(changes.inserted, selected),
+        "updated": rows_to_dicts(changes.updated, selected),
+        "deleted": changes.deleted,
+        "version": changes.version,
+        "has_more": changes.has_more
+    })
+
+@router.get("/events")
+async def stream_email_events(
+    since: Optional[int] = Query(None, ge=0),
+    last_event_id: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_stream_principal)
+):
+    """
+    Server-sent events for the current user's mailbox (see services/mailbox_events.py)
+
+    Streams changes (new emails and flag changes, as GET /emails/changes would list
+    them) and counts as they are committed, starting after version since, the
+    Last-Event-ID of a reconnecting EventSource, or now. EventSource can't send an
+    Authorization header, so the JWT may be passed as token instead.
+    """
+    counter = await db.get(MailboxCounter, current_user.id)
+    # Streams stay open for hours; don't keep the request's session (and connection)
+    await db.close()
+
+    version = counter.version if counter else 0
+    if last_event_id and last_event_id.isdigit():
+        version = int(last_event_id)
+    elif since is not None:
+        version = since
+
+    hub = get_event_hub()
+    subscription = hub.subscribe(current_user.id, version)
+    subscription.push(counts_event(counter))
+
+    return StreamingResponse(
+        hub.stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 @router.get("/{email_id}", response_model=EmailResponse)
 async def get_email(
     email_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get a specific email by ID
@@ -129,14 +270,21 @@ async def get_email(
     if not email.is_read:
         await email_service.mark_as_read(email_id, current_user.id)
 
-    return EmailResponse.from_orm(email)
+    response = EmailResponse.from_orm(email)
+
+    # Oversized bodies are truncated in the database; serve the full copy
+    if email.body_truncated:
+        body_text, body_html = await email_service.get_full_body(email)
+        response = response.model_copy(update={"body_text": body_text, "body_html": body_html})
+
+    return response
 
 @router.post("/{email_id}/mark-read")
 async def mark_email_read(
     email_id: int,
     request: MarkReadRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Mark an email as read/unread
@@ -160,8 +308,8 @@ async def mark_email_read(
 async def star_email(
     email_id: int,
     request: StarRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Star/unstar an email and sync with Gmail
@@ -184,8 +332,8 @@ async def star_email(
 @router.delete("/{email_id}")
 async def delete_email(
     email_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Delete an email (move to trash)
@@ -205,8 +353,8 @@ async def delete_email(
 @router.post("/{email_id}/archive")
 async def archive_email(
     email_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Archive an email
@@ -223,11 +371,43 @@ async def archive_email(
 
     return {"message": "Email archived"}
 
+@router.post("/bulk")
+async def bulk_action(
+    request: BulkActionRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Mark read/unread, star/unstar, archive or trash many emails at once
+
+    Pass either ids or filter (the filters of GET /emails/, e.g. {"search": "from:news@example.com"},
+    trashed emails excluded unless the search says in:trash). Emails already in the requested
+    state are skipped; updated is the number changed. Emails are committed 1000 at a time, so an
+    error partway leaves the earlier ones changed and a retry picks up the rest. Gmail is
+    updated in the background
+    """
+    if (request.ids is None) == (request.filter is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Pass either ids or filter"
+        )
+
+    email_service = EmailService(db)
+
+    if request.ids is not None:
+        target = Email.id.in_(request.ids)
+    else:
+        query, _, _ = email_service.list_query(current_user.id, **request.filter.model_dump())
+        target = query.whereclause
+
+    updated, queued = await email_service.bulk_update(current_user.id, request.action, target)
+    return {"action": request.action, "updated": updated, "gmail_queued": queued}
+
 @router.post("/send")
 async def send_email(
     email_data: EmailSend,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Send a new email
@@ -256,15 +436,14 @@ async def send_email(
 @router.post("/sync")
 async def sync_emails(
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
-    Trigger a manual sync of emails from Gmail for the current user
+    Trigger a manual sync of emails for the current user and all their connected accounts
     """
     try:
         # Add sync task to background tasks
-        background_tasks.add_task(sync_user_emails_task, current_user.id, db)
+        background_tasks.add_task(sync_user_emails_task, current_user.id)
 
         return {
             "message": "Email sync started",
@@ -279,35 +458,33 @@ async def sync_emails(
 
 @router.get("/debug/counts")
 async def get_email_counts_debug(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Debug endpoint to show email counts for current user
     """
     try:
-        from sqlalchemy import func
-
         # Total emails
-        total_emails = db.query(Email).filter(Email.user_id == current_user.id).count()
+        total_emails = await db.scalar(select(func.count(Email.id)).filter(Email.user_id == current_user.id))
 
         # Non-trash emails
-        non_trash_emails = db.query(Email).filter(
+        non_trash_emails = await db.scalar(select(func.count(Email.id)).filter(
             Email.user_id == current_user.id,
             Email.is_trash == False
-        ).count()
+        ))
 
         # Unread emails
-        unread_emails = db.query(Email).filter(
+        unread_emails = await db.scalar(select(func.count(Email.id)).filter(
             Email.user_id == current_user.id,
             Email.is_read == False
-        ).count()
+        ))
 
         # Recent emails (last 10)
-        recent_emails = db.query(Email).filter(
+        recent_emails = (await db.scalars(select(Email).filter(
             Email.user_id == current_user.id,
             Email.is_trash == False
-        ).order_by(Email.sent_at.desc()).limit(10).all()
+        ).order_by(Email.sent_at.desc()).limit(10))).all()
 
         recent_list = []
         for email in recent_emails:
@@ -336,8 +513,10 @@ async def get_email_counts_debug(
             detail=f"Failed to get email counts: {str(e)}"
         )
 
-def sync_user_emails_task(user_id: int, db: Session):
+def sync_user_emails_task(user_id: int):
     """Background task to sync emails for a user"""
+    # Runs in a worker thread with the sync engine, like the sync worker
+    db = SessionLocal()
     try:
         print(f"🔄 Starting manual email sync for user {user_id}")
 
@@ -353,8 +532,10 @@ def sync_user_emails_task(user_id: int, db: Session):
         # Run the async sync in a new event loop
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        loop.run_until_complete(sync_worker.sync_user_emails(user))
+        loop.run_until_complete(sync_worker.sync_user_all_accounts(user))
+        loop.run_until_complete(close_http_client())
         loop.close()
+        sync_worker.close()
 
         print(f"✅ Manual email sync completed for {user.email}")
 
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from typing import Optional
+from database.instrumentation import db_stats, LONG_HOLD_SECONDS
+import hmac
+import os
+
+router = APIRouter(prefix="/internal", tags=["internal"])
+
+# Internal endpoints require a matching X-Internal-Token header; without a
+# configured token they don't exist
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+
+def require_internal_token(x_internal_token: Optional[str] = Header(None)):
+    if not INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_internal_token or not hmac.compare_digest(x_internal_token.encode(), INTERNAL_API_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@router.get("/db-stats", dependencies=[Depends(require_internal_token)])
+def get_db_stats():
+    """Connection pool saturation, checkout waits and hold times per engine role"""
+    return {
+        "long_hold_threshold_seconds": LONG_HOLD_SECONDS,
+        "pools": db_stats()
+    }
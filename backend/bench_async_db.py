@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark: sync Session vs AsyncSession under concurrent load
+
+Runs the email list query (page of emails + total count, as GET /emails does)
+from many concurrent coroutines on one event loop, the way uvicorn serves
+requests:
+  * before: the old pattern, a blocking Session inside an async handler
+  * after:  AsyncSession (asyncpg) via EmailService
+Reports p50/p95/p99 latency, throughput and the worst event loop stall.
+
+Needs a populated PostgreSQL database (DATABASE_URL). Settings:
+  BENCH_USER_ID       user whose mailbox is queried (default 1)
+  BENCH_CONCURRENCY   concurrent in-flight requests (default 50)
+  BENCH_REQUESTS      requests per run (default 2000)
+"""
+
+import asyncio
+import os
+import statistics
+import time
+from sqlalchemy import desc
+from database.connection import SessionLocal, AsyncSessionLocal, engine, async_engine
+from models.email import Email
+from services.email_service import EmailService
+
+USER_ID = int(os.getenv("BENCH_USER_ID", "1"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "50"))
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "2000"))
+PER_PAGE = 50
+
+
+async def sync_session_request():
+    """The pre-async handler: blocking queries on the event loop"""
+    db = SessionLocal()
+    try:
+        query = db.query(Email).filter(Email.user_id == USER_ID, Email.is_trash == False)
+        query.count()
+        query.order_by(desc(Email.sent_at)).limit(PER_PAGE).all()
+    finally:
+        db.close()
+
+
+async def async_session_request():
+    """The current handler: AsyncSession through EmailService"""
+    async with AsyncSessionLocal() as db:
+        await EmailService(db).get_user_emails(user_id=USER_ID, per_page=PER_PAGE)
+
+
+async def measure_loop_lag(stop: asyncio.Event, lags: list):
+    """Record how late a 10ms timer fires; large values mean a blocked loop"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - start - 0.01)
+
+
+async def run(name: str, request):
+    # Warm up pools and (for asyncpg) the prepared statement cache
+    await asyncio.gather(*[request() for _ in range(CONCURRENCY)])
+
+    latencies = []
+    remaining = REQUESTS
+    lags = []
+    stop = asyncio.Event()
+    lag_task = asyncio.ensure_future(measure_loop_lag(stop, lags))
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await request()
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(CONCURRENCY)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"📊 {name}")
+    print(f"   • p50: {quantiles[49] * 1000:.1f} ms")
+    print(f"   • p95: {quantiles[94] * 1000:.1f} ms")
+    print(f"   • p99: {quantiles[98] * 1000:.1f} ms")
+    print(f"   • throughput: {len(latencies) / elapsed:.0f} req/s")
+    print(f"   • worst event loop stall: {max(lags, default=0) * 1000:.1f} ms")
+    return quantiles[98]
+
+
+async def main():
+    print("🧪 Benchmarking database sessions under concurrent load")
+    print(f"   user {USER_ID}, {CONCURRENCY} concurrent, {REQUESTS} requests per run")
+    print("=" * 50)
+
+    try:
+        before = await run("Sync Session in async handler (before)", sync_session_request)
+        after = await run("AsyncSession + asyncpg (after)", async_session_request)
+        print(f"\n✅ p99 {before * 1000:.1f} ms → {after * 1000:.1f} ms")
+    finally:
+        engine.dispose()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark: encoding a page of the email list response
+
+Encodes the same synthetic 100-row page (no database needed) three ways:
+  * before:  an EmailResponse.from_orm per row, pydantic datetime serializers
+             (pytz) and the standard json encoder, as GET /emails used to
+  * after:   row tuples zipped into dicts and encoded by orjson
+             (services/serialization.py)
+  * msgpack: the same dicts as MessagePack
+Reports the time per page and rows encoded per second.
+
+Settings:
+  BENCH_ROWS        rows per page (default 100)
+  BENCH_ITERATIONS  pages encoded per run (default 2000)
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from fastapi.encoders import jsonable_encoder
+from schemas.email import EmailResponse, SUMMARY_FIELDS
+from services.serialization import FastJSONResponse, MsgPackResponse, rows_to_dicts
+
+ROWS = int(os.getenv("BENCH_ROWS", "100"))
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "2000"))
+
+
+def make_rows():
+    """One page of listing rows, as the tuples EmailService returns for SUMMARY_FIELDS"""
+    sent = datetime(2025, 6, 1, 12, 0, 0)
+    rows = []
+    for i in range(ROWS):
+        values = {
+            "id": 100000 + i,
+            "gmail_id": f"18c{i:013x}",
+            "thread_id": f"18c{i // 3:013x}",
+            "account_id": 1,
+            "subject": f"Quarterly planning follow-up #{i}",
+            "from_address": f"sender{i % 17}@example.com",
+            "to_addresses": ["me@example.com", "team@example.com"],
+            "snippet": "Thanks everyone for joining today. Attached are the notes and next steps for the " * 2,
+            "labels": ["INBOX", "UNREAD", "CATEGORY_UPDATES"] if i % 2 else ["INBOX", "IMPORTANT"],
+            "is_read": bool(i % 2 == 0),
+            "is_important": bool(i % 2 == 0),
+            "is_starred": bool(i % 7 == 0),
+            "is_draft": False,
+            "is_sent": False,
+            "is_trash": False,
+            "has_attachments": bool(i % 5 == 0),
+            "sent_at": sent - timedelta(minutes=i),
+            "received_at": sent - timedelta(minutes=i) + timedelta(seconds=3),
+            "created_at": datetime(2025, 6, 1, 12, 5, tzinfo=timezone.utc),
+        }
+        rows.append(tuple(values[field] for field in SUMMARY_FIELDS))
+    return rows
+
+
+def page(emails):
+    return {"emails": emails, "total": 12345, "total_is_estimate": False, "next_cursor": None, "page": 1, "per_page": ROWS}
+
+
+def encode_pydantic(rows):
+    """The previous path: a model per row (from_orm, from attributes), then jsonable_encoder + json"""
+    emails = [
+        EmailResponse.model_validate(SimpleNamespace(**dict(zip(SUMMARY_FIELDS, row)), cc_addresses=None))
+        for row in rows
+    ]
+    return json.dumps(jsonable_encoder(page(emails))).encode()
+
+
+def encode_orjson(rows):
+    return FastJSONResponse(page(rows_to_dicts(rows, SUMMARY_FIELDS))).body
+
+
+def encode_msgpack(rows):
+    return MsgPackResponse(page(rows_to_dicts(rows, SUMMARY_FIELDS))).body
+
+
+def run(name: str, encode, rows):
+    encode(rows)  # warm up
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        body = encode(rows)
+    elapsed = time.perf_counter() - started
+
+    per_page = elapsed / ITERATIONS
+    print(f"📊 {name}")
+    print(f"   • {per_page * 1e6:.0f} µs per {ROWS}-row page")
+    print(f"   • {ROWS * ITERATIONS / elapsed:,.0f} rows/s")
+    print(f"   • {len(body):,} bytes")
+    return per_page
+
+
+def main():
+    print("🧪 Benchmarking email list serialization")
+    print(f"   {ROWS} rows per page, {ITERATIONS} pages per run")
+    print("=" * 50)
+
+    rows = make_rows()
+    before = run("Pydantic models + json (before)", encode_pydantic, rows)
+    after = run("Row tuples + orjson (after)", encode_orjson, rows)
+    run("Row tuples + msgpack", encode_msgpack, rows)
+
+    print(f"\n✅ {before * 1e6:.0f} µs → {after * 1e6:.0f} µs per page ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
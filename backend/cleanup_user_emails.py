@@ -11,6 +11,8 @@ from database.connection import SessionLocal
 from models.user import User
 from models.email import Email
 from models.sync_state import SyncState
+from services.mailbox_counters import recompute_counters
+from services.body_store import BodyStore
 
 def cleanup_user_emails(email_address: str):
     """
@@ -20,6 +22,7 @@ def cleanup_user_emails(email_address: str):
         email_address: The user's email address to clean up
     """
     db = SessionLocal()
+    spilled = []
 
     try:
         print(f"🧹 Starting cleanup for user: {email_address}")
@@ -41,10 +44,19 @@ def cleanup_user_emails(email_address: str):
         if email_count == 0:
             print("ℹ️  No emails to delete")
         else:
+            # Bodies spilled to disk go too, once the deletion has committed
+            spilled = [
+                gmail_id for (gmail_id,) in
+                db.query(Email.gmail_id).filter(Email.user_id == user.id, Email.body_truncated == True)
+            ]
+
             # Delete all emails for this user
             deleted_count = db.query(Email).filter(Email.user_id == user.id).delete()
             print(f"🗑️  Deleted {deleted_count} emails")
 
+            # Bulk delete bypasses the ORM flush that maintains the counters
+            recompute_counters(db, user.id)
+
         # Find and reset sync state
         sync_state = db.query(SyncState).filter(SyncState.user_id == user.id).first()
 
@@ -70,6 +82,12 @@ def cleanup_user_emails(email_address: str):
         # Commit all changes
         db.commit()
 
+        store = BodyStore()
+        for gmail_id in spilled:
+            store.delete(gmail_id)
+        if spilled:
+            print(f"🗑️  Deleted stored bodies of {len(spilled)} emails")
+
         # Verify cleanup
         remaining_emails = db.query(Email).filter(Email.user_id == user.id).count()
         print(f"\n✅ Cleanup completed successfully!")
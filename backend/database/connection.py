@@ -1,6 +1,11 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.engine import make_url
+from database.instrumentation import (
+    InstrumentedQueuePool, InstrumentedAsyncQueuePool, instrument_engine
+)
 import os
 from dotenv import load_dotenv
 
@@ -11,14 +16,98 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
-engine = create_engine(DATABASE_URL)
+# asyncpg keeps a per-connection LRU of prepared statements; repeated API
+# queries skip the parse/plan round trip once cached
+PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "500"))
+
+def make_async_url(url: str) -> str:
+    """Derive the async driver URL from DATABASE_URL (asyncpg for PostgreSQL)"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "postgresql":
+        return parsed.set(
+            drivername="postgresql+asyncpg",
+            query={**parsed.query, "prepared_statement_cache_size": str(PREPARED_STATEMENT_CACHE_SIZE)}
+        ).render_as_string(hide_password=False)
+    if parsed.get_backend_name() == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or make_async_url(DATABASE_URL)
+
+# Optional read replicas (comma separated); list/count/search reads go there
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+# After a write to a user's mailbox, their reads stay on the primary this long
+# so they don't see replica lag (services/read_routing.py)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+
+def pool_options(url: str, prefix: str, poolclass) -> dict:
+    """Pool settings for one engine role
+
+    Reads e.g. API_DB_POOL_SIZE, falling back to DB_POOL_SIZE.
+    """
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+
+    def setting(name: str, default: str) -> str:
+        return os.getenv(f"{prefix}_{name}") or os.getenv(f"DB_{name}", default)
+
+    return {
+        "poolclass": poolclass,
+        "pool_size": int(setting("POOL_SIZE", "5")),
+        "max_overflow": int(setting("MAX_OVERFLOW", "10")),
+        "pool_timeout": float(setting("POOL_TIMEOUT", "30")),
+        "pool_recycle": int(setting("POOL_RECYCLE", "1800")),
+    }
+
+# Sync engine: sync worker, scripts, Alembic and the API's background syncs
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL, "WORKER_DB", InstrumentedQueuePool))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+instrument_engine(engine, "worker")
+
+# Async engines: API routes
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, pool_pre_ping=True, **pool_options(DATABASE_URL, "API_DB", InstrumentedAsyncQueuePool)
+)
+instrument_engine(async_engine, "api")
+replica_engines = [
+    create_async_engine(
+        make_async_url(url), pool_pre_ping=True, **pool_options(url, "DB_REPLICA", InstrumentedAsyncQueuePool)
+    )
+    for url in DATABASE_REPLICA_URLS
+]
+for index, replica in enumerate(replica_engines):
+    instrument_engine(replica, f"replica-{index}")
+
+class RoutingSession(Session):
+    """Sends reads of sessions marked by route_reads_to_replica (services/read_routing.py) to a replica
+
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get("replica")
+        if replica is not None and not self._flushing and not getattr(clause, "is_dml", False):
+            return replica_engines[replica].sync_engine
+        return async_engine.sync_engine
+
+# expire_on_commit=False so objects stay readable after commit without an
+# implicit (and, under asyncio, illegal) lazy load
+AsyncSessionLocal = async_sessionmaker(
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
-def get_db():
-    """Dependency to get database session"""
-    db = SessionLocal()
-    try:
+async def get_db():
+    """Dependency to get the request's database session
+
+    FastAPI caches dependencies per request, so get_current_user and the route
+    handler share this one session (and one pooled connection). Uncommitted
+    work is rolled back when the request ends.
+    """
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""
+EXPLAIN as an executable SQLAlchemy construct (PostgreSQL)
+
+Executing Explain(statement) returns the JSON plan for any select, with its
+bound parameters processed exactly as when the statement itself runs.
+"""
+
+import json
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def plan_of(result) -> dict:
+    """Top plan node from an executed Explain (psycopg2 parses the JSON, asyncpg doesn't)"""
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
@@ -0,0 +1,169 @@
+"""
+Connection pool instrumentation
+
+Tracks, per engine role (api, replica, worker):
+  * checkout wait time: how long callers queued for a connection
+  * checkout timeouts (pool exhaustion)
+  * connections in use, overflow and the peak in use
+  * hold time per endpoint: how long each endpoint kept a connection
+  * long-held connections, currently open and recently returned
+
+The endpoint is taken from current_endpoint, which the API's HTTP
+middleware sets per request; worker connections show up as "worker".
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# Label for connections checked out by the current request/job
+current_endpoint: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_endpoint", default=None)
+
+# Connections held longer than this are reported as long-held
+LONG_HOLD_SECONDS = float(os.getenv("DB_LONG_HOLD_SECONDS", "5"))
+
+# Checkout waits kept for percentiles, and long holds kept for reporting
+RECENT_WAITS = 1000
+RECENT_LONG_HOLDS = 50
+
+_lock = threading.Lock()
+_roles: Dict[int, "PoolStats"] = {}
+
+
+class PoolStats:
+    def __init__(self, role: str, pool):
+        self.role = role
+        self.pool = pool
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent_waits = deque(maxlen=RECENT_WAITS)
+        self.peak_in_use = 0
+        self.endpoints: Dict[str, dict] = {}
+        self.held: Dict[int, tuple] = {}  # id(connection record) -> (endpoint, checked out at)
+        self.long_holds = deque(maxlen=RECENT_LONG_HOLDS)
+
+    def record_wait(self, seconds: float, timed_out: bool):
+        with _lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.recent_waits.append(seconds)
+
+    def record_checkout(self, record):
+        with _lock:
+            self.held[id(record)] = (current_endpoint.get() or "unknown", time.monotonic())
+            self.peak_in_use = max(self.peak_in_use, len(self.held))
+
+    def record_checkin(self, record):
+        with _lock:
+            held = self.held.pop(id(record), None)
+            if held is None:
+                return
+            endpoint, started = held
+            seconds = time.monotonic() - started
+
+            totals = self.endpoints.setdefault(endpoint, {"checkouts": 0, "hold_total": 0.0, "hold_max": 0.0})
+            totals["checkouts"] += 1
+            totals["hold_total"] += seconds
+            totals["hold_max"] = max(totals["hold_max"], seconds)
+
+            if seconds >= LONG_HOLD_SECONDS:
+                self.long_holds.append({"endpoint": endpoint, "held_seconds": round(seconds, 3), "at": time.time()})
+
+        if seconds >= LONG_HOLD_SECONDS:
+            print(f"⚠️  {self.role} connection held {seconds:.1f}s by {endpoint}")
+
+    def snapshot(self) -> dict:
+        pool = self.pool
+        with _lock:
+            waits = sorted(self.recent_waits)
+            now = time.monotonic()
+            open_long = [
+                {"endpoint": endpoint, "held_seconds": round(now - started, 3)}
+                for endpoint, started in self.held.values()
+                if now - started >= LONG_HOLD_SECONDS
+            ]
+
+            def percentile(p: float) -> float:
+                return round(waits[min(len(waits) - 1, int(len(waits) * p))] * 1000, 2) if waits else 0.0
+
+            return {
+                "size": pool.size(),
+                "in_use": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+                "peak_in_use": self.peak_in_use,
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.timeouts,
+                "checkout_wait_ms": {
+                    "avg": round(self.wait_total / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                    "p50": percentile(0.5),
+                    "p99": percentile(0.99),
+                    "max": round(self.wait_max * 1000, 2),
+                },
+                "endpoints": {
+                    endpoint: {
+                        "checkouts": totals["checkouts"],
+                        "avg_hold_ms": round(totals["hold_total"] / totals["checkouts"] * 1000, 2),
+                        "max_hold_ms": round(totals["hold_max"] * 1000, 2),
+                    }
+                    for endpoint, totals in sorted(self.endpoints.items(), key=lambda item: -item[1]["hold_total"])
+                },
+                "long_held_open": open_long,
+                "long_held_recent": list(self.long_holds),
+            }
+
+
+class TimedCheckoutMixin:
+    """Times how long pool checkouts wait for a free connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            stats = _roles.get(id(self))
+            if stats:
+                stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        stats = _roles.get(id(self))
+        if stats:
+            stats.record_wait(time.perf_counter() - start, timed_out=False)
+        return connection
+
+
+class InstrumentedQueuePool(TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument_engine(engine, role: str):
+    """Attach checkout/checkin tracking to an engine's pool (sync or async engine)"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    pool = sync_engine.pool
+    if not isinstance(pool, QueuePool):
+        return
+
+    stats = PoolStats(role, pool)
+    _roles[id(pool)] = stats
+    event.listen(pool, "checkout", lambda dbapi_connection, record, proxy: stats.record_checkout(record))
+    event.listen(pool, "checkin", lambda dbapi_connection, record: stats.record_checkin(record))
+
+
+def db_stats() -> dict:
+    """Snapshot of every instrumented pool, keyed by role"""
+    return {stats.role: stats.snapshot() for stats in list(_roles.values())}
@@ -9,6 +9,15 @@ from api.auth import router as auth_router
 from api.emails import router as emails_router
 from api.direct_auth import router as direct_auth_router
 from api.connected_accounts import router as connected_accounts_router
+from api.internal import router as internal_router
+from services.token_broker import get_token_broker
+from services.mailbox_events import get_event_hub
+from services.invalidation import get_invalidation_listener
+from services.gmail_outbox import get_outbox_flusher
+from services.http_client import close_http_client
+from database.connection import async_engine, replica_engines
+from database.instrumentation import current_endpoint
+import re
 
 # Load environment variables
 load_dotenv()
@@ -28,11 +37,46 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+NUMERIC_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+@app.middleware("http")
+async def label_db_connections(request, call_next):
+    # Attribute pool checkouts to the endpoint; numeric path segments are collapsed
+    path = NUMERIC_SEGMENT.sub("/{id}", request.url.path)
+    token = current_endpoint.set(f"{request.method} {path}")
+    try:
+        return await call_next(request)
+    finally:
+        current_endpoint.reset(token)
+
+@app.on_event("startup")
+async def startup():
+    # Renew recently used OAuth tokens before they expire
+    get_token_broker().start()
+    # Publish mailbox changes to open /emails/events streams
+    get_event_hub().start()
+    # Hear about writes made by other processes (sync workers, other API workers)
+    get_invalidation_listener().start()
+    # Send queued label changes (read, star, archive, trash) to Gmail
+    get_outbox_flusher().start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await get_token_broker().stop()
+    await get_event_hub().stop()
+    await get_invalidation_listener().stop()
+    await get_outbox_flusher().stop()
+    await close_http_client()
+    await async_engine.dispose()
+    for replica in replica_engines:
+        await replica.dispose()
+
 # Include API routes
 app.include_router(auth_router)
 app.include_router(emails_router)
 app.include_router(direct_auth_router)
 app.include_router(connected_accounts_router)
+app.include_router(internal_router)
 
 @app.get("/")
 def read_root():
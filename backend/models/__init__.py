@@ -1,6 +1,10 @@
 from .user import User
 from .email import Email
+from .email_label import EmailLabel
+from .mailbox_counter import MailboxCounter
+from .email_change import EmailChange
+from .gmail_outbox import GmailOutbox
 from .sync_state import SyncState
 from .connected_account import ConnectedAccount
 
-__all__ = ["User", "Email", "SyncState", "ConnectedAccount"]
\ No newline at end of file
+__all__ = ["User", "Email", "EmailLabel", "MailboxCounter", "EmailChange", "GmailOutbox", "SyncState", "ConnectedAccount"]
\ No newline at end of file
@@ -10,10 +10,15 @@ class ConnectedAccount(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
 
     # Account details
-    provider = Column(String, nullable=False)  # 'gmail', 'outlook', 'yahoo'
+    provider = Column(String, nullable=False)  # 'gmail', 'outlook', 'imap'
     email = Column(String, nullable=False, index=True)
     display_name = Column(String, nullable=True)
 
+    # IMAP server (provider 'imap' only; the password is kept in access_token,
+    # encrypted by services/credential_cipher.py)
+    imap_host = Column(String, nullable=True)
+    imap_port = Column(Integer, nullable=True)
+
     # OAuth tokens
     access_token = Column(Text, nullable=True)
     refresh_token = Column(Text, nullable=True)
@@ -1,10 +1,30 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, JSON, Index, event, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from database.connection import Base
+from .email_label import EmailLabel, SYSTEM_LABEL_BITS, INDEXED_SYSTEM_LABELS, system_label_mask, custom_label_names
 
 class Email(Base):
     __tablename__ = "emails"
+    __table_args__ = (
+        Index("ix_emails_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_emails_from_address_trgm", "from_address", postgresql_using="gin", postgresql_ops={"from_address": "gin_trgm_ops"}),
+        Index("ix_emails_subject_trgm", "subject", postgresql_using="gin", postgresql_ops={"subject": "gin_trgm_ops"}),
+        # Mailbox listing in keyset order (services/email_service.py), also used for date ranges
+        Index("ix_emails_user_listing", "user_id", "is_trash", text("sent_at DESC"), text("id DESC")),
+        # Search operators (services/search_query.py): is:/has: flags and selective system labels
+        Index("ix_emails_user_unread", "user_id", "sent_at", postgresql_where=text("NOT is_read")),
+        Index("ix_emails_user_starred", "user_id", "sent_at", postgresql_where=text("is_starred")),
+        Index("ix_emails_user_important", "user_id", "sent_at", postgresql_where=text("is_important")),
+        Index("ix_emails_user_attachments", "user_id", "sent_at", postgresql_where=text("has_attachments")),
+        Index("ix_emails_user_trash", "user_id", "sent_at", postgresql_where=text("is_trash")),
+        *(
+            Index(f"ix_emails_user_label_{label.lower()}", "user_id", "sent_at",
+                  postgresql_where=text(f"(system_labels & {SYSTEM_LABEL_BITS[label]}) <> 0"))
+            for label in INDEXED_SYSTEM_LABELS
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     gmail_id = Column(String, unique=True, index=True, nullable=False)  # Gmail message ID
@@ -13,6 +33,9 @@ class Email(Base):
     # Foreign key to user
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
+    # Connected account the email was synced from (NULL for the user's primary mailbox)
+    account_id = Column(Integer, ForeignKey("connected_accounts.id", ondelete="SET NULL"), nullable=True, index=True)
+
     # Email metadata
     subject = Column(String, nullable=True)
     from_address = Column(String, nullable=False, index=True)
@@ -24,18 +47,26 @@ class Email(Base):
     snippet = Column(Text, nullable=True)  # Short preview
     body_text = Column(Text, nullable=True)  # Plain text body
     body_html = Column(Text, nullable=True)  # HTML body
+    body_truncated = Column(Boolean, default=False, nullable=False)  # Full body lives in the body store
+
+    # Full-text search document, set at ingest (services/email_search.py); never loaded by default
+    search_vector = deferred(Column(TSVECTOR, nullable=True))
 
     # Gmail labels and status
-    labels = Column(JSON, nullable=True)  # Array of Gmail labels
+    labels = Column(JSON, nullable=True)  # Array of Gmail labels (as returned to clients)
+    # Indexable copies of labels, kept in step by sync_label_storage below
+    system_labels = Column(Integer, default=0, nullable=False)  # Bitmask of SYSTEM_LABEL_BITS
+    custom_labels = relationship("EmailLabel", backref="email", cascade="all, delete-orphan", passive_deletes=True)
     is_read = Column(Boolean, default=False, nullable=False)
     is_important = Column(Boolean, default=False, nullable=False)
     is_starred = Column(Boolean, default=False, nullable=False)
     is_draft = Column(Boolean, default=False, nullable=False)
     is_sent = Column(Boolean, default=False, nullable=False)
     is_trash = Column(Boolean, default=False, nullable=False)
+    has_attachments = Column(Boolean, default=False, nullable=False)
 
     # Timestamps
-    sent_at = Column(DateTime, nullable=True)  # When email was sent
+    sent_at = Column(DateTime, nullable=False)  # When email was sent (received_at if the message has no date)
     received_at = Column(DateTime, nullable=True)  # When we received/synced it
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -47,6 +78,27 @@ class Email(Base):
         return f"<Email(id={self.id}, gmail_id='{self.gmail_id}', subject='{self.subject}')>"
 
 
+@event.listens_for(Email.labels, "set", active_history=True)
+def sync_label_storage(target, value, oldvalue, initiator):
+    """Derive system_labels and email_labels rows whenever labels is assigned
+
+    labels is a plain JSON column, so in-place list changes aren't seen here
+    (or persisted); always assign a new list.
+    """
+    target.system_labels = system_label_mask(value)
+    custom = custom_label_names(value)
+    previous = custom_label_names(oldvalue) if isinstance(oldvalue, list) else None
+    if previous is None or set(custom) != set(previous):
+        target.custom_labels = [EmailLabel(label=label, user_id=target.user_id) for label in custom]
+
+
+@event.listens_for(EmailLabel, "before_insert")
+def fill_label_user(mapper, connection, target):
+    # Emails built with labels before user_id (e.g. Email(**data)) leave it unset
+    if target.user_id is None:
+        target.user_id = target.email.user_id
+
+
 # Add relationship to User model
 from .user import User
 User.emails = relationship("Email", back_populates="user")
\ No newline at end of file
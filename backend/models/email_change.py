@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from database.connection import Base
+
+# What happened to an email at a version
+CHANGE_INSERT = "insert"
+CHANGE_UPDATE = "update"
+CHANGE_DELETE = "delete"
+
+class EmailChange(Base):
+    """One write to an email, tagged with the mailbox version it produced (read by GET /emails/changes)"""
+    __tablename__ = "email_changes"
+
+    # The primary key doubles as the index for "changes to user X after version N"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(BigInteger, primary_key=True)
+    email_id = Column(Integer, primary_key=True)  # No foreign key: deletions are logged too
+
+    op = Column(String(10), nullable=False)  # CHANGE_INSERT, CHANGE_UPDATE or CHANGE_DELETE
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<EmailChange(user_id={self.user_id}, version={self.version}, email_id={self.email_id}, op='{self.op}')>"
@@ -0,0 +1,59 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
+from database.connection import Base
+
+# Gmail system labels, stored as bits of Email.system_labels. Append only:
+# the bit values are persisted.
+SYSTEM_LABEL_BITS = {
+    "INBOX": 1 << 0,
+    "SENT": 1 << 1,
+    "DRAFT": 1 << 2,
+    "SPAM": 1 << 3,
+    "TRASH": 1 << 4,
+    "STARRED": 1 << 5,
+    "IMPORTANT": 1 << 6,
+    "UNREAD": 1 << 7,
+    "CHAT": 1 << 8,
+    "CATEGORY_PERSONAL": 1 << 9,
+    "CATEGORY_SOCIAL": 1 << 10,
+    "CATEGORY_PROMOTIONS": 1 << 11,
+    "CATEGORY_UPDATES": 1 << 12,
+    "CATEGORY_FORUMS": 1 << 13,
+}
+
+# System labels selective enough to get a partial (user_id, sent_at) index.
+# INBOX covers most mail; STARRED/IMPORTANT/UNREAD/TRASH are filtered via the
+# flag columns, which have their own partial indexes.
+INDEXED_SYSTEM_LABELS = (
+    "SENT", "DRAFT", "CATEGORY_PERSONAL", "CATEGORY_SOCIAL",
+    "CATEGORY_PROMOTIONS", "CATEGORY_UPDATES", "CATEGORY_FORUMS",
+)
+
+
+def system_label_mask(labels) -> int:
+    """Bitmask of the system labels in a label list"""
+    mask = 0
+    for label in labels or []:
+        mask |= SYSTEM_LABEL_BITS.get(label, 0)
+    return mask
+
+
+def custom_label_names(labels) -> list:
+    """Labels in a label list that aren't system labels, deduplicated in order"""
+    return list(dict.fromkeys(label for label in labels or [] if label not in SYSTEM_LABEL_BITS))
+
+
+class EmailLabel(Base):
+    """A user (non-system) label on an email, e.g. Gmail's "Label_12" """
+    __tablename__ = "email_labels"
+    __table_args__ = (
+        Index("ix_email_labels_user_label", "user_id", "label", "email_id"),
+    )
+
+    email_id = Column(Integer, ForeignKey("emails.id", ondelete="CASCADE"), primary_key=True)
+    label = Column(String, primary_key=True)
+
+    # Denormalized from the email so label lookups stay within one mailbox
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    def __repr__(self):
+        return f"<EmailLabel(email_id={self.email_id}, label='{self.label}')>"
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, ForeignKey, Index
+from sqlalchemy.sql import func
+from database.connection import Base
+
+class GmailOutbox(Base):
+    """A label change made locally and not yet sent to Gmail (flushed by services/gmail_outbox.py)"""
+    __tablename__ = "gmail_outbox"
+    __table_args__ = (
+        # The flusher finds users with due entries, then reads each user's entries in order
+        Index("ix_gmail_outbox_next_attempt_at", "next_attempt_at"),
+        Index("ix_gmail_outbox_user_id", "user_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # Connected account the message belongs to (NULL for the user's primary mailbox)
+    account_id = Column(Integer, ForeignKey("connected_accounts.id", ondelete="CASCADE"), nullable=True)
+    gmail_id = Column(String, nullable=False)
+
+    add_labels = Column(JSON, nullable=False)
+    remove_labels = Column(JSON, nullable=False)
+
+    # Delivery attempts so far; failed entries wait until next_attempt_at
+    attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_error = Column(Text, nullable=True)
+    # Set while a flusher is sending the entry; the user's other entries wait until it's cleared or expires
+    leased_until = Column(DateTime(timezone=True), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<GmailOutbox(id={self.id}, user_id={self.user_id}, gmail_id='{self.gmail_id}', add={self.add_labels}, remove={self.remove_labels})>"
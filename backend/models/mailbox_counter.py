@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, BigInteger, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from database.connection import Base
+
+class MailboxCounter(Base):
+    """Per-user email counts for /emails/email-counts, maintained by services/mailbox_counters.py"""
+    __tablename__ = "mailbox_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+
+    # Counts of non-trash emails
+    total = Column(Integer, default=0, nullable=False)
+    unread = Column(Integer, default=0, nullable=False)
+    inbox = Column(Integer, default=0, nullable=False)
+    important = Column(Integer, default=0, nullable=False)
+    starred = Column(Integer, default=0, nullable=False)
+    sent = Column(Integer, default=0, nullable=False)
+    personal = Column(Integer, default=0, nullable=False)
+    updates = Column(Integer, default=0, nullable=False)
+    promotions = Column(Integer, default=0, nullable=False)
+
+    # Bumped by every write to the user's emails; ETags of mailbox reads are built from it
+    version = Column(BigInteger, default=0, nullable=False)
+    # Lowest version GET /emails/changes can continue from (older changes were pruned or never logged)
+    changes_start = Column(BigInteger, default=0, nullable=False)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<MailboxCounter(user_id={self.user_id}, total={self.total}, unread={self.unread})>"
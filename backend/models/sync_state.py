@@ -11,6 +11,9 @@ class SyncState(Base):
     # Foreign key to user
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
+    # Connected account this cursor belongs to (NULL for the user's primary mailbox)
+    account_id = Column(Integer, ForeignKey("connected_accounts.id", ondelete="CASCADE"), nullable=True, index=True)
+
     # Sync tracking
     provider = Column(String, nullable=False)  # "gmail", "outlook", etc.
     last_sync_token = Column(Text, nullable=True)  # Gmail history ID or similar
@@ -34,7 +37,7 @@ class SyncState(Base):
     user = relationship("User", back_populates="sync_states")
 
     def __repr__(self):
-        return f"<SyncState(id={self.id}, user_id={self.user_id}, provider='{self.provider}')>"
+        return f"<SyncState(id={self.id}, user_id={self.user_id}, account_id={self.account_id}, provider='{self.provider}')>"
 
 
 # Add relationship to User model
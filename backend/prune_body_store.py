@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Prune job for the on-disk body store
+
+Deletes spilled bodies (services/body_store.py) that no email refers to any
+more: emails removed from the database, and bodies spilled for messages
+that were never stored. Files younger than the grace period are kept, since
+a running sync may have spilled a body whose email isn't committed yet. Run
+it daily from cron.
+
+Usage: python prune_body_store.py [grace_hours]
+"""
+
+import os
+import sys
+import time
+from database.connection import SessionLocal
+from models.email import Email
+from services.body_store import BodyStore
+
+GRACE_HOURS = int(os.getenv("BODY_STORE_PRUNE_GRACE_HOURS", "24"))
+
+def prune_body_store(grace_hours: int = GRACE_HOURS) -> int:
+    """Delete unreferenced body files older than grace_hours; returns the number of files deleted"""
+    db = SessionLocal()
+    store = BodyStore()
+    cutoff = time.time() - grace_hours * 3600
+    pruned = 0
+
+    try:
+        # Only truncated emails have a spilled copy
+        referenced = {
+            store.digest_for(gmail_id) for (gmail_id,) in
+            db.query(Email.gmail_id).filter(Email.body_truncated == True).yield_per(10000)
+        }
+        print(f"🧹 Pruning body store {store.root} ({len(referenced)} emails with stored bodies)")
+
+        for path, digest in store.files():
+            if digest in referenced:
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    pruned += 1
+            except FileNotFoundError:
+                pass
+
+        print(f"✅ Done: deleted {pruned} body files")
+        return pruned
+
+    finally:
+        db.close()
+
+def main():
+    prune_body_store(int(sys.argv[1]) if len(sys.argv) > 1 else GRACE_HOURS)
+
+if __name__ == "__main__":
+    main()
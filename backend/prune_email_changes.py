@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Prune job for the email change log
+
+Deletes email_changes rows older than the retention period, one user per
+transaction. Clients syncing from a version before the pruned changes get
+410 from GET /emails/changes and reload their mailbox. Run it daily from cron.
+
+Usage: python prune_email_changes.py [retention_days]
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select
+from database.connection import SessionLocal
+from models.email_change import EmailChange
+from services.email_changes import prune_changes
+
+RETENTION_DAYS = int(os.getenv("EMAIL_CHANGES_RETENTION_DAYS", "14"))
+
+def prune_email_changes(retention_days: int = RETENTION_DAYS) -> int:
+    """Prune changes older than retention_days for every user; returns the number of rows deleted"""
+    db = SessionLocal()
+    before = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    pruned = 0
+
+    try:
+        user_ids = db.scalars(
+            select(EmailChange.user_id).filter(EmailChange.created_at < before).distinct()
+        ).all()
+
+        print(f"🧹 Pruning email changes older than {retention_days} days for {len(user_ids)} users")
+
+        for user_id in user_ids:
+            pruned += prune_changes(db, user_id, before)
+            db.commit()
+
+        print(f"✅ Done: deleted {pruned} change log rows")
+        return pruned
+
+    except Exception as e:
+        print(f"❌ Error pruning email changes: {e}")
+        db.rollback()
+        raise
+
+    finally:
+        db.close()
+
+def main():
+    prune_email_changes(int(sys.argv[1]) if len(sys.argv) > 1 else RETENTION_DAYS)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Repair job for mailbox counters
+
+Recomputes each user's mailbox_counters row from the emails table and
+reports any drift (e.g. from bulk SQL that bypassed the ORM). Safe to run
+while the API and sync worker are writing; run it periodically from cron.
+
+Usage: python repair_mailbox_counters.py [email_address]
+"""
+
+import sys
+from database.connection import SessionLocal
+from models.user import User
+from models.mailbox_counter import MailboxCounter
+from services.mailbox_counters import recompute_counters, COUNTERS
+
+def repair_counters(email_address: str = None) -> int:
+    """Recompute counters for one user or all users; returns the number of rows that had drifted"""
+    db = SessionLocal()
+    drifted = 0
+
+    try:
+        query = db.query(User.id, User.email)
+        if email_address:
+            query = query.filter(User.email == email_address)
+        users = query.order_by(User.id).all()
+
+        if not users:
+            print(f"❌ No users found{f': {email_address}' if email_address else ''}")
+            return 0
+
+        print(f"🧮 Recomputing mailbox counters for {len(users)} users")
+
+        for user_id, email in users:
+            previous = db.get(MailboxCounter, user_id)
+            before = {name: getattr(previous, name) for name in COUNTERS} if previous else None
+
+            # One short transaction per user keeps the counter row lock brief
+            after = recompute_counters(db, user_id)
+            db.commit()
+            db.expire_all()
+
+            if before != after and (before or any(after.values())):
+                drifted += 1
+                changes = ", ".join(
+                    f"{name} {before[name] if before else 0}→{after[name]}"
+                    for name in COUNTERS if (before[name] if before else 0) != after[name]
+                )
+                print(f"   🔧 {email}: {changes or 'row created'}")
+
+        print(f"✅ Done: {drifted} of {len(users)} users had drifted counters")
+        return drifted
+
+    except Exception as e:
+        print(f"❌ Error repairing counters: {e}")
+        db.rollback()
+        raise
+
+    finally:
+        db.close()
+
+def main():
+    repair_counters(sys.argv[1] if len(sys.argv) > 1 else None)
+
+if __name__ == "__main__":
+    main()
@@ -12,10 +12,12 @@ class EmailResponse(EmailBase):
     id: int
     gmail_id: str
     thread_id: Optional[str] = None
+    account_id: Optional[int] = None
     to_addresses: Optional[List[str]] = None
     cc_addresses: Optional[List[str]] = None
     body_text: Optional[str] = None
     body_html: Optional[str] = None
+    body_truncated: bool = False
     labels: Optional[List[str]] = None
     is_read: bool = False
     is_important: bool = False
@@ -40,12 +42,62 @@ class EmailResponse(EmailBase):
     class Config:
         from_attributes = True
 
+class EmailSummary(BaseModel):
+    """An email as listed by GET /emails/: no bodies, and only the requested fields are set"""
+    id: Optional[int] = None
+    gmail_id: Optional[str] = None
+    thread_id: Optional[str] = None
+    account_id: Optional[int] = None
+    subject: Optional[str] = None
+    from_address: Optional[str] = None
+    to_addresses: Optional[List[str]] = None
+    cc_addresses: Optional[List[str]] = None
+    snippet: Optional[str] = None
+    labels: Optional[List[str]] = None
+    is_read: Optional[bool] = None
+    is_important: Optional[bool] = None
+    is_starred: Optional[bool] = None
+    is_draft: Optional[bool] = None
+    is_sent: Optional[bool] = None
+    is_trash: Optional[bool] = None
+    has_attachments: Optional[bool] = None
+    body_truncated: Optional[bool] = None
+    sent_at: Optional[datetime] = None
+    received_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+
+    @field_serializer('sent_at', 'received_at', 'created_at')
+    def serialize_datetime(self, dt: Optional[datetime]) -> Optional[str]:
+        if dt is None:
+            return None
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=pytz.UTC)
+        return dt.isoformat()
+
+# Fields GET /emails/ returns unless ?fields= asks for others (cc_addresses, body_truncated)
+SUMMARY_FIELDS = [
+    "id", "gmail_id", "thread_id", "account_id", "subject", "from_address", "to_addresses",
+    "snippet", "labels", "is_read", "is_important", "is_starred", "is_draft", "is_sent",
+    "is_trash", "has_attachments", "sent_at", "received_at", "created_at",
+]
+LIST_FIELDS = set(EmailSummary.model_fields)
+
 class EmailList(BaseModel):
-    emails: List[EmailResponse]
-    total: int
+    emails: List[EmailSummary]
+    total: Optional[int] = None  # None when count=none
+    total_is_estimate: bool = False
+    next_cursor: Optional[str] = None  # None on the last page
+    version: Optional[int] = None  # Mailbox version of the page, for GET /emails/changes
     page: int
     per_page: int
 
+class EmailChangeSet(BaseModel):
+    inserted: List[EmailSummary]
+    updated: List[EmailSummary]
+    deleted: List[int]  # IDs
+    version: int  # Pass as since to get the changes after these
+    has_more: bool = False
+
 class EmailSend(BaseModel):
     to: List[EmailStr]
     cc: Optional[List[EmailStr]] = None
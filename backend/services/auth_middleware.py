@@ -2,14 +2,25 @@
 JWT Authentication Middleware for Multi-User Support
 """
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, event, inspect
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+import hashlib
 import os
-from database.connection import SessionLocal
+import time
+import httpx
+from database.connection import get_db
+from services.read_routing import route_reads_to_replica
 from models.user import User
+from services.token_broker import invalidate_cached_token
+from services.invalidation import publish, on_invalidation
+from services.http_client import get_http_client
 
 # JWT Configuration
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "axia-email-client-jwt-secret-key-2024-production-ready-secure")
@@ -17,14 +28,30 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24 * 30  # 30 days
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
-def get_database():
-    """Dependency to get database session"""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Google userinfo lookups: short timeout, successful results cached briefly by token hash
+GOOGLE_USERINFO_URL = "https://www.googleapis.com/oauth2/v2/userinfo"
+USERINFO_TIMEOUT = httpx.Timeout(5.0, connect=3.0)
+USERINFO_CACHE_TTL_SECONDS = int(os.getenv("GOOGLE_USERINFO_CACHE_TTL_SECONDS", "60"))
+USERINFO_CACHE_MAX_ENTRIES = 10000
+
+_userinfo_cache: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+
+# Authenticated principals, cached by token hash so most requests skip the users table
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+PRINCIPAL_CACHE_MAX_ENTRIES = 10000
+
+class Principal:
+    """The authenticated caller: what most handlers need instead of a full User"""
+
+    def __init__(self, id: int, email: str, is_active: bool):
+        self.id = id
+        self.email = email
+        self.is_active = is_active
+
+_principal_cache: "OrderedDict[str, tuple[float, Principal]]" = OrderedDict()
+_principal_keys: Dict[int, Set[str]] = {}
 
 def create_access_token(user_id: int) -> str:
     """Create JWT token for user"""
@@ -54,7 +81,7 @@ def verify_token(token: str) -> int:
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_database)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """Get current authenticated user from JWT token"""
 
@@ -62,7 +89,7 @@ async def get_current_user(
     user_id = verify_token(credentials.credentials)
 
     # Get user from database
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -77,24 +104,153 @@ async def get_current_user(
 
     return user
 
-def get_user_from_google_token(google_token: str, db: Session, refresh_token: str = None) -> tuple[User, bool]:
+async def get_current_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> Principal:
+    """Get the authenticated principal from a JWT, from cache when possible"""
+    token = credentials.credentials
+    key = hashlib.sha256(token.encode()).hexdigest()
+    now = time.time()
+
+    cached = _principal_cache.get(key)
+    if cached and cached[0] > now:
+        _principal_cache.move_to_end(key)
+        principal = cached[1]
+    else:
+        # Verify token and get user_id
+        user_id = verify_token(token)
+
+        row = (await db.execute(
+            select(User.id, User.email, User.is_active).filter(User.id == user_id)
+        )).first()
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found",
+            )
+
+        principal = Principal(row.id, row.email, row.is_active)
+        # Never cache past the token's own expiry
+        expires_at = min(now + PRINCIPAL_CACHE_TTL_SECONDS, jwt.get_unverified_claims(token).get("exp", now))
+        cache_principal(key, expires_at, principal)
+
+    if not principal.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Inactive user",
+        )
+
+    return principal
+
+async def get_stream_principal(
+    token: Optional[str] = Query(None, description="JWT, for clients that can't set headers (EventSource)"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: AsyncSession = Depends(get_db)
+) -> Principal:
+    """Like get_current_principal, also accepting the JWT as a token query parameter"""
+    if credentials is None:
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authenticated",
+            )
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return await get_current_principal(credentials, db)
+
+async def get_read_db(
+    principal: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+) -> AsyncSession:
+    """The request's session, with reads routed to a replica when one is configured"""
+    route_reads_to_replica(db, principal.id)
+    return db
+
+def cache_principal(key: str, expires_at: float, principal: Principal):
+    _principal_cache[key] = (expires_at, principal)
+    _principal_cache.move_to_end(key)
+    _principal_keys.setdefault(principal.id, set()).add(key)
+
+    while len(_principal_cache) > PRINCIPAL_CACHE_MAX_ENTRIES:
+        old_key, (_, old) = _principal_cache.popitem(last=False)
+        keys = _principal_keys.get(old.id)
+        if keys:
+            keys.discard(old_key)
+            if not keys:
+                del _principal_keys[old.id]
+
+def invalidate_principal(user_id: int):
+    """Drop every cached principal of a user (deactivation, email change)"""
+    for key in _principal_keys.pop(user_id, set()):
+        _principal_cache.pop(key, None)
+
+@event.listens_for(Session, "after_flush")
+def _publish_changed_principals(session, flush_context):
+    """Invalidate, in every process once committed, users whose is_active/email changed"""
+    # The dirty/deleted lists and attribute history still show pre-flush state here
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, User):
+            continue
+        attrs = inspect(obj).attrs
+        if obj in session.deleted or attrs.is_active.history.has_changes() or attrs.email.history.has_changes():
+            publish(session, "principal", obj.id)
+
+@on_invalidation("principal")
+def _evict_principal(user_id: Optional[int], version: Optional[int]):
+    if user_id is None:
+        _principal_cache.clear()
+        _principal_keys.clear()
+    else:
+        invalidate_principal(user_id)
+
+async def fetch_google_userinfo(google_token: str) -> Optional[dict]:
+    """
+    Get Google user info for an access token
+    Returns None if Google rejects the token; raises httpx.HTTPError on timeouts
+    and network errors
+    """
+    key = hashlib.sha256(google_token.encode()).hexdigest()
+    now = time.monotonic()
+
+    cached = _userinfo_cache.get(key)
+    if cached and cached[0] > now:
+        _userinfo_cache.move_to_end(key)
+        return cached[1]
+
+    response = await get_http_client().get(
+        GOOGLE_USERINFO_URL,
+        headers={"Authorization": f"Bearer {google_token}"},
+        timeout=USERINFO_TIMEOUT
+    )
+    if response.status_code != 200:
+        _userinfo_cache.pop(key, None)
+        return None
+
+    user_info = response.json()
+    _userinfo_cache[key] = (now + USERINFO_CACHE_TTL_SECONDS, user_info)
+    _userinfo_cache.move_to_end(key)
+    while len(_userinfo_cache) > USERINFO_CACHE_MAX_ENTRIES:
+        _userinfo_cache.popitem(last=False)
+    return user_info
+
+async def get_user_from_google_token(google_token: str, db: AsyncSession, refresh_token: str = None) -> tuple[User, bool]:
     """
     Get or create user from Google access token
     Returns (user, is_new_user)
     """
-    import requests
-
     # Get user info from Google
     try:
-        response = requests.get(
-            f"https://www.googleapis.com/oauth2/v2/userinfo?access_token={google_token}"
+        google_user = await fetch_google_userinfo(google_token)
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Google userinfo unavailable: {str(e) or type(e).__name__}"
         )
-        response.raise_for_status()
-        google_user = response.json()
-    except Exception as e:
+
+    if google_user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Invalid Google token: {str(e)}"
+            detail="Invalid Google token"
         )
 
     email = google_user.get('email')
@@ -108,7 +264,7 @@ def get_user_from_google_token(google_token: str, db: Session, refresh_token: st
         )
 
     # Check if user exists
-    user = db.query(User).filter(User.email == email).first()
+    user = await db.scalar(select(User).filter(User.email == email))
 
     if user:
         # Update existing user with fresh token
@@ -117,7 +273,8 @@ def get_user_from_google_token(google_token: str, db: Session, refresh_token: st
         user.picture = picture or user.picture
         if refresh_token:
             user.google_refresh_token = refresh_token
-        db.commit()
+        await db.commit()
+        invalidate_cached_token("user", user.id)
         return user, False
     else:
         # Create new user
@@ -130,6 +287,6 @@ def get_user_from_google_token(google_token: str, db: Session, refresh_token: st
             google_refresh_token=refresh_token
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
         return user, True
\ No newline at end of file
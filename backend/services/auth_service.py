@@ -1,17 +1,14 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, or_
 from models.user import User
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from database.connection import get_db
+from fastapi import HTTPException, status
+from services.token_broker import invalidate_cached_token
 import os
 
-security = HTTPBearer()
-
 class AuthService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
     async def create_or_update_user(
@@ -26,7 +23,7 @@ class AuthService:
         """Create or update user with OAuth tokens"""
 
         # Check if user exists
-        user = self.db.query(User).filter(User.email == email).first()
+        user = await self.db.scalar(select(User).filter(User.email == email))
 
         if user:
             # Update existing user
@@ -49,8 +46,9 @@ class AuthService:
             )
             self.db.add(user)
 
-        self.db.commit()
-        self.db.refresh(user)
+        await self.db.commit()
+        await self.db.refresh(user)
+        invalidate_cached_token("user", user.id)
         return user
 
     def create_access_token(self, user_id: int) -> str:
@@ -85,20 +83,3 @@ class AuthService:
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid authentication credentials"
             )
-
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get current authenticated user"""
-    auth_service = AuthService(db)
-    user_id = auth_service.verify_token(credentials.credentials)
-
-    user = db.query(User).filter(User.id == user_id, User.is_active == True).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found or inactive"
-        )
-
-    return user
\ No newline at end of file
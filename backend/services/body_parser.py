@@ -0,0 +1,116 @@
+"""
+Size-aware email body decoding
+
+Bodies are decoded in fixed-size chunks so a multi-megabyte part never exists
+as several full-size copies at once. Only the first EMAIL_BODY_DB_MAX_BYTES of
+each body are kept in memory for the database copy; anything beyond that is
+streamed to the on-disk BodyStore, up to EMAIL_BODY_MAX_BYTES.
+"""
+
+import base64
+import os
+from typing import Iterator, Optional
+from dotenv import load_dotenv
+from services.body_store import BodyStore, BodySpill
+
+load_dotenv()
+
+# Largest body (per type) stored in the emails table
+BODY_DB_MAX_BYTES = int(os.getenv("EMAIL_BODY_DB_MAX_BYTES", str(256 * 1024)))
+
+# Largest body (per type) kept at all; the spilled copy stops here
+BODY_MAX_BYTES = int(os.getenv("EMAIL_BODY_MAX_BYTES", str(25 * 1024 * 1024)))
+
+# Base64 characters decoded per step (must be a multiple of 4)
+DECODE_CHUNK_CHARS = 64 * 1024
+
+
+def iter_base64url_chunks(data: str, chunk_chars: int = DECODE_CHUNK_CHARS) -> Iterator[bytes]:
+    """Decode base64url data chunk by chunk instead of all at once"""
+    for start in range(0, len(data), chunk_chars):
+        chunk = data[start:start + chunk_chars]
+        if len(chunk) % 4:
+            chunk += "=" * (-len(chunk) % 4)
+        yield base64.urlsafe_b64decode(chunk)
+
+
+class BoundedBody:
+    """Accumulates one body type (text or HTML) under the configured caps"""
+
+    def __init__(
+        self,
+        kind: str,
+        message_id: Optional[str] = None,
+        store: Optional[BodyStore] = None,
+        db_max_bytes: int = BODY_DB_MAX_BYTES,
+        max_bytes: int = BODY_MAX_BYTES
+    ):
+        self.kind = kind
+        self.message_id = message_id
+        self.store = store
+        self.db_max_bytes = db_max_bytes
+        self.max_bytes = max_bytes
+
+        self.prefix = bytearray()
+        self.size = 0
+        self.truncated = False
+        self.spill: Optional[BodySpill] = None
+
+    def feed_base64url(self, data: str):
+        """Append one base64url-encoded part"""
+        if self.size:
+            self.write(b"\n")
+        for chunk in iter_base64url_chunks(data):
+            self.write(chunk)
+            if self.size >= self.max_bytes:
+                break
+
+    def feed_bytes(self, data: bytes):
+        """Append one already-decoded part"""
+        if self.size:
+            self.write(b"\n")
+        self.write(data)
+
+    def write(self, chunk: bytes):
+        remaining = self.max_bytes - self.size
+        if remaining <= 0:
+            return
+        if len(chunk) > remaining:
+            chunk = chunk[:remaining]
+
+        room = self.db_max_bytes - len(self.prefix)
+        if len(chunk) <= room and not self.truncated:
+            self.prefix += chunk
+        else:
+            if not self.truncated:
+                self.truncated = True
+                self.start_spill()
+                self.prefix += chunk[:room]
+            if self.spill:
+                self.spill.write(chunk)
+
+        self.size += len(chunk)
+
+    def start_spill(self):
+        """Open the on-disk copy and write what has been buffered so far"""
+        if not self.store or not self.message_id:
+            return
+        try:
+            self.spill = self.store.open_spill(self.message_id, self.kind)
+            self.spill.write(self.prefix)
+        except OSError as e:
+            print(f"⚠️  Could not spill {self.kind} body for {self.message_id}: {str(e)}")
+            self.spill = None
+
+    def finish(self) -> str:
+        """Close any spill file and return the (possibly truncated) database copy"""
+        if self.spill:
+            try:
+                self.spill.close()
+            except OSError as e:
+                print(f"⚠️  Could not store {self.kind} body for {self.message_id}: {str(e)}")
+                self.spill.discard()
+            self.spill = None
+
+        # errors="ignore" also drops a multi-byte character cut at the cap
+        return self.prefix.decode("utf-8", errors="ignore")
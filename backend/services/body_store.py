@@ -0,0 +1,84 @@
+"""
+On-disk store for full email bodies that are too large for the database copy
+"""
+
+import hashlib
+import os
+from typing import Iterator, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BODY_STORE_DIR = os.getenv(
+    "EMAIL_BODY_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "body_store")
+)
+
+
+class BodySpill:
+    """Write handle for one spilled body; becomes visible only once closed"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(self.tmp_path, "wb")
+
+    def write(self, data: bytes):
+        self.file.write(data)
+
+    def close(self):
+        """Flush and atomically move the body into place"""
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        """Drop a partially written body"""
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class BodyStore:
+    """Stores full bodies as files keyed by provider message ID and body kind"""
+
+    def __init__(self, root: str = BODY_STORE_DIR):
+        self.root = root
+
+    @staticmethod
+    def digest_for(message_id: str) -> str:
+        """Message IDs are hashed so any provider ID is filename-safe"""
+        return hashlib.sha256(message_id.encode()).hexdigest()
+
+    def path_for(self, message_id: str, kind: str) -> str:
+        digest = self.digest_for(message_id)
+        return os.path.join(self.root, digest[:2], f"{digest}.{kind}")
+
+    def open_spill(self, message_id: str, kind: str) -> BodySpill:
+        return BodySpill(self.path_for(message_id, kind))
+
+    def read(self, message_id: str, kind: str) -> Optional[str]:
+        """Read a stored body, or None if it was never spilled"""
+        path = self.path_for(message_id, kind)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read().decode("utf-8", errors="ignore")
+
+    def files(self) -> Iterator[Tuple[str, str]]:
+        """(path, message ID digest) of every stored body, partial spills included"""
+        if not os.path.isdir(self.root):
+            return
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file():
+                    yield entry.path, entry.name.split(".", 1)[0]
+
+    def delete(self, message_id: str):
+        """Remove a message's stored bodies, if any"""
+        for kind in ("text", "html"):
+            path = self.path_for(message_id, kind)
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,77 @@
+"""
+Conditional GET for mailbox reads
+
+Every write to a user's emails bumps mailbox_counters.version in the same
+transaction (services/mailbox_counters.py), so (user, version) identifies
+the state of the whole mailbox. A listing or count served at one version is
+still valid while the version stands; If-None-Match is answered with 304
+from the counter row alone, without running the listing or count queries.
+
+While this process receives mailbox events (services/invalidation.py), the
+latest versions they announced are kept in memory, and a client already at
+that version gets its 304 without touching the database at all.
+"""
+
+from collections import OrderedDict
+from typing import Optional
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.mailbox_counter import MailboxCounter
+from services.invalidation import on_invalidation, listening
+
+# Per-user responses: browsers may store them but must revalidate every time
+CACHE_CONTROL = "private, no-cache"
+
+KNOWN_VERSIONS_MAX_ENTRIES = 10000
+
+_known_versions: "OrderedDict[int, int]" = OrderedDict()
+
+
+@on_invalidation("mailbox")
+def _note_version(user_id: Optional[int], version: Optional[int]):
+    if user_id is None:
+        _known_versions.clear()
+        return
+    if version is not None and version > _known_versions.get(user_id, -1):
+        _known_versions[user_id] = version
+        _known_versions.move_to_end(user_id)
+        while len(_known_versions) > KNOWN_VERSIONS_MAX_ENTRIES:
+            _known_versions.popitem(last=False)
+
+
+def known_mailbox_version(user_id: int) -> Optional[int]:
+    """Latest version announced for a user, if this process is sure to have heard of any newer one"""
+    if not listening():
+        return None
+    return _known_versions.get(user_id)
+
+
+async def mailbox_version(db: AsyncSession, user_id: int) -> int:
+    """Current mailbox version (0 until the user's first email is stored)"""
+    counter = await db.get(MailboxCounter, user_id)
+    return counter.version if counter else 0
+
+
+def mailbox_etag(user_id: int, version: int, variant: Optional[str] = None) -> str:
+    """Weak ETag for a mailbox read; variant distinguishes encodings of the same data"""
+    return f'W/"{user_id}.{version}{f".{variant}" if variant else ""}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether If-None-Match names etag (weak comparison, as RFC 9110 requires for GET)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
@@ -0,0 +1,38 @@
+"""
+Encryption at rest for long-lived credentials
+
+IMAP accounts log in with the account password, which is kept in
+connected_accounts.access_token. Unlike the OAuth tokens beside it, it
+doesn't expire, so it's stored Fernet-encrypted with
+CREDENTIALS_ENCRYPTION_KEY and only decrypted when a connection is opened.
+"""
+
+import os
+from cryptography.fernet import Fernet, InvalidToken
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Generate with: python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
+CREDENTIALS_ENCRYPTION_KEY = os.getenv("CREDENTIALS_ENCRYPTION_KEY")
+
+
+class CredentialError(Exception):
+    pass
+
+
+def _fernet() -> Fernet:
+    if not CREDENTIALS_ENCRYPTION_KEY:
+        raise CredentialError("CREDENTIALS_ENCRYPTION_KEY isn't set")
+    return Fernet(CREDENTIALS_ENCRYPTION_KEY.encode())
+
+
+def encrypt_credential(value: str) -> str:
+    return _fernet().encrypt(value.encode()).decode()
+
+
+def decrypt_credential(value: str) -> str:
+    try:
+        return _fernet().decrypt(value.encode()).decode()
+    except InvalidToken:
+        raise CredentialError("Stored credential can't be decrypted with CREDENTIALS_ENCRYPTION_KEY; reconnect the account")
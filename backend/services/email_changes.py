@@ -0,0 +1,67 @@
+"""
+Email change log for delta sync
+
+Every flush that writes emails bumps the owners' mailbox versions
+(services/mailbox_counters.py) and logs one email_changes row per email
+written, tagged with the new version. GET /emails/changes?since=N replays
+the log: each email changed after version N once, as inserted, updated or
+deleted. Bulk Core statements bypass the flush and must call record_changes
+themselves.
+
+Old rows are pruned by prune_email_changes.py; a user's changes_start then
+moves up, and clients behind it get 410 and reload their mailbox.
+"""
+
+from typing import Dict, List, Tuple
+from datetime import datetime
+from sqlalchemy import select, delete, update, insert, func, case
+from sqlalchemy.orm import Session
+from models.email_change import EmailChange, CHANGE_INSERT
+from models.mailbox_counter import MailboxCounter
+
+# Changed emails per GET /emails/changes response, unless one version changed more
+CHANGES_PAGE_SIZE = 500
+
+
+def record_changes(connection, changes: List[Tuple[int, int, str]], versions: Dict[int, int]):
+    """Log (user_id, email_id, op) changes at the version apply_deltas gave each user"""
+    rows = [
+        {"user_id": user_id, "version": versions[user_id], "email_id": email_id, "op": op}
+        for user_id, email_id, op in changes
+    ]
+    if rows:
+        connection.execute(insert(EmailChange), rows)
+
+
+def changed_emails_query(user_id: int, since: int):
+    """(email_id, version, inserted) for each email changed after since, in version order"""
+    version = func.max(EmailChange.version)
+    return (
+        select(
+            EmailChange.email_id,
+            version.label("version"),
+            func.max(case((EmailChange.op == CHANGE_INSERT, 1), else_=0)).label("inserted"),
+        )
+        .filter(EmailChange.user_id == user_id, EmailChange.version > since)
+        .group_by(EmailChange.email_id)
+        .order_by(version, EmailChange.email_id)
+    )
+
+
+def prune_changes(db: Session, user_id: int, before: datetime) -> int:
+    """Drop a user's changes logged before a time and move changes_start past them (caller commits)"""
+    pruned_through = db.scalar(
+        select(func.max(EmailChange.version)).filter(EmailChange.user_id == user_id, EmailChange.created_at < before)
+    )
+    if pruned_through is None:
+        return 0
+
+    db.execute(
+        update(MailboxCounter)
+        .filter(MailboxCounter.user_id == user_id, MailboxCounter.changes_start < pruned_through)
+        .values(changes_start=pruned_through)
+    )
+    result = db.execute(
+        delete(EmailChange).filter(EmailChange.user_id == user_id, EmailChange.version <= pruned_through)
+    )
+    return result.rowcount
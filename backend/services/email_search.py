@@ -0,0 +1,73 @@
+"""
+Full-text search over emails
+
+Each email has a search_vector (tsvector) built at ingest from subject (weight
+A), sender (B), snippet (C) and body text (D); HTML-only mail is indexed by its
+visible text. Searches match the vector through its GIN index and fall back to
+trigram-indexed substring matches on sender and subject, ranked by ts_rank.
+"""
+
+import os
+from typing import Optional
+from sqlalchemy import func, cast, literal, or_
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from models.email import Email
+from services.text_extraction import html_to_text
+
+# Text search configuration used for both indexing and queries
+SEARCH_CONFIG = os.getenv("EMAIL_SEARCH_CONFIG", "english")
+
+# Body text indexed per email (a tsvector is capped at 1 MB)
+SEARCH_BODY_MAX_CHARS = int(os.getenv("EMAIL_SEARCH_BODY_MAX_CHARS", "100000"))
+
+
+def _config():
+    return cast(literal(SEARCH_CONFIG), REGCONFIG)
+
+
+def _weighted(text: Optional[str], weight: str):
+    return func.setweight(func.to_tsvector(_config(), text or ""), weight)
+
+
+def search_vector_for(
+    subject: Optional[str],
+    from_address: Optional[str],
+    snippet: Optional[str],
+    body_text: Optional[str],
+    body_html: Optional[str]
+):
+    """SQL expression computing an email's search_vector (assign it to the column before flush)"""
+    body = body_text or html_to_text(body_html or "")
+    return (
+        _weighted(subject, "A")
+        .op("||")(_weighted(from_address, "B"))
+        .op("||")(_weighted(snippet, "C"))
+        .op("||")(_weighted(body[:SEARCH_BODY_MAX_CHARS], "D"))
+    )
+
+
+def index_email(email: Email):
+    """Set search_vector on a new or changed Email"""
+    email.search_vector = search_vector_for(
+        email.subject, email.from_address, email.snippet, email.body_text, email.body_html
+    )
+
+
+def text_query(search: str):
+    """tsquery for user input (quotes, OR and -negation as in web search engines)"""
+    return func.websearch_to_tsquery(_config(), search)
+
+
+def text_match(search: str):
+    """Predicate: full-text match, or substring match on sender/subject (trigram indexes)"""
+    pattern = f"%{search}%"
+    return or_(
+        Email.search_vector.op("@@")(text_query(search)),
+        Email.from_address.ilike(pattern),
+        Email.subject.ilike(pattern)
+    )
+
+
+def text_rank(search: str):
+    """Relevance of an email for a search, for ORDER BY"""
+    return func.ts_rank(Email.search_vector, text_query(search))
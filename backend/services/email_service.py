@@ -1,15 +1,61 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, func, String
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, and_, or_, not_, desc, func
 from models.email import Email
+from models.email_label import SYSTEM_LABEL_BITS
 from models.user import User
+from services.body_store import BodyStore
+from services.email_search import index_email, text_match, text_rank
+from services.search_query import compile_search
+from services.labels import has_label, label_update, FLAG_LABELS
+from services.mailbox_counters import COUNTERS, TRACKED_COLUMNS, record_bulk_update  # also registers counter maintenance on flush
+from services.pagination import encode_cursor, decode_cursor, InvalidCursor
+from services.email_changes import changed_emails_query, CHANGES_PAGE_SIZE
+from services.gmail_outbox import queue_label_changes, queue_message_label_changes
+from models.mailbox_counter import MailboxCounter
+from models.email_change import EmailChange
+from database.explain import Explain, plan_of
+from services.token_broker import get_token_broker
+from services.http_client import get_http_client
 from typing import List, Tuple, Optional
 from datetime import datetime
-import httpx
 import base64
 import json
+import asyncio
+
+# Bulk action -> the system label it sets (True) or clears (False)
+BULK_ACTIONS = {
+    "read": ("UNREAD", False),
+    "unread": ("UNREAD", True),
+    "star": ("STARRED", True),
+    "unstar": ("STARRED", False),
+    "archive": ("INBOX", False),
+    "trash": ("TRASH", True),
+}
+
+# Emails changed per UPDATE and commit of a bulk action
+BULK_CHUNK_SIZE = 1000
+
+class EmailPage:
+    """One page of a mailbox listing"""
+
+    def __init__(self, emails: List[Email], total: Optional[int], next_cursor: Optional[str], total_is_estimate: bool = False):
+        self.emails = emails
+        self.total = total
+        self.next_cursor = next_cursor
+        self.total_is_estimate = total_is_estimate
+
+class EmailChanges:
+    """Emails changed after a mailbox version, as of version (continue from there)"""
+
+    def __init__(self, version: int, inserted: list, updated: list, deleted: List[int], has_more: bool):
+        self.version = version
+        self.inserted = inserted
+        self.updated = updated
+        self.deleted = deleted
+        self.has_more = has_more
 
 class EmailService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
     async def get_user_emails(
@@ -20,26 +66,132 @@ class EmailService:
         search: Optional[str] = None,
         label: Optional[str] = None,
         is_read: Optional[bool] = None,
-        is_starred: Optional[bool] = None
-    ) -> Tuple[List[Email], int]:
-        """Get paginated emails for a user with filters"""
-
-        query = self.db.query(Email).filter(Email.user_id == user_id)
-
-        # Apply filters
-        if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    Email.subject.ilike(search_term),
-                    Email.from_address.ilike(search_term),
-                    Email.snippet.ilike(search_term),
-                    Email.body_text.ilike(search_term)
-                )
+        is_starred: Optional[bool] = None,
+        account_id: Optional[int] = None,
+        cursor: Optional[str] = None,
+        count: str = "exact",
+        fields: Optional[List[str]] = None
+    ) -> EmailPage:
+        """Get a page of emails for a user with filters
+
+        Pages continue from cursor (the previous page's next_cursor) or, for
+        compatibility, from a page number. count is "exact", "estimate" (the
+        planner's row estimate unless a mailbox counter has the exact answer)
+        or "none". With fields, emails are plain row tuples of those columns in
+        that order (followed by id and sent_at, for the cursor, if not among
+        them) instead of Email objects.
+        """
+
+        query, ordering, keyset = self.list_query(user_id, search, label, is_read, is_starred, account_id)
+        if fields is not None:
+            columns = dict.fromkeys([*fields, "id", "sent_at"])
+            query = query.with_only_columns(*(getattr(Email, column) for column in columns))
+
+        total, estimated = None, False
+        if count != "none":
+            total, estimated = await self._count(query, count, user_id, search, label, is_read, is_starred, account_id)
+
+        offset = (page - 1) * per_page
+        if cursor:
+            position = decode_cursor(cursor)
+            if keyset and "t" in position and "i" in position:
+                offset = 0
+                query = query.filter(self._after(position))
+            elif not keyset and isinstance(position.get("o"), int) and position["o"] >= 0:
+                offset = position["o"]
+            else:
+                raise InvalidCursor("Cursor doesn't belong to this listing")
+
+        # One extra row tells whether there is a next page
+        query = query.order_by(*ordering).offset(offset).limit(per_page + 1)
+        result = await (self.db.execute(query) if fields is not None else self.db.scalars(query))
+        emails = result.all()
+
+        next_cursor = None
+        if len(emails) > per_page:
+            emails = emails[:per_page]
+            last = emails[-1]
+            next_cursor = encode_cursor(
+                {"t": last.sent_at.isoformat(), "i": last.id} if keyset else {"o": offset + per_page}
             )
 
+        return EmailPage(emails, total, next_cursor, estimated)
+
+    @staticmethod
+    def _after(position: dict):
+        """Keyset predicate: emails after (sent_at, id) in listing order
+
+        The redundant sent_at <= bound is what the index range scan starts from.
+        """
+        try:
+            sent_at = datetime.fromisoformat(position["t"])
+            email_id = int(position["i"])
+        except (TypeError, ValueError):
+            raise InvalidCursor("Invalid cursor")
+        return and_(
+            Email.sent_at <= sent_at,
+            or_(Email.sent_at < sent_at, Email.id < email_id)
+        )
+
+    async def _count(self, query, count: str, user_id: int, search, label, is_read, is_starred, account_id) -> Tuple[int, bool]:
+        """(total, is_estimate) for a listing"""
+
+        # Unfiltered listings and single-label views are exact counter reads
+        counter = self._counter_for(search, label, is_read, is_starred, account_id)
+        if counter:
+            row = await self.db.get(MailboxCounter, user_id)
+            return (getattr(row, counter) if row else 0), False
+
+        if count == "estimate" and self.db.get_bind().dialect.name == "postgresql":
+            plan = plan_of(await self.db.execute(Explain(query)))
+            return int(plan["Plan Rows"]), True
+
+        total = await self.db.scalar(select(func.count()).select_from(query.subquery()))
+        return total, False
+
+    @staticmethod
+    def _counter_for(search, label, is_read, is_starred, account_id) -> Optional[str]:
+        """mailbox_counters column holding the size of a listing, if any"""
+        if search or account_id is not None or is_read is True or is_starred is False:
+            return None
+        labels = {label} if label else set()
+        if is_read is False:
+            labels.add("UNREAD")
+        if is_starred:
+            labels.add("STARRED")
+        if len(labels) > 1:
+            return None
+        wanted = next(iter(labels), None)
+        return next((name for name, counted in COUNTERS.items() if counted == wanted), None)
+
+    @staticmethod
+    def list_query(
+        user_id: int,
+        search: Optional[str] = None,
+        label: Optional[str] = None,
+        is_read: Optional[bool] = None,
+        is_starred: Optional[bool] = None,
+        account_id: Optional[int] = None
+    ):
+        """Filtered email query, its ordering, and whether the ordering is the (sent_at, id) keyset
+
+        Listings are newest first; free-text searches are best match first.
+        """
+
+        query = select(Email).filter(Email.user_id == user_id)
+
+        if account_id is not None:
+            query = query.filter(Email.account_id == account_id)
+
+        # Apply filters: search operators become indexed predicates, the rest is full-text
+        compiled = compile_search(search) if search else None
+        if compiled:
+            query = query.filter(*compiled.filters)
+            if compiled.text:
+                query = query.filter(text_match(compiled.text))
+
         if label:
-            query = query.filter(func.cast(Email.labels, String).like(f'%"{label}"%'))
+            query = query.filter(has_label(label))
 
         if is_read is not None:
             query = query.filter(Email.is_read == is_read)
@@ -47,61 +199,118 @@ class EmailService:
         if is_starred is not None:
             query = query.filter(Email.is_starred == is_starred)
 
-        # Don't show trashed emails by default
-        query = query.filter(Email.is_trash == False)
-
-        # Get total count
-        total = query.count()
+        # Don't show trashed emails by default (in:trash / in:anywhere opt in)
+        if not (compiled and compiled.include_trash):
+            query = query.filter(Email.is_trash == False)
+
+        if compiled and compiled.text:
+            return query, [desc(text_rank(compiled.text)), desc(Email.sent_at), desc(Email.id)], False
+        return query, [desc(Email.sent_at), desc(Email.id)], True
+
+    async def get_changes(self, user_id: int, since: int, fields: List[str], limit: int = CHANGES_PAGE_SIZE) -> Optional[EmailChanges]:
+        """Emails inserted, updated or deleted after mailbox version since
+
+        Inserted and updated emails are row tuples of fields (as for listings),
+        deleted ones just IDs. Returns None when the change log can't continue
+        from since (pruned, or a version this mailbox never had): reload instead.
+        """
+        counter = await self.db.get(MailboxCounter, user_id)
+        version = counter.version if counter else 0
+        if since < (counter.changes_start if counter else 0) or since > version:
+            return None
+
+        # Versions are whole flushes: a page ends between versions, so the next one
+        # can continue from it, even if that takes more than limit emails
+        query = changed_emails_query(user_id, since)
+        changed = (await self.db.execute(query.limit(limit + 1))).all()
+        has_more = len(changed) > limit
+        if has_more:
+            last = changed[limit - 1].version
+            if changed[limit].version == last:
+                changed = (await self.db.execute(query.having(func.max(EmailChange.version) <= last))).all()
+            else:
+                changed = changed[:limit]
+            version = last
+
+        rows = {}
+        ids = [change.email_id for change in changed]
+        columns = dict.fromkeys([*fields, "id"])
+        for start in range(0, len(ids), CHANGES_PAGE_SIZE):
+            result = await self.db.execute(
+                select(*(getattr(Email, column) for column in columns))
+                .filter(Email.user_id == user_id, Email.id.in_(ids[start:start + CHANGES_PAGE_SIZE]))
+            )
+            rows.update((row.id, row) for row in result)
 
-        # Apply pagination and ordering
-        emails = query.order_by(desc(Email.sent_at)).offset((page - 1) * per_page).limit(per_page).all()
+        inserted, updated, deleted = [], [], []
+        for change in changed:
+            row = rows.get(change.email_id)
+            if row is None:
+                deleted.append(change.email_id)
+            else:
+                (inserted if change.inserted else updated).append(row)
 
-        return emails, total
+        return EmailChanges(version, inserted, updated, deleted, has_more)
 
     async def get_user_email(self, email_id: int, user_id: int) -> Optional[Email]:
         """Get a specific email for a user"""
-        return self.db.query(Email).filter(
-            and_(Email.id == email_id, Email.user_id == user_id)
-        ).first()
+        result = await self.db.scalars(
+            select(Email).filter(and_(Email.id == email_id, Email.user_id == user_id))
+        )
+        return result.first()
+
+    async def get_full_body(self, email: Email) -> Tuple[Optional[str], Optional[str]]:
+        """Get the untruncated text and HTML body, reading spilled bodies from disk"""
+        if not email.body_truncated:
+            return email.body_text, email.body_html
+
+        store = BodyStore()
+        body_text, body_html = await asyncio.gather(
+            asyncio.to_thread(store.read, email.gmail_id, "text"),
+            asyncio.to_thread(store.read, email.gmail_id, "html")
+        )
+
+        # Fall back to the database copy if a body was never spilled
+        return body_text or email.body_text, body_html or email.body_html
 
     async def mark_as_read(self, email_id: int, user_id: int) -> bool:
-        """Mark an email as read"""
+        """Mark an email as read (and in Gmail, through the outbox)"""
         email = await self.get_user_email(email_id, user_id)
         if not email:
             return False
 
-        email.is_read = True
-        self.db.commit()
-
-        # TODO: Also mark as read in Gmail via API
+        if not email.is_read:
+            email.is_read = True
+            await queue_label_changes(self.db, user_id, Email.id == email.id, remove_labels=["UNREAD"])
+        await self.db.commit()
         return True
 
     async def mark_as_unread(self, email_id: int, user_id: int) -> bool:
-        """Mark an email as unread"""
+        """Mark an email as unread (and in Gmail, through the outbox)"""
         email = await self.get_user_email(email_id, user_id)
         if not email:
             return False
 
-        email.is_read = False
-        self.db.commit()
-
-        # TODO: Also mark as unread in Gmail via API
+        if email.is_read:
+            email.is_read = False
+            await queue_label_changes(self.db, user_id, Email.id == email.id, add_labels=["UNREAD"])
+        await self.db.commit()
         return True
 
     async def delete_email(self, email_id: int, user_id: int) -> bool:
-        """Delete an email (move to trash)"""
+        """Delete an email (move to trash, and in Gmail through the outbox)"""
         email = await self.get_user_email(email_id, user_id)
         if not email:
             return False
 
-        email.is_trash = True
-        self.db.commit()
-
-        # TODO: Also delete in Gmail via API
+        if not email.is_trash:
+            email.is_trash = True
+            await queue_label_changes(self.db, user_id, Email.id == email.id, add_labels=["TRASH"])
+        await self.db.commit()
         return True
 
     async def archive_email(self, email_id: int, user_id: int) -> bool:
-        """Archive an email"""
+        """Archive an email (and in Gmail, through the outbox)"""
         email = await self.get_user_email(email_id, user_id)
         if not email:
             return False
@@ -109,14 +318,13 @@ class EmailService:
         # Remove INBOX label and add archive behavior
         if email.labels and "INBOX" in email.labels:
             email.labels = [label for label in email.labels if label != "INBOX"]
+            await queue_label_changes(self.db, user_id, Email.id == email.id, remove_labels=["INBOX"])
 
-        self.db.commit()
-
-        # TODO: Also archive in Gmail via API
+        await self.db.commit()
         return True
 
     async def star_email(self, email_id: int, user_id: int) -> bool:
-        """Star an email and sync with Gmail"""
+        """Star an email (and in Gmail, through the outbox)"""
         email = await self.get_user_email(email_id, user_id)
         if not email:
             return False
@@ -125,24 +333,15 @@ class EmailService:
         email.is_starred = True
 
         # Add STARRED label to labels array if not present
-        if email.labels and "STARRED" not in email.labels:
-            email.labels.append("STARRED")
-        elif not email.labels:
-            email.labels = ["STARRED"]
-
-        self.db.commit()
-
-        # Sync with Gmail API
-        try:
-            await self._modify_gmail_labels(email.gmail_id, user_id, add_labels=["STARRED"])
-        except Exception as e:
-            print(f"Failed to star email in Gmail: {str(e)}")
-            # Don't fail the local operation if Gmail sync fails
+        if "STARRED" not in (email.labels or []):
+            email.labels = (email.labels or []) + ["STARRED"]
+            await queue_label_changes(self.db, user_id, Email.id == email.id, add_labels=["STARRED"])
 
+        await self.db.commit()
         return True
 
     async def unstar_email(self, email_id: int, user_id: int) -> bool:
-        """Unstar an email and sync with Gmail"""
+        """Unstar an email (and in Gmail, through the outbox)"""
         email = await self.get_user_email(email_id, user_id)
         if not email:
             return False
@@ -153,56 +352,73 @@ class EmailService:
         # Remove STARRED label from labels array
         if email.labels and "STARRED" in email.labels:
             email.labels = [label for label in email.labels if label != "STARRED"]
+            await queue_label_changes(self.db, user_id, Email.id == email.id, remove_labels=["STARRED"])
 
-        self.db.commit()
-
-        # Sync with Gmail API
-        try:
-            await self._modify_gmail_labels(email.gmail_id, user_id, remove_labels=["STARRED"])
-        except Exception as e:
-            print(f"Failed to unstar email in Gmail: {str(e)}")
-            # Don't fail the local operation if Gmail sync fails
-
+        await self.db.commit()
         return True
 
-    async def _modify_gmail_labels(
-        self,
-        gmail_id: str,
-        user_id: int,
-        add_labels: Optional[List[str]] = None,
-        remove_labels: Optional[List[str]] = None
-    ) -> bool:
-        """Modify Gmail labels for an email using Gmail API"""
-
-        # Get user's access token
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user or not user.google_access_token:
-            raise ValueError("User not found or no access token")
-
-        # Prepare request payload
-        payload = {}
-        if add_labels:
-            payload["addLabelIds"] = add_labels
-        if remove_labels:
-            payload["removeLabelIds"] = remove_labels
-
-        if not payload:
-            return True  # Nothing to do
-
-        # Call Gmail API
-        url = f"https://gmail.googleapis.com/gmail/v1/users/me/messages/{gmail_id}/modify"
-        headers = {
-            "Authorization": f"Bearer {user.google_access_token}",
-            "Content-Type": "application/json"
-        }
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, json=payload)
+    async def bulk_update(self, user_id: int, action: str, target) -> Tuple[int, int]:
+        """Apply a BULK_ACTIONS action to the user's emails matching target
+
+        Matching emails are updated in id order, BULK_CHUNK_SIZE per UPDATE and
+        commit, so a filter covering a whole mailbox never holds one long
+        transaction or loads every row at once. Emails already in the action's
+        state aren't touched. The UPDATE bypasses the flush hook, so counters,
+        change log and mailbox events are recorded from its RETURNING rows, as
+        are the Gmail label changes. Returns (emails changed, Gmail label
+        changes queued).
+        """
+        label, present = BULK_ACTIONS[action]
+        bit = SYSTEM_LABEL_BITS[label]
+        flag = FLAG_LABELS.get(label)
+        needs_change = not_(has_label(label)) if present else has_label(label)
+
+        total_updated = total_queued = 0
+        last_id = 0
+        while True:
+            ids = (await self.db.scalars(
+                select(Email.id)
+                .where(Email.user_id == user_id, target, needs_change, Email.id > last_id)
+                .order_by(Email.id)
+                .limit(BULK_CHUNK_SIZE)
+            )).all()
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            result = await self.db.execute(
+                update(Email)
+                .where(Email.id.in_(ids), needs_change)
+                .values(**label_update(label, present))
+                .returning(Email.id, Email.account_id, Email.gmail_id, *(getattr(Email, column) for column in TRACKED_COLUMNS))
+                .execution_options(synchronize_session=False)
+            )
+            rows = result.all()
+
+            updated = []
+            for row in rows:
+                current = {column: getattr(row, column) for column in TRACKED_COLUMNS}
+                # Only the label changed: its bit and, for flag labels, the flag went the other way
+                previous = {**current, "system_labels": current["system_labels"] ^ bit}
+                if flag:
+                    previous[flag[0]] = not current[flag[0]]
+                updated.append((row.id, previous, current))
+            await self.db.run_sync(record_bulk_update, updated)
+
+            total_queued += await queue_message_label_changes(
+                self.db,
+                user_id,
+                [(row.account_id, row.gmail_id) for row in rows],
+                add_labels=[label] if present else [],
+                remove_labels=[] if present else [label]
+            )
+            await self.db.commit()
+            total_updated += len(rows)
 
-        if response.status_code != 200:
-            raise Exception(f"Failed to modify Gmail labels: {response.text}")
+            if len(ids) < BULK_CHUNK_SIZE:
+                break
 
-        return True
+        return total_updated, total_queued
 
     async def send_email(
         self,
@@ -216,10 +432,12 @@ class EmailService:
     ) -> str:
         """Send an email via Gmail API"""
 
-        # Get user's access token
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user or not user.google_access_token:
-            raise ValueError("User not found or no access token")
+        user = await self.db.get(User, user_id)
+        if not user:
+            raise ValueError("User not found")
+
+        # Get user's access token (cached, refreshed by the broker if needed)
+        access_token = await get_token_broker().get_user_token(user_id)
 
         # Construct email message
         message = self._create_email_message(
@@ -235,7 +453,7 @@ class EmailService:
         # Send via Gmail API
         url = "https://gmail.googleapis.com/gmail/v1/users/me/messages/send"
         headers = {
-            "Authorization": f"Bearer {user.google_access_token}",
+            "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
         }
 
@@ -243,8 +461,7 @@ class EmailService:
             "raw": base64.urlsafe_b64encode(message.encode()).decode()
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, json=payload)
+        response = await get_http_client().post(url, headers=headers, json=payload)
 
         if response.status_code != 200:
             raise Exception(f"Failed to send email: {response.text}")
@@ -268,8 +485,9 @@ class EmailService:
             sent_at=datetime.utcnow()
         )
 
+        index_email(sent_email)
         self.db.add(sent_email)
-        self.db.commit()
+        await self.db.commit()
 
         return message_id
 
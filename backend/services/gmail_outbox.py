@@ -0,0 +1,379 @@
+"""
+Write-behind propagation of mailbox actions to Gmail
+
+Marking read, starring, archiving or trashing an email changes the local row
+and queues the matching Gmail label change in gmail_outbox in the same
+transaction, so the request costs one local write and the change still
+reaches Gmail if the process dies right after the commit. A flusher in each
+API process then sends the queue:
+  * a user's entries are read in order and coalesced per message, the last
+    change to each label winning (star then unstar sends one unstar)
+  * messages needing the same labels added and removed share one
+    messages.batchModify call of up to 1000 IDs
+  * calls failing with a rate limit, server, auth or network error are
+    retried with exponential backoff and dropped after
+    GMAIL_OUTBOX_MAX_ATTEMPTS; a batch Gmail rejects (another 4xx, e.g. a
+    message deleted since) is bisected so only the rejected messages'
+    entries are dropped
+  * setting labels is idempotent, so resending entries after a crash
+    mid-flush is harmless
+A flusher leases a user's entries in a short transaction (under a PostgreSQL
+advisory lock) and no other flusher takes that user's entries while the
+lease lasts, so no process sends an older change after another sent a newer
+one. No transaction is held during the Gmail calls; each batch's outcome is
+recorded in its own.
+Only Gmail-backed emails are queued; Outlook and IMAP mailboxes aren't
+written back.
+"""
+
+import asyncio
+import os
+import weakref
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import select, insert, update, delete, func, or_, literal, JSON
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.connection import AsyncSessionLocal
+from models.email import Email
+from models.connected_account import ConnectedAccount
+from models.gmail_outbox import GmailOutbox
+from services.token_broker import get_token_broker, invalidate_cached_token
+from services.http_client import get_http_client
+
+# ConnectedAccount providers backed by the Gmail API (as in sync_worker.py)
+GMAIL_PROVIDERS = ("gmail", "google")
+
+BATCH_MODIFY_URL = "https://gmail.googleapis.com/gmail/v1/users/me/messages/batchModify"
+# Gmail's limit on message IDs per batchModify call
+BATCH_MODIFY_MAX_IDS = 1000
+
+# How often the queue is checked; changes made within one interval are coalesced
+GMAIL_OUTBOX_FLUSH_SECONDS = float(os.getenv("GMAIL_OUTBOX_FLUSH_SECONDS", "2"))
+GMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("GMAIL_OUTBOX_MAX_ATTEMPTS", "8"))
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+# How long a flusher may spend sending the entries it leased
+GMAIL_OUTBOX_LEASE_SECONDS = int(os.getenv("GMAIL_OUTBOX_LEASE_SECONDS", "300"))
+
+USERS_PER_FLUSH = 100
+ENTRIES_PER_USER = 10000
+
+# First key of the per-user advisory lock taken while leasing (the second is the user ID)
+OUTBOX_LOCK_KEY = 4917
+
+# (account_id, labels to add, labels to remove) shared by a batchModify call
+BatchKey = Tuple[Optional[int], Tuple[str, ...], Tuple[str, ...]]
+
+
+async def queue_label_changes(
+    db: AsyncSession,
+    user_id: int,
+    email_filter,
+    add_labels: Sequence[str] = (),
+    remove_labels: Sequence[str] = ()
+) -> int:
+    """Queue a Gmail label change for the user's Gmail-backed emails matching email_filter (caller commits)"""
+    source = (
+        select(
+            Email.user_id,
+            Email.account_id,
+            Email.gmail_id,
+            literal(list(add_labels), JSON),
+            literal(list(remove_labels), JSON),
+        )
+        .outerjoin(ConnectedAccount, ConnectedAccount.id == Email.account_id)
+        .filter(
+            Email.user_id == user_id,
+            email_filter,
+            or_(Email.account_id.is_(None), ConnectedAccount.provider.in_(GMAIL_PROVIDERS)),
+        )
+    )
+    result = await db.execute(
+        insert(GmailOutbox).from_select(
+            ["user_id", "account_id", "gmail_id", "add_labels", "remove_labels"], source
+        )
+    )
+    return result.rowcount
+
+
+async def queue_message_label_changes(
+    db: AsyncSession,
+    user_id: int,
+    messages: List[Tuple[Optional[int], str]],
+    add_labels: Sequence[str] = (),
+    remove_labels: Sequence[str] = ()
+) -> int:
+    """Queue a Gmail label change for a user's (account_id, gmail_id) messages (caller commits)
+
+    For emails a bulk UPDATE just returned; messages of non-Gmail accounts are skipped.
+    """
+    gmail_accounts = set((await db.scalars(
+        select(ConnectedAccount.id)
+        .filter(ConnectedAccount.user_id == user_id, ConnectedAccount.provider.in_(GMAIL_PROVIDERS))
+    )).all())
+    rows = [
+        {
+            "user_id": user_id,
+            "account_id": account_id,
+            "gmail_id": gmail_id,
+            "add_labels": list(add_labels),
+            "remove_labels": list(remove_labels),
+        }
+        for account_id, gmail_id in messages
+        if account_id is None or account_id in gmail_accounts
+    ]
+    if rows:
+        await db.execute(insert(GmailOutbox), rows)
+    return len(rows)
+
+
+def coalesce(entries: List[GmailOutbox]) -> Dict[BatchKey, Dict[str, List[GmailOutbox]]]:
+    """Group entries (in queue order) by the net label change of their message
+
+    Returns {(account_id, add, remove): {gmail_id: entries}}.
+    """
+    states: Dict[Tuple[Optional[int], str], Dict[str, bool]] = {}
+    queued: Dict[Tuple[Optional[int], str], List[GmailOutbox]] = {}
+    for entry in entries:
+        message = (entry.account_id, entry.gmail_id)
+        state = states.setdefault(message, {})
+        for label in entry.add_labels:
+            state[label] = True
+        for label in entry.remove_labels:
+            state[label] = False
+        queued.setdefault(message, []).append(entry)
+
+    batches: Dict[BatchKey, Dict[str, List[GmailOutbox]]] = {}
+    for (account_id, gmail_id), state in states.items():
+        add = tuple(sorted(label for label, present in state.items() if present))
+        remove = tuple(sorted(label for label, present in state.items() if not present))
+        batches.setdefault((account_id, add, remove), {})[gmail_id] = queued[(account_id, gmail_id)]
+    return batches
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def is_retryable(status_code: int) -> bool:
+    # Rate limits (Gmail also uses 403 for them), server errors and auth failures
+    # (the token is reloaded, or the user reconnects the account) may pass later;
+    # any other 4xx is Gmail rejecting the request itself
+    return status_code in (401, 403, 408, 429) or status_code >= 500
+
+
+class GmailOutboxFlusher:
+    """Sends queued label changes to Gmail from the running event loop"""
+
+    def __init__(self):
+        self.flush_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.ensure_future(self.flush_loop())
+
+    async def stop(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(GMAIL_OUTBOX_FLUSH_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️  Gmail outbox flush failed: {str(e)}")
+
+    async def flush(self):
+        """Send the entries of users with entries due, oldest first"""
+        async with AsyncSessionLocal() as db:
+            user_ids = (await db.scalars(
+                select(GmailOutbox.user_id)
+                .filter(GmailOutbox.next_attempt_at <= datetime.now(timezone.utc))
+                .group_by(GmailOutbox.user_id)
+                .order_by(func.min(GmailOutbox.id))
+                .limit(USERS_PER_FLUSH)
+            )).all()
+            await db.rollback()
+
+            for user_id in user_ids:
+                try:
+                    await self.flush_user(db, user_id)
+                except Exception as e:
+                    await db.rollback()
+                    print(f"⚠️  Gmail outbox flush failed for user {user_id}: {str(e)}")
+
+    async def flush_user(self, db: AsyncSession, user_id: int):
+        """Send all of a user's entries, retries not yet due included, so newer changes supersede them"""
+        entries, lease = await self.lease(db, user_id)
+        if not entries:
+            return
+
+        try:
+            for (account_id, add, remove), messages in coalesce(entries).items():
+                gmail_ids = list(messages)
+                for start in range(0, len(gmail_ids), BATCH_MODIFY_MAX_IDS):
+                    if datetime.now(timezone.utc) >= lease:
+                        # Another flusher may have leased the rest by now
+                        return
+                    chunk = gmail_ids[start:start + BATCH_MODIFY_MAX_IDS]
+                    results = [(chunk, None, False)]
+                    if add or remove:
+                        results = await self.modify(user_id, account_id, chunk, add, remove)
+
+                    for part, error, retryable in results:
+                        part_entries = [entry for gmail_id in part for entry in messages[gmail_id]]
+                        if error is None:
+                            await db.execute(
+                                delete(GmailOutbox).filter(GmailOutbox.id.in_([entry.id for entry in part_entries]))
+                            )
+                        elif retryable:
+                            await self.retry_later(db, user_id, part_entries, error)
+                        else:
+                            await self.reject(db, user_id, part_entries, error)
+                    await db.commit()
+        finally:
+            # Whatever wasn't sent is due again (retries keep their next_attempt_at)
+            await db.rollback()
+            await db.execute(
+                update(GmailOutbox)
+                .filter(GmailOutbox.user_id == user_id, GmailOutbox.leased_until == lease)
+                .values(leased_until=None)
+            )
+            await db.commit()
+
+    async def lease(self, db: AsyncSession, user_id: int) -> Tuple[List[GmailOutbox], Optional[datetime]]:
+        """Lease the user's oldest entries to this flusher and commit; none if another holds a lease
+
+        Returns the entries in queue order and when the lease expires.
+        """
+        now = datetime.now(timezone.utc)
+        connection = await db.connection()
+        if connection.dialect.name == "postgresql":
+            # Held until the commit below; another process is leasing this user's entries otherwise
+            locked = await db.scalar(select(func.pg_try_advisory_xact_lock(OUTBOX_LOCK_KEY, user_id)))
+            if not locked:
+                await db.rollback()
+                return [], None
+
+        leased = await db.scalar(
+            select(GmailOutbox.id)
+            .filter(GmailOutbox.user_id == user_id, GmailOutbox.leased_until > now)
+            .limit(1)
+        )
+        if leased is not None:
+            await db.rollback()
+            return [], None
+
+        entries = (await db.scalars(
+            select(GmailOutbox)
+            .filter(GmailOutbox.user_id == user_id)
+            .order_by(GmailOutbox.id)
+            .limit(ENTRIES_PER_USER)
+        )).all()
+        lease = now + timedelta(seconds=GMAIL_OUTBOX_LEASE_SECONDS)
+        if entries:
+            await db.execute(
+                update(GmailOutbox)
+                .filter(GmailOutbox.user_id == user_id, GmailOutbox.id <= entries[-1].id)
+                .values(leased_until=lease)
+                .execution_options(synchronize_session=False)
+            )
+        await db.commit()
+        return entries, lease
+
+    async def modify(
+        self,
+        user_id: int,
+        account_id: Optional[int],
+        gmail_ids: List[str],
+        add: Tuple[str, ...],
+        remove: Tuple[str, ...]
+    ) -> List[Tuple[List[str], Optional[str], bool]]:
+        """Apply one label change, bisecting a rejected batch down to the messages Gmail rejects
+
+        Returns (gmail_ids, error, retryable) for each part of the batch; error is None for parts applied.
+        """
+        error, retryable = await self.batch_modify(user_id, account_id, gmail_ids, add, remove)
+        if error is None or retryable or len(gmail_ids) == 1:
+            return [(gmail_ids, error, retryable)]
+
+        middle = len(gmail_ids) // 2
+        return (
+            await self.modify(user_id, account_id, gmail_ids[:middle], add, remove)
+            + await self.modify(user_id, account_id, gmail_ids[middle:], add, remove)
+        )
+
+    async def batch_modify(
+        self,
+        user_id: int,
+        account_id: Optional[int],
+        gmail_ids: List[str],
+        add: Tuple[str, ...],
+        remove: Tuple[str, ...]
+    ) -> Tuple[Optional[str], bool]:
+        """Apply one label change to messages in Gmail; returns the error, if any, and whether to retry it"""
+        broker = get_token_broker()
+        try:
+            if account_id:
+                access_token = await broker.get_account_token(account_id)
+            else:
+                access_token = await broker.get_user_token(user_id)
+
+            response = await get_http_client().post(
+                BATCH_MODIFY_URL,
+                headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"},
+                json={"ids": gmail_ids, "addLabelIds": list(add), "removeLabelIds": list(remove)}
+            )
+        except Exception as e:
+            return str(e), True
+
+        if response.status_code == 401:
+            # Revoked or rotated elsewhere: load it again on the next attempt
+            invalidate_cached_token("account" if account_id else "user", account_id or user_id)
+        if response.status_code >= 300:
+            return f"{response.status_code} - {response.text[:500]}", is_retryable(response.status_code)
+        return None, False
+
+    async def retry_later(self, db: AsyncSession, user_id: int, entries: List[GmailOutbox], error: str):
+        attempts = max(entry.attempts for entry in entries) + 1
+        ids = [entry.id for entry in entries]
+
+        if attempts >= GMAIL_OUTBOX_MAX_ATTEMPTS:
+            print(f"❌ Dropping {len(ids)} Gmail label changes for user {user_id} after {attempts} attempts: {error}")
+            await db.execute(delete(GmailOutbox).filter(GmailOutbox.id.in_(ids)))
+            return
+
+        print(f"⚠️  Gmail label changes for user {user_id} failed (attempt {attempts}), retrying: {error}")
+        await db.execute(
+            update(GmailOutbox)
+            .filter(GmailOutbox.id.in_(ids))
+            .values(
+                attempts=attempts,
+                next_attempt_at=datetime.now(timezone.utc) + retry_delay(attempts),
+                last_error=error
+            )
+        )
+
+    async def reject(self, db: AsyncSession, user_id: int, entries: List[GmailOutbox], error: str):
+        gmail_ids = sorted(set(entry.gmail_id for entry in entries))
+        print(f"❌ Gmail rejected label changes for user {user_id} on {', '.join(gmail_ids)}, dropping them: {error}")
+        await db.execute(delete(GmailOutbox).filter(GmailOutbox.id.in_([entry.id for entry in entries])))
+
+
+_flushers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, GmailOutboxFlusher]" = weakref.WeakKeyDictionary()
+
+
+def get_outbox_flusher() -> GmailOutboxFlusher:
+    """Get the flusher for the running event loop"""
+    loop = asyncio.get_running_loop()
+    flusher = _flushers.get(loop)
+    if flusher is None:
+        flusher = GmailOutboxFlusher()
+        _flushers[loop] = flusher
+    return flusher
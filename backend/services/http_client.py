@@ -0,0 +1,35 @@
+"""
+Shared outbound HTTP client
+
+One httpx.AsyncClient per event loop, so connections to Google/Microsoft are
+pooled instead of being re-established for every call. The API process and
+the sync worker each run their own loop; manual syncs started from the API run
+on a separate loop in a worker thread and get their own client.
+"""
+
+import asyncio
+import weakref
+import httpx
+
+# Defaults for every outbound call; individual calls may pass their own timeout
+HTTP_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the shared client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+        _clients[loop] = client
+    return client
+
+
+async def close_http_client():
+    """Close the running loop's client (call on shutdown)"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
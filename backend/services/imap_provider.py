@@ -0,0 +1,622 @@
+"""
+IMAP mailbox provider
+
+Talks IMAP4rev1 directly over asyncio streams so the sync worker never blocks:
+  * new mail is fetched by UID ranges, with several UID FETCH commands
+    pipelined on the connection before any response is read
+  * with CONDSTORE, flag changes since the last sync come from
+    UID FETCH ... (CHANGEDSINCE modseq); with QRESYNC the SELECT itself
+    reports changed flags and VANISHED (expunged) UIDs
+  * IDLE holds a connection open and returns as soon as the server reports
+    new or expunged messages
+
+The cursor stored in SyncState.last_sync_token is JSON:
+{"uidvalidity": ..., "last_uid": ..., "modseq": ...}. Provider message IDs
+are "imap:<account_id>:<uidvalidity>:<uid>".
+"""
+
+import asyncio
+import ipaddress
+import json
+import os
+import re
+import socket
+import ssl
+from datetime import datetime, timezone
+from email import message_from_bytes, policy
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from services.body_parser import BoundedBody, BODY_MAX_BYTES
+from services.body_store import BodyStore
+from services.mail_provider import MailProvider, SyncBatch, KnownIdsLookup, CursorExpired
+
+load_dotenv()
+
+# UIDs per UID FETCH command and how many commands are pipelined at once
+FETCH_BATCH_SIZE = int(os.getenv("IMAP_FETCH_BATCH_SIZE", "100"))
+PIPELINE_DEPTH = int(os.getenv("IMAP_PIPELINE_DEPTH", "4"))
+
+# Servers may drop IDLE after 30 minutes (RFC 2177); re-issue before that
+IDLE_TIMEOUT_SECONDS = int(os.getenv("IMAP_IDLE_TIMEOUT_SECONDS", str(25 * 60)))
+
+COMMAND_TIMEOUT_SECONDS = 60
+
+# Connections without TLS (port 143) are upgraded with STARTTLS; a server that
+# doesn't offer it only gets the password in cleartext if this is set
+ALLOW_PLAINTEXT_LOGIN = os.getenv("IMAP_ALLOW_PLAINTEXT_LOGIN", "false").lower() == "true"
+
+# Users choose the server, so only public addresses on the IMAP ports are
+# contacted; otherwise an account could point the API and sync worker at
+# internal services. Set for self-hosted servers on a private network
+IMAP_PORTS = (993, 143)
+ALLOW_PRIVATE_HOSTS = os.getenv("IMAP_ALLOW_PRIVATE_HOSTS", "false").lower() == "true"
+
+LITERAL_RE = re.compile(rb"\{(\d+)\+?\}\r\n$")
+
+
+class ImapError(Exception):
+    pass
+
+
+class InsecureConnection(ImapError):
+    """The server offers no TLS and plaintext login isn't allowed"""
+
+
+class ForbiddenHost(ImapError):
+    """The server isn't on a public address and IMAP port"""
+
+
+async def resolve_public_address(host: str, port: int) -> str:
+    """Resolve host to the address to connect to, refusing non-public addresses and ports
+
+    Connecting to the checked address (not the name again) keeps a second
+    lookup from answering differently.
+    """
+    if port not in IMAP_PORTS:
+        raise ForbiddenHost(f"IMAP port {port} isn't allowed")
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    addresses = [info[4][0] for info in infos]
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise ForbiddenHost(f"{host} resolves to non-public address {address}")
+    if not addresses:
+        raise ForbiddenHost(f"{host} doesn't resolve")
+    return addresses[0]
+
+
+def quote(value: str) -> str:
+    """Quote a string argument for an IMAP command"""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def uid_set(uids: List[int]) -> str:
+    """Compress sorted UIDs into an IMAP sequence set like "1:3,7,9:12" """
+    ranges = []
+    for uid in sorted(uids):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+
+def parse_uid_set(value: str) -> List[int]:
+    """Expand an IMAP sequence set (as returned by VANISHED) into UIDs"""
+    uids = []
+    for part in value.split(","):
+        if ":" in part:
+            a, b = (int(x) for x in part.split(":"))
+            uids.extend(range(min(a, b), max(a, b) + 1))
+        elif part:
+            uids.append(int(part))
+    return uids
+
+
+def tokenize(parts: List[bytes]):
+    """Tokenize a response made of text parts interleaved with literals
+
+    parts alternates text, literal, text, ...; literals become single tokens.
+    """
+    for index, part in enumerate(parts):
+        if index % 2:
+            yield part
+            continue
+
+        pos = 0
+        while pos < len(part):
+            char = part[pos:pos + 1]
+            if char in (b" ", b"\r", b"\n"):
+                pos += 1
+            elif char in (b"(", b")"):
+                yield char
+                pos += 1
+            elif char == b'"':
+                end = pos + 1
+                value = bytearray()
+                while part[end:end + 1] != b'"':
+                    if part[end:end + 1] == b"\\":
+                        end += 1
+                    value += part[end:end + 1]
+                    end += 1
+                yield bytes(value)
+                pos = end + 1
+            elif char == b"{":
+                # Literal marker; the literal itself is the next part
+                pos = part.index(b"}", pos) + 1
+            else:
+                end = pos
+                depth = 0
+                while end < len(part):
+                    c = part[end:end + 1]
+                    if c == b"[":
+                        depth += 1
+                    elif c == b"]":
+                        depth -= 1
+                    elif depth == 0 and c in (b" ", b"(", b")", b"\r", b"\n"):
+                        break
+                    end += 1
+                yield part[pos:end]
+                pos = end
+
+
+def parse_tokens(tokens) -> list:
+    """Nest tokens into lists following parentheses"""
+    stack = [[]]
+    for token in tokens:
+        if token == b"(":
+            stack.append([])
+        elif token == b")":
+            if len(stack) > 1:
+                done = stack.pop()
+                stack[-1].append(done)
+        else:
+            stack[-1].append(token)
+    return stack[0]
+
+
+def parse_fetch_items(items: list) -> dict:
+    """Turn a FETCH attribute list into a dict keyed by upper-case attribute name"""
+    result = {}
+    for i in range(0, len(items) - 1, 2):
+        key = items[i].decode(errors="ignore").upper() if isinstance(items[i], bytes) else str(items[i])
+        # BODY[]<0> -> BODY[]
+        key = re.sub(r"<\d+>$", "", key.replace("BODY.PEEK", "BODY"))
+        result[key] = items[i + 1]
+    return result
+
+
+class ImapConnection:
+    """Minimal async IMAP4rev1 client with command pipelining and IDLE"""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        use_ssl: bool = True,
+        allow_plaintext: bool = ALLOW_PLAINTEXT_LOGIN,
+        allow_private_hosts: bool = ALLOW_PRIVATE_HOSTS
+    ):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.allow_plaintext = allow_plaintext
+        self.allow_private_hosts = allow_private_hosts
+        self.secure = use_ssl
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.tag_counter = 0
+        self.capabilities = set()
+
+    async def connect(self):
+        address = self.host
+        if not self.allow_private_hosts:
+            address = await resolve_public_address(self.host, self.port)
+
+        ssl_context = ssl.create_default_context() if self.use_ssl else None
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                address, self.port, ssl=ssl_context, server_hostname=self.host if ssl_context else None
+            ),
+            COMMAND_TIMEOUT_SECONDS
+        )
+        greeting = await self.read_response()
+        if not greeting[0].startswith(b"* OK") and not greeting[0].startswith(b"* PREAUTH"):
+            raise ImapError(f"Unexpected IMAP greeting: {greeting[0][:100]!r}")
+
+        if not self.use_ssl:
+            await self.read_capabilities()
+            if self.supports("STARTTLS"):
+                await self.starttls()
+
+    async def starttls(self):
+        """Upgrade the plain connection to TLS (RFC 3501 6.2.1)"""
+        await self.command("STARTTLS")
+        await self.writer.start_tls(ssl.create_default_context(), server_hostname=self.host)
+        self.secure = True
+        # Capabilities from before the handshake can't be trusted
+        self.capabilities = set()
+
+    async def read_capabilities(self):
+        for response in await self.command("CAPABILITY"):
+            if response[0].upper().startswith(b"* CAPABILITY"):
+                self.capabilities = set(response[0].decode().upper().split()[2:])
+
+    async def read_response(self) -> List[bytes]:
+        """Read one response line plus any literals it announces"""
+        parts = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ImapError("IMAP connection closed")
+            match = LITERAL_RE.search(line)
+            parts.append(line)
+            if not match:
+                return parts
+            parts.append(await self.reader.readexactly(int(match.group(1))))
+
+    def next_tag(self) -> str:
+        self.tag_counter += 1
+        return f"A{self.tag_counter:04d}"
+
+    async def send(self, command: str) -> str:
+        tag = self.next_tag()
+        self.writer.write(f"{tag} {command}\r\n".encode())
+        return tag
+
+    async def pipeline(self, commands: List[str]) -> List[List[bytes]]:
+        """Send several commands before reading any response
+
+        Returns all untagged responses; raises if any command fails.
+        """
+        tags = [await self.send(command) for command in commands]
+        await self.writer.drain()
+
+        pending = set(tags)
+        untagged = []
+        while pending:
+            response = await asyncio.wait_for(self.read_response(), COMMAND_TIMEOUT_SECONDS)
+            first = response[0]
+            if first.startswith(b"* "):
+                untagged.append(response)
+                continue
+            tag = first.split(b" ", 1)[0].decode()
+            if tag in pending:
+                pending.discard(tag)
+                status = first.split(b" ", 2)[1] if b" " in first else b""
+                if status != b"OK":
+                    raise ImapError(f"IMAP command failed: {first.decode(errors='ignore').strip()}")
+        return untagged
+
+    async def command(self, command: str) -> List[List[bytes]]:
+        return await self.pipeline([command])
+
+    async def login(self, username: str, password: str):
+        if not self.secure and not self.allow_plaintext:
+            raise InsecureConnection(
+                f"{self.host}:{self.port} offers no TLS (STARTTLS); refusing to send the password in cleartext"
+            )
+        await self.command(f"LOGIN {quote(username)} {quote(password)}")
+        await self.read_capabilities()
+
+    def supports(self, capability: str) -> bool:
+        return capability.upper() in self.capabilities
+
+    async def idle(self, timeout: float) -> bool:
+        """Wait in IDLE until the mailbox changes or timeout passes
+
+        Returns True if the server reported new, expunged or changed messages.
+        """
+        tag = await self.send("IDLE")
+        await self.writer.drain()
+
+        response = await asyncio.wait_for(self.read_response(), COMMAND_TIMEOUT_SECONDS)
+        if not response[0].startswith(b"+"):
+            raise ImapError(f"IDLE rejected: {response[0].decode(errors='ignore').strip()}")
+
+        changed = False
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            while not changed:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    response = await asyncio.wait_for(self.read_response(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                words = response[0].upper().split()
+                if (len(words) >= 3 and words[2] in (b"EXISTS", b"EXPUNGE", b"FETCH")) or b"VANISHED" in words:
+                    changed = True
+        finally:
+            self.writer.write(b"DONE\r\n")
+            await self.writer.drain()
+            while True:
+                response = await asyncio.wait_for(self.read_response(), COMMAND_TIMEOUT_SECONDS)
+                if response[0].startswith(tag.encode()):
+                    break
+
+        return changed
+
+    async def logout(self):
+        if not self.writer:
+            return
+        try:
+            await asyncio.wait_for(self.command("LOGOUT"), 5)
+        except Exception:
+            pass
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+        self.writer = None
+
+
+class ImapProvider(MailProvider):
+    provider = "imap"
+
+    def __init__(
+        self,
+        account_id: int,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        use_ssl: Optional[bool] = None,
+        mailbox: str = "INBOX",
+        body_store: Optional[BodyStore] = None,
+        allow_plaintext: bool = ALLOW_PLAINTEXT_LOGIN,
+        allow_private_hosts: bool = ALLOW_PRIVATE_HOSTS
+    ):
+        self.account_id = account_id
+        self.username = username
+        self.password = password
+        self.mailbox = mailbox
+        self.body_store = body_store
+        self.connection = ImapConnection(
+            host, port, port != 143 if use_ssl is None else use_ssl, allow_plaintext, allow_private_hosts
+        )
+
+    def message_id(self, uidvalidity: int, uid: int) -> str:
+        return f"imap:{self.account_id}:{uidvalidity}:{uid}"
+
+    async def open(self):
+        await self.connection.connect()
+        await self.connection.login(self.username, self.password)
+        if self.connection.supports("QRESYNC"):
+            await self.connection.command("ENABLE QRESYNC")
+
+    async def select(self, cursor: Optional[dict]) -> Tuple[dict, List[List[bytes]]]:
+        """SELECT the mailbox, asking QRESYNC for changes since cursor when possible
+
+        Returns (mailbox status, untagged responses).
+        """
+        command = f"SELECT {quote(self.mailbox)}"
+        if cursor and self.connection.supports("QRESYNC") and cursor.get("modseq"):
+            command += f" (QRESYNC ({cursor['uidvalidity']} {cursor['modseq']}))"
+        elif self.connection.supports("CONDSTORE"):
+            command += " (CONDSTORE)"
+
+        responses = await self.connection.command(command)
+
+        status = {"uidvalidity": None, "uidnext": None, "modseq": None}
+        for response in responses:
+            line = response[0].upper()
+            for key, name in ((b"UIDVALIDITY", "uidvalidity"), (b"UIDNEXT", "uidnext"), (b"HIGHESTMODSEQ", "modseq")):
+                match = re.search(rb"\[" + key + rb" (\d+)\]", line)
+                if match:
+                    status[name] = int(match.group(1))
+        return status, responses
+
+    async def fetch_changes(self, cursor: Optional[str], known_ids: KnownIdsLookup) -> SyncBatch:
+        state = json.loads(cursor) if cursor else None
+
+        await self.open()
+        status, select_responses = await self.select(state)
+        uidvalidity = status["uidvalidity"]
+        api_calls = 1  # SELECT
+
+        if state and state.get("uidvalidity") != uidvalidity:
+            raise CursorExpired(f"IMAP UIDVALIDITY changed ({state.get('uidvalidity')} -> {uidvalidity})")
+
+        flag_updates: Dict[str, dict] = {}
+        removed: Dict[str, str] = {}
+        last_uid = state["last_uid"] if state else 0
+
+        if state:
+            # QRESYNC already reported changes during SELECT; otherwise ask explicitly
+            if self.connection.supports("QRESYNC") and state.get("modseq"):
+                changes = select_responses
+            elif self.connection.supports("CONDSTORE") and state.get("modseq") and last_uid:
+                changes = await self.connection.command(
+                    f"UID FETCH 1:{last_uid} (UID FLAGS) (CHANGEDSINCE {state['modseq']})"
+                )
+                api_calls += 1
+            elif last_uid:
+                changes = await self.connection.command(f"UID FETCH 1:{last_uid} (UID FLAGS)")
+                api_calls += 1
+            else:
+                changes = []
+
+            for response in changes:
+                words = response[0].split()
+                if len(words) >= 3 and words[1].upper() == b"VANISHED":
+                    for uid in parse_uid_set(words[-1].decode()):
+                        removed[self.message_id(uidvalidity, uid)] = "deleted"
+                    continue
+                items = self.parse_fetch(response)
+                if items and "UID" in items and int(items["UID"]) <= last_uid:
+                    flag_updates[self.message_id(uidvalidity, int(items["UID"]))] = self.parse_flags(items.get("FLAGS", []))
+
+            # Only report flag changes for messages we actually store
+            known = known_ids(list(flag_updates.keys())) if flag_updates else set()
+            flag_updates = {message_id: flags for message_id, flags in flag_updates.items() if message_id in known}
+
+        # New messages: everything above the last UID we saw
+        search = await self.connection.command(f"UID SEARCH UID {last_uid + 1}:*")
+        api_calls += 1
+        new_uids = []
+        for response in search:
+            words = response[0].split()
+            if len(words) >= 2 and words[1].upper() == b"SEARCH":
+                new_uids.extend(int(uid) for uid in words[2:] if int(uid) > last_uid)
+
+        if new_uids and not state:
+            known = known_ids([self.message_id(uidvalidity, uid) for uid in new_uids])
+            new_uids = [uid for uid in new_uids if self.message_id(uidvalidity, uid) not in known]
+
+        new_emails, fetch_calls = await self.fetch_messages(uidvalidity, sorted(new_uids))
+        api_calls += fetch_calls
+
+        new_cursor = {
+            "uidvalidity": uidvalidity,
+            "last_uid": max([last_uid] + new_uids),
+            "modseq": status["modseq"],
+        }
+
+        return SyncBatch(
+            new_emails=new_emails,
+            flag_updates=flag_updates,
+            removed=removed,
+            cursor=json.dumps(new_cursor),
+            api_calls=api_calls
+        )
+
+    async def fetch_messages(self, uidvalidity: int, uids: List[int]) -> Tuple[List[dict], int]:
+        """Fetch full messages in UID batches, pipelining several UID FETCH commands
+
+        Returns (parsed emails, commands sent)
+        """
+        if not uids:
+            return [], 0
+
+        batches = [uids[i:i + FETCH_BATCH_SIZE] for i in range(0, len(uids), FETCH_BATCH_SIZE)]
+        attributes = f"(UID FLAGS INTERNALDATE BODY.PEEK[]<0.{BODY_MAX_BYTES}>)"
+        print(f"📦 Fetching {len(uids)} IMAP messages in {len(batches)} UID FETCH commands")
+
+        emails = []
+        for start in range(0, len(batches), PIPELINE_DEPTH):
+            group = batches[start:start + PIPELINE_DEPTH]
+            responses = await self.connection.pipeline(
+                [f"UID FETCH {uid_set(batch)} {attributes}" for batch in group]
+            )
+            for response in responses:
+                items = self.parse_fetch(response)
+                if not items or "UID" not in items or "BODY[]" not in items:
+                    continue
+                try:
+                    emails.append(self.parse_message(uidvalidity, items))
+                except Exception as e:
+                    print(f"   ❌ Error parsing IMAP message UID {items.get('UID')}: {str(e)}")
+
+        return emails, len(batches)
+
+    def parse_fetch(self, response: List[bytes]) -> Optional[dict]:
+        """Parse "* n FETCH (...)" into its attribute dict"""
+        tree = parse_tokens(tokenize(response))
+        if len(tree) < 4 or tree[2].upper() != b"FETCH" or not isinstance(tree[3], list):
+            return None
+        return parse_fetch_items(tree[3])
+
+    def parse_flags(self, flags: list) -> dict:
+        flags = {flag.decode(errors="ignore").lower() for flag in flags if isinstance(flag, bytes)}
+        return {
+            "is_read": "\\seen" in flags,
+            "is_starred": "\\flagged" in flags,
+            "is_trash": "\\deleted" in flags,
+        }
+
+    def parse_message(self, uidvalidity: int, items: dict) -> dict:
+        """Parse a fetched RFC 822 message into our Email model format"""
+        message_id = self.message_id(uidvalidity, int(items["UID"]))
+        message = message_from_bytes(items["BODY[]"], policy=policy.default)
+        flags = self.parse_flags(items.get("FLAGS", []))
+
+        def addresses(header: str) -> Optional[List[str]]:
+            value = message.get(header)
+            return [addr.strip() for addr in str(value).split(",")] if value else None
+
+        bodies = {
+            "text/plain": BoundedBody("text", message_id, self.body_store),
+            "text/html": BoundedBody("html", message_id, self.body_store),
+        }
+        has_attachments = False
+        for part in message.walk():
+            if part.is_attachment():
+                has_attachments = True
+                continue
+            body = bodies.get(part.get_content_type())
+            if body is None:
+                continue
+            payload = part.get_payload(decode=True)
+            if payload:
+                charset = part.get_content_charset() or "utf-8"
+                try:
+                    payload = payload.decode(charset, errors="ignore").encode("utf-8")
+                except LookupError:
+                    pass
+                body.feed_bytes(payload)
+
+        body_text = bodies["text/plain"].finish()
+        body_html = bodies["text/html"].finish()
+
+        labels = ["INBOX"]
+        if not flags["is_read"]:
+            labels.append("UNREAD")
+        if flags["is_starred"]:
+            labels.append("STARRED")
+
+        references = str(message.get("References") or "").split()
+        thread_root = references[0] if references else message.get("Message-ID")
+
+        data = {
+            "gmail_id": message_id,
+            "thread_id": str(thread_root) if thread_root else None,
+            "subject": str(message.get("Subject") or ""),
+            "from_address": str(message.get("From") or ""),
+            "to_addresses": addresses("To"),
+            "cc_addresses": addresses("Cc"),
+            "bcc_addresses": addresses("Bcc"),
+            "snippet": " ".join(body_text.split())[:200],
+            "body_text": body_text,
+            "body_html": body_html,
+            "body_truncated": bodies["text/plain"].truncated or bodies["text/html"].truncated,
+            "labels": labels,
+            "is_important": False,
+            "is_draft": False,
+            "is_sent": False,
+            "has_attachments": has_attachments,
+            **flags,
+        }
+
+        try:
+            data["sent_at"] = parsedate_to_datetime(str(message.get("Date")))
+        except Exception:
+            pass
+
+        internal_date = items.get("INTERNALDATE")
+        try:
+            received_at = datetime.strptime(internal_date.decode().strip(), "%d-%b-%Y %H:%M:%S %z")
+            data["received_at"] = received_at.astimezone(timezone.utc).replace(tzinfo=None)
+        except Exception:
+            data["received_at"] = datetime.utcnow()
+
+        return data
+
+    async def wait_for_changes(self, timeout: float = IDLE_TIMEOUT_SECONDS) -> bool:
+        """Open a connection if needed and IDLE on the mailbox until it changes"""
+        if not self.connection.writer:
+            await self.open()
+            await self.select(None)
+        if not self.connection.supports("IDLE"):
+            await asyncio.sleep(timeout)
+            return True
+        return await self.connection.idle(timeout)
+
+    async def close(self):
+        await self.connection.logout()
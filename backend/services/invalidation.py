@@ -0,0 +1,166 @@
+"""
+Cross-process cache invalidation over PostgreSQL LISTEN/NOTIFY
+
+API workers and sync workers are separate processes, so an in-process cache
+in one doesn't see writes made by another. Writers publish an event inside
+their transaction (pg_notify: delivered on commit, dropped on rollback), and
+every API process keeps one dedicated asyncpg connection LISTENing for them
+and hands each event to the handlers registered for its kind. The publishing
+process dispatches its own events locally right after commit, without
+waiting for the round trip.
+
+Payloads are "<kind>:<user_id>[:<version>]":
+  mailbox    a user's emails changed; version is the new mailbox version
+  principal  a user's is_active or email changed
+Events published while a listener is disconnected are lost, so on every
+(re)connect handlers are called with user_id None: forget everything.
+"""
+
+import asyncio
+import os
+import weakref
+from typing import Callable, Dict, List, Optional
+import asyncpg
+from sqlalchemy import event, select, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from database.connection import DATABASE_URL
+
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "cache_invalidation")
+INVALIDATION_RECONNECT_SECONDS = 5
+# An idle LISTEN connection can die silently; check it this often
+INVALIDATION_HEALTH_CHECK_SECONDS = 30
+
+Handler = Callable[[Optional[int], Optional[int]], None]
+_handlers: Dict[str, List[Handler]] = {}
+
+
+def on_invalidation(kind: str):
+    """Register handler(user_id, version) for an event kind; user_id None means everything"""
+    def register(handler: Handler) -> Handler:
+        _handlers.setdefault(kind, []).append(handler)
+        return handler
+    return register
+
+
+def publish(session: Session, kind: str, user_id: int, version: Optional[int] = None):
+    """Publish an event with the session's transaction (from a flush hook or before commit)"""
+    payload = f"{kind}:{user_id}" if version is None else f"{kind}:{user_id}:{version}"
+    connection = session.connection()
+    if connection.dialect.name == "postgresql":
+        connection.execute(select(func.pg_notify(INVALIDATION_CHANNEL, payload)))
+    session.info.setdefault("invalidations", []).append(payload)
+
+
+def dispatch(payload: str):
+    try:
+        kind, user_id, *version = payload.split(":")
+        user_id, version = int(user_id), int(version[0]) if version else None
+    except ValueError:
+        print(f"⚠️  Ignoring malformed invalidation event: {payload}")
+        return
+    for handler in _handlers.get(kind, ()):
+        try:
+            handler(user_id, version)
+        except Exception as e:
+            print(f"⚠️  Invalidation handler for {kind} failed: {str(e)}")
+
+
+def invalidate_everything():
+    for kind, handlers in _handlers.items():
+        for handler in handlers:
+            try:
+                handler(None, None)
+            except Exception as e:
+                print(f"⚠️  Invalidation handler for {kind} failed: {str(e)}")
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_committed(session):
+    for payload in session.info.pop("invalidations", ()):
+        dispatch(payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_uncommitted(session):
+    session.info.pop("invalidations", None)
+
+
+def listen_dsn() -> str:
+    """DATABASE_URL as a plain libpq DSN for asyncpg"""
+    return make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+class InvalidationListener:
+    """The LISTEN connection of one event loop, reconnecting as needed"""
+
+    def __init__(self):
+        self.listen_task: Optional[asyncio.Task] = None
+        self.connected = False
+
+    def start(self):
+        """Start listening on the running loop (PostgreSQL only)"""
+        if make_url(DATABASE_URL).get_backend_name() != "postgresql":
+            return
+        if self.listen_task is None or self.listen_task.done():
+            self.listen_task = asyncio.ensure_future(self.listen_loop())
+
+    async def stop(self):
+        if self.listen_task:
+            self.listen_task.cancel()
+            try:
+                await self.listen_task
+            except asyncio.CancelledError:
+                pass
+            self.listen_task = None
+
+    def on_notification(self, connection, pid, channel, payload):
+        dispatch(payload)
+
+    async def listen_loop(self):
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(listen_dsn())
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(INVALIDATION_CHANNEL, self.on_notification)
+
+                self.connected = True
+                # Whatever happened while nobody was listening is unknown
+                invalidate_everything()
+                print(f"📡 Listening for cache invalidations on {INVALIDATION_CHANNEL}")
+
+                while not closed.is_set():
+                    try:
+                        await asyncio.wait_for(closed.wait(), INVALIDATION_HEALTH_CHECK_SECONDS)
+                    except asyncio.TimeoutError:
+                        await connection.fetchval("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Invalidation listener connection lost: {str(e)}")
+            finally:
+                self.connected = False
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+            await asyncio.sleep(INVALIDATION_RECONNECT_SECONDS)
+
+
+_listeners: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, InvalidationListener]" = weakref.WeakKeyDictionary()
+
+
+def get_invalidation_listener() -> InvalidationListener:
+    """Get the listener for the running event loop"""
+    loop = asyncio.get_running_loop()
+    listener = _listeners.get(loop)
+    if listener is None:
+        listener = InvalidationListener()
+        _listeners[loop] = listener
+    return listener
+
+
+def listening() -> bool:
+    """Whether some loop of this process currently receives every invalidation"""
+    return any(listener.connected for listener in list(_listeners.values()))
@@ -0,0 +1,119 @@
+"""
+Label predicates over the normalized label storage
+
+System labels are bits of Email.system_labels (partial indexes cover the
+selective ones); labels mirrored by a flag column (STARRED, UNREAD, ...)
+filter on that column and its index; user labels go through email_labels.
+
+label_update puts a system label on or takes it off many emails in one
+UPDATE, keeping the labels list, its bit and the flag column in step;
+set_flag does the same for one loaded Email.
+"""
+
+from sqlalchemy import exists, literal_column, String, JSON
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+from models.email import Email
+from models.email_label import EmailLabel, SYSTEM_LABEL_BITS
+
+# Labels with a dedicated (and partially indexed) flag column: label -> (column, value)
+FLAG_LABELS = {
+    "UNREAD": ("is_read", False),
+    "STARRED": ("is_starred", True),
+    "IMPORTANT": ("is_important", True),
+    "TRASH": ("is_trash", True),
+}
+
+# Flag column -> (label, flag value while the label is on)
+FLAG_COLUMNS = {column: (label, value) for label, (column, value) in FLAG_LABELS.items()}
+
+
+def system_label_set(label: str):
+    # Bit and comparison are inlined, not bound: a partial index predicate only
+    # matches constants, and asyncpg's generic plans would otherwise skip it
+    bit = SYSTEM_LABEL_BITS[label]
+    return Email.system_labels.op("&")(literal_column(str(bit))) != literal_column("0")
+
+
+def has_label(label: str):
+    """Predicate: the email carries this label"""
+    if label in FLAG_LABELS:
+        column, value = FLAG_LABELS[label]
+        return getattr(Email, column) == value
+    if label in SYSTEM_LABEL_BITS:
+        return system_label_set(label)
+    # user_id = emails.user_id lets the planner use (user_id, label, email_id)
+    return exists().where(
+        EmailLabel.user_id == Email.user_id,
+        EmailLabel.label == label,
+        EmailLabel.email_id == Email.id
+    )
+
+
+def carries_label(values: dict, label: str) -> bool:
+    """has_label evaluated in Python on an email's column values (system labels only)"""
+    if label in FLAG_LABELS:
+        column, value = FLAG_LABELS[label]
+        return bool(values.get(column)) == value
+    return bool((values.get("system_labels") or 0) & SYSTEM_LABEL_BITS[label])
+
+
+class ChangedLabels(ColumnElement):
+    """SQL for Email.labels with label removed, then appended once if present"""
+    type = JSON()
+    inherit_cache = False
+
+    def __init__(self, label: str, present: bool):
+        self.label = label
+        self.present = present
+
+
+@compiles(ChangedLabels, "postgresql")
+def compile_changed_labels(element, compiler, **kw):
+    labels = compiler.process(Email.labels, **kw)
+    label = compiler.render_literal_value(element.label, String())
+    # jsonb - text drops every element equal to the string
+    changed = f"(COALESCE({labels}::jsonb, '[]'::jsonb) - {label}::text)"
+    if element.present:
+        changed = f"({changed} || jsonb_build_array({label}::text))"
+    return f"{changed}::json"
+
+
+@compiles(ChangedLabels, "sqlite")
+def compile_changed_labels_sqlite(element, compiler, **kw):
+    labels = compiler.process(Email.labels, **kw)
+    label = compiler.render_literal_value(element.label, String())
+    changed = f"(SELECT json_group_array(value) FROM json_each({labels}) WHERE value <> {label})"
+    if element.present:
+        changed = f"json_insert({changed}, '$[#]', {label})"
+    return changed
+
+
+def label_update(label: str, present: bool) -> dict:
+    """UPDATE values putting a system label on emails (present) or taking it off"""
+    bit = SYSTEM_LABEL_BITS[label]
+    values = {
+        "labels": ChangedLabels(label, present),
+        "system_labels": (
+            Email.system_labels.op("|")(literal_column(str(bit))) if present
+            else Email.system_labels.op("&")(literal_column(str(~bit)))
+        ),
+    }
+    if label in FLAG_LABELS:
+        column, value = FLAG_LABELS[label]
+        values[column] = value if present else not value
+    return values
+
+
+def set_flag(email: Email, column: str, value: bool):
+    """Set a flag column (is_read, is_starred, ...) on a loaded Email and its label to match
+
+    Assigns a new labels list, so sync_label_storage updates system_labels too.
+    """
+    setattr(email, column, value)
+    if column not in FLAG_COLUMNS:
+        return
+    label, label_value = FLAG_COLUMNS[column]
+    labels = email.labels or []
+    if (label in labels) != (value == label_value):
+        email.labels = [existing for existing in labels if existing != label] + ([label] if value == label_value else [])
@@ -0,0 +1,53 @@
+"""
+Common interface for non-Gmail mailbox providers used by the sync worker
+
+A provider knows how to talk to one remote mailbox. It never touches the
+database: the sync worker hands it the stored cursor plus a lookup for
+messages that are already cached, and writes whatever SyncBatch comes back
+through its ingest pipeline.
+"""
+
+from typing import Callable, Dict, List, Optional, Set
+
+# Returns the subset of the given provider message IDs already stored locally
+KnownIdsLookup = Callable[[List[str]], Set[str]]
+
+
+class CursorExpired(Exception):
+    """The stored cursor is no longer accepted; the next sync must start over"""
+
+
+class SyncBatch:
+    """Result of one incremental sync of a remote mailbox"""
+
+    def __init__(
+        self,
+        new_emails: Optional[List[dict]] = None,
+        flag_updates: Optional[Dict[str, dict]] = None,
+        removed: Optional[Dict[str, str]] = None,
+        cursor: Optional[str] = None,
+        api_calls: int = 0
+    ):
+        # Parsed email dicts in the Email model format (without user/account IDs)
+        self.new_emails = new_emails or []
+        # Provider message ID -> changed Email columns for messages we already have
+        self.flag_updates = flag_updates or {}
+        # Provider message ID -> "deleted" or "moved" for messages gone from the mailbox
+        self.removed = removed or {}
+        # Opaque cursor to store in SyncState.last_sync_token for the next sync
+        self.cursor = cursor
+        self.api_calls = api_calls
+
+
+class MailProvider:
+    """Base class for mailbox providers"""
+
+    provider = ""
+
+    async def fetch_changes(self, cursor: Optional[str], known_ids: KnownIdsLookup) -> SyncBatch:
+        """Fetch everything that changed since cursor (None means a full initial sync)"""
+        raise NotImplementedError
+
+    async def close(self):
+        """Release connections held by the provider"""
+        pass
@@ -0,0 +1,209 @@
+"""
+Incrementally maintained mailbox counters
+
+mailbox_counters holds one row per user with the counts /emails/email-counts
+serves. Every ORM flush that inserts, deletes or changes the flags/labels of
+emails adds the resulting deltas to the owners' rows, on the same connection
+and so in the same transaction as the email writes (sync ingest, EmailService
+mutations, anything else using a Session), and bumps their version, which
+changes with every write to a user's emails and is what mailbox ETags and
+the change log (services/email_changes.py) are built from; each new version
+is also published to the other processes (services/invalidation.py). Bulk Core
+statements bypass the ORM and must call apply_deltas themselves (bulk UPDATEs
+through record_bulk_update); recompute_counters (run by
+repair_mailbox_counters.py) rebuilds a row from the emails table.
+"""
+
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event, inspect, select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from models.email import Email
+from models.mailbox_counter import MailboxCounter
+from models.email_change import CHANGE_INSERT, CHANGE_UPDATE, CHANGE_DELETE
+from services.labels import has_label, carries_label
+from services.email_changes import record_changes
+from services.invalidation import publish
+
+# Counter column -> label an email must carry to be counted (None: every email)
+COUNTERS = {
+    "total": None,
+    "unread": "UNREAD",
+    "inbox": "INBOX",
+    "important": "IMPORTANT",
+    "starred": "STARRED",
+    "sent": "SENT",
+    "personal": "CATEGORY_PERSONAL",
+    "updates": "CATEGORY_UPDATES",
+    "promotions": "CATEGORY_PROMOTIONS",
+}
+
+# Response keys of /email-counts that differ from the column name
+RESPONSE_KEYS = {"total": "all"}
+
+# Email columns the counters depend on
+TRACKED_COLUMNS = ("user_id", "is_trash", "is_read", "is_important", "is_starred", "system_labels")
+
+
+def contribution(values: dict) -> Dict[str, int]:
+    """What one email adds to each counter (trashed email counts nowhere)"""
+    if values.get("is_trash"):
+        return {name: 0 for name in COUNTERS}
+    return {name: int(label is None or carries_label(values, label)) for name, label in COUNTERS.items()}
+
+
+def _insert(connection):
+    dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+    return dialect.insert(MailboxCounter)
+
+
+def apply_deltas(connection, deltas: Dict[int, Dict[str, int]]) -> Dict[int, int]:
+    """Add per-user counter deltas and bump each user's version, creating missing rows
+
+    A user with all-zero deltas (emails changed, counts didn't) still gets a
+    new version. User IDs go in order to avoid deadlocks. Returns each
+    user's new version.
+    """
+    versions = {}
+    for user_id in sorted(deltas):
+        delta = {name: value for name, value in deltas[user_id].items() if value}
+        stmt = _insert(connection).values(user_id=user_id, version=1, **delta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={
+                **{name: getattr(MailboxCounter, name) + stmt.excluded[name] for name in delta},
+                "version": MailboxCounter.version + 1,
+                "updated_at": func.now(),
+            }
+        )
+        versions[user_id] = connection.execute(stmt.returning(MailboxCounter.version)).scalar_one()
+    return versions
+
+
+def recompute_counters(db: Session, user_id: int) -> Dict[str, int]:
+    """Rebuild a user's counters from the emails table (caller commits)
+
+    The counter row is locked first, so writers that already applied deltas
+    have committed before the emails are counted, and later ones add on top.
+    """
+    connection = db.connection()
+    connection.execute(_insert(connection).values(user_id=user_id).on_conflict_do_nothing(index_elements=["user_id"]))
+    previous = dict(connection.execute(
+        select(*(getattr(MailboxCounter, name) for name in COUNTERS))
+        .filter(MailboxCounter.user_id == user_id)
+        .with_for_update()
+    ).one()._mapping)
+
+    columns = [
+        (func.count(Email.id) if label is None else func.count(Email.id).filter(has_label(label))).label(name)
+        for name, label in COUNTERS.items()
+    ]
+    values = dict(connection.execute(
+        select(*columns).filter(Email.user_id == user_id, Email.is_trash == False)
+    ).one()._mapping)
+
+    if values != previous:
+        # Counts served at the current version were wrong; don't let clients revalidate
+        # them, and make delta sync clients reload (the change log missed these writes)
+        stmt = _insert(connection).values(user_id=user_id, **values)
+        version = connection.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={
+                **{name: stmt.excluded[name] for name in COUNTERS},
+                "version": MailboxCounter.version + 1,
+                "changes_start": MailboxCounter.version + 1,
+                "updated_at": func.now(),
+            }
+        ).returning(MailboxCounter.version)).scalar_one()
+        publish(db, "mailbox", user_id, version)
+    return values
+
+
+def counts_response(counter: Optional[MailboxCounter]) -> Dict[str, int]:
+    """/email-counts body for a counter row (no row yet: no emails)"""
+    return {RESPONSE_KEYS.get(name, name): getattr(counter, name) if counter else 0 for name in COUNTERS}
+
+
+def _values(obj: Email, previous: bool) -> dict:
+    """Tracked column values of an email before (previous) or after this flush"""
+    attrs = inspect(obj).attrs
+    values = {}
+    for column in TRACKED_COLUMNS:
+        history = attrs[column].history
+        if previous and history.deleted:
+            values[column] = history.deleted[0]
+        else:
+            values[column] = getattr(obj, column)
+    return values
+
+
+def _add(deltas: dict, values: dict, sign: int):
+    totals = deltas.setdefault(values["user_id"], {name: 0 for name in COUNTERS})
+    for name, value in contribution(values).items():
+        totals[name] += sign * value
+
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+# Load the old value when a tracked column of an expired email is assigned, so
+# its history always has the value the counters were built from
+for _column in TRACKED_COLUMNS:
+    event.listen(getattr(Email, _column), "set", _keep_previous_value, active_history=True)
+
+
+@event.listens_for(Session, "after_flush")
+def _update_counters(session, flush_context):
+    """Turn this flush's email inserts/deletes/changes into counter deltas and change log rows"""
+    # The new/dirty/deleted lists and attribute history still show pre-flush state here
+    deltas: Dict[int, Dict[str, int]] = {}
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Email):
+            _add(deltas, _values(obj, previous=False), 1)
+            changes.append((obj.user_id, obj.id, CHANGE_INSERT))
+    for obj in session.deleted:
+        if isinstance(obj, Email):
+            values = _values(obj, previous=True)
+            _add(deltas, values, -1)
+            changes.append((values["user_id"], obj.id, CHANGE_DELETE))
+    for obj in session.dirty:
+        if not isinstance(obj, Email):
+            continue
+        attrs = inspect(obj).attrs
+        if any(attrs[column].history.has_changes() for column in TRACKED_COLUMNS):
+            _add(deltas, _values(obj, previous=True), -1)
+            _add(deltas, _values(obj, previous=False), 1)
+        elif session.is_modified(obj, include_collections=False):
+            # Counts unchanged, but the mailbox still has a new version
+            deltas.setdefault(obj.user_id, {name: 0 for name in COUNTERS})
+        else:
+            continue
+        changes.append((obj.user_id, obj.id, CHANGE_UPDATE))
+
+    _record(session, deltas, changes)
+
+
+def record_bulk_update(session: Session, updated: List[Tuple[int, dict, dict]]):
+    """Counters, change log and mailbox events for emails changed by a bulk UPDATE
+
+    updated holds (email_id, values before, values after) of TRACKED_COLUMNS
+    for each changed email; what the flush hook does for ORM writes.
+    """
+    deltas: Dict[int, Dict[str, int]] = {}
+    changes = []
+    for email_id, previous, current in updated:
+        _add(deltas, previous, -1)
+        _add(deltas, current, 1)
+        changes.append((current["user_id"], email_id, CHANGE_UPDATE))
+    _record(session, deltas, changes)
+
+
+def _record(session: Session, deltas: Dict[int, Dict[str, int]], changes: list):
+    if deltas:
+        connection = session.connection()
+        versions = apply_deltas(connection, deltas)
+        record_changes(connection, changes, versions)
+        for user_id, version in versions.items():
+            publish(session, "mailbox", user_id, version)
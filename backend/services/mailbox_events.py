@@ -0,0 +1,224 @@
+"""
+Server-sent events for mailbox changes
+
+GET /emails/events keeps a stream open per client. One hub per event loop
+watches the mailbox versions of every user with an open stream in a single
+query per tick, ticking at once when a mailbox event for one of them
+arrives (services/invalidation.py). When a user's version moves, it reads
+the change log (services/email_changes.py) and counters once and fans the
+events out to that user's streams. Idle streams cost a queue and a suspended generator,
+never a database connection, so a process can hold thousands of them.
+
+Events (the SSE id of changes is the mailbox version, so a reconnecting
+EventSource resumes through Last-Event-ID):
+  changes  {"inserted": [...], "updated": [...], "deleted": [...], "version": N}
+           with inserted/updated as email summaries, as GET /emails/changes
+  counts   the /emails/email-counts body plus "version"
+  reload   the stream can't catch up (change log pruned, client too slow) and
+           ends; reload the mailbox (EventSource reconnects by itself)
+"""
+
+import asyncio
+import os
+import weakref
+from typing import Dict, Optional, Set
+from sqlalchemy import select
+from database.connection import AsyncSessionLocal
+from models.mailbox_counter import MailboxCounter
+from schemas.email import SUMMARY_FIELDS
+from services.email_service import EmailService
+from services.mailbox_counters import counts_response
+from services.serialization import encode_json, rows_to_dicts
+from services.invalidation import on_invalidation
+
+# Fallback only: mailbox events wake the hub as soon as a change commits
+EVENT_STREAM_POLL_SECONDS = float(os.getenv("EVENT_STREAM_POLL_SECONDS", "2"))
+EVENT_STREAM_HEARTBEAT_SECONDS = float(os.getenv("EVENT_STREAM_HEARTBEAT_SECONDS", "15"))
+
+# Events buffered per stream before a slow client is told to reload
+EVENT_STREAM_QUEUE_SIZE = 100
+
+# Users per version query
+VERSION_QUERY_CHUNK = 1000
+
+
+def format_event(event: str, data: dict, version: Optional[int] = None) -> bytes:
+    head = f"id: {version}\n" if version is not None else ""
+    return f"{head}event: {event}\ndata: ".encode() + encode_json(data) + b"\n\n"
+
+
+def counts_event(counter: Optional[MailboxCounter]) -> bytes:
+    # No SSE id: a client resumes from the last changes it got, not from a count
+    return format_event("counts", {**counts_response(counter), "version": counter.version if counter else 0})
+
+
+class Subscription:
+    """One open stream: the version its client has seen and its pending events"""
+
+    def __init__(self, user_id: int, version: int):
+        self.user_id = user_id
+        self.version = version
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=EVENT_STREAM_QUEUE_SIZE)
+        self.closed = False
+
+    def push(self, event: bytes):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.reload(self.version)
+
+    def reload(self, version: int):
+        """Replace anything pending with a reload event and end the stream
+
+        The event's id is version, so the EventSource reconnects from there
+        while its client reloads, instead of from the version it couldn't reach.
+        """
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(format_event("reload", {"version": version}, version))
+        self.closed = True
+
+
+class MailboxEventHub:
+    def __init__(self):
+        self.subscriptions: Dict[int, Set[Subscription]] = {}
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.poll_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start watching mailbox versions on the running loop"""
+        if self.poll_task is None or self.poll_task.done():
+            self.poll_task = asyncio.ensure_future(self.poll_loop())
+
+    async def stop(self):
+        if self.poll_task:
+            self.poll_task.cancel()
+            try:
+                await self.poll_task
+            except asyncio.CancelledError:
+                pass
+            self.poll_task = None
+
+    def subscribe(self, user_id: int, version: int) -> Subscription:
+        subscription = Subscription(user_id, version)
+        self.subscriptions.setdefault(user_id, set()).add(subscription)
+        self.start()
+        # A resuming client may already be behind
+        self.wakeup.set()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self.subscriptions.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscriptions[subscription.user_id]
+
+    async def stream(self, subscription: Subscription):
+        """The SSE body for a subscription, with heartbeats so proxies keep it open"""
+        try:
+            yield f"retry: {int(EVENT_STREAM_POLL_SECONDS * 1000) + 1000}\n\n".encode()
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), EVENT_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                yield event
+                if subscription.closed and subscription.queue.empty():
+                    break
+        finally:
+            self.unsubscribe(subscription)
+
+    async def poll_loop(self):
+        """Publish changes for users whose mailbox version moved"""
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), EVENT_STREAM_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+            if not self.subscriptions:
+                continue
+            try:
+                await self.publish_changes(list(self.subscriptions))
+            except Exception as e:
+                print(f"⚠️  Mailbox event publishing failed: {str(e)}")
+
+    async def publish_changes(self, user_ids: list):
+        async with AsyncSessionLocal() as db:
+            versions = {}
+            for start in range(0, len(user_ids), VERSION_QUERY_CHUNK):
+                rows = await db.execute(
+                    select(MailboxCounter.user_id, MailboxCounter.version)
+                    .filter(MailboxCounter.user_id.in_(user_ids[start:start + VERSION_QUERY_CHUNK]))
+                )
+                versions.update(rows.all())
+
+            for user_id in user_ids:
+                # Ahead of the mailbox too (resumed from a bogus id): get_changes says reload
+                behind = [
+                    subscription for subscription in self.subscriptions.get(user_id, ())
+                    if subscription.version != versions.get(user_id, 0) and not subscription.closed
+                ]
+                if behind:
+                    await self.publish_user(db, user_id, behind)
+                    # Don't hold a snapshot (and connection state) across users
+                    await db.rollback()
+
+    async def publish_user(self, db, user_id: int, behind: list):
+        """Bring a user's lagging streams up to date; clients at the same version share the reads"""
+        email_service = EmailService(db)
+        counter = await db.get(MailboxCounter, user_id)
+        counts = counts_event(counter)
+
+        for since in sorted({subscription.version for subscription in behind}):
+            group = [subscription for subscription in behind if subscription.version == since]
+            version = since
+            while True:
+                changes = await email_service.get_changes(user_id, version, SUMMARY_FIELDS)
+                if changes is None:
+                    for subscription in group:
+                        subscription.reload(counter.version if counter else 0)
+                    break
+
+                event = format_event("changes", {
+                    "inserted": rows_to_dicts(changes.inserted, SUMMARY_FIELDS),
+                    "updated": rows_to_dicts(changes.updated, SUMMARY_FIELDS),
+                    "deleted": changes.deleted,
+                    "version": changes.version,
+                }, changes.version)
+                version = changes.version
+                for subscription in group:
+                    subscription.push(event)
+                    subscription.version = version
+                if not changes.has_more:
+                    break
+
+            for subscription in group:
+                subscription.push(counts)
+
+
+_hubs: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, MailboxEventHub]" = weakref.WeakKeyDictionary()
+
+
+@on_invalidation("mailbox")
+def _wake_hubs(user_id: Optional[int], version: Optional[int]):
+    # Events are dispatched from any thread (commits of sync sessions included)
+    for hub in list(_hubs.values()):
+        if user_id is None or user_id in hub.subscriptions:
+            hub.loop.call_soon_threadsafe(hub.wakeup.set)
+
+
+def get_event_hub() -> MailboxEventHub:
+    """Get the hub for the running event loop (streams and their queues belong to one loop)"""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = MailboxEventHub()
+        _hubs[loop] = hub
+    return hub
@@ -0,0 +1,269 @@
+"""
+Microsoft Graph (Outlook) mailbox provider
+
+Incremental sync uses Graph delta queries on the inbox: the first sync pages
+through the whole folder, later syncs replay the stored deltaLink and only
+see what changed. Delta pages select just IDs and flags; full messages for
+IDs we don't have yet are retrieved with JSON $batch requests (20 per batch).
+If any of those can't be fetched, the cursor isn't advanced, so the next sync
+replays the same delta and tries them again.
+"""
+
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import quote
+import httpx
+from dotenv import load_dotenv
+from services.body_parser import BoundedBody
+from services.body_store import BodyStore
+from services.mail_provider import MailProvider, SyncBatch, KnownIdsLookup, CursorExpired
+
+load_dotenv()
+
+# Point at a local stand-in server for testing
+GRAPH_BASE_URL = os.getenv("MS_GRAPH_BASE_URL", "https://graph.microsoft.com/v1.0").rstrip("/")
+
+# Graph allows at most 20 requests per $batch
+BATCH_SIZE = 20
+BATCH_CONCURRENCY = int(os.getenv("MS_GRAPH_BATCH_CONCURRENCY", "4"))
+MAX_BATCH_RETRIES = 3
+
+DELTA_SELECT = "id,isRead,flag,importance"
+MESSAGE_SELECT = ",".join([
+    "id", "conversationId", "subject", "from", "toRecipients", "ccRecipients",
+    "bccRecipients", "bodyPreview", "body", "isRead", "isDraft", "flag",
+    "importance", "sentDateTime", "receivedDateTime", "hasAttachments"
+])
+
+
+class OutlookProvider(MailProvider):
+    provider = "outlook"
+
+    def __init__(self, access_token: str, base_url: str = GRAPH_BASE_URL, body_store: Optional[BodyStore] = None):
+        self.base_url = base_url
+        self.body_store = body_store
+        self.client = httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=httpx.Timeout(30.0)
+        )
+
+    async def fetch_changes(self, cursor: Optional[str], known_ids: KnownIdsLookup) -> SyncBatch:
+        """Replay the inbox delta from cursor and fetch new messages via $batch"""
+        if cursor:
+            url = cursor
+            params = None
+            print(f"🔁 Resuming Outlook delta sync")
+        else:
+            url = f"{self.base_url}/me/mailFolders/inbox/messages/delta"
+            params = {"$select": DELTA_SELECT}
+            print(f"🆕 Starting initial Outlook delta sync")
+
+        changed: Dict[str, dict] = {}
+        removed: Dict[str, str] = {}
+        api_calls = 0
+        delta_link = None
+
+        while url:
+            response = await self.client.get(url, params=params, headers={"Prefer": "odata.maxpagesize=500"})
+            api_calls += 1
+            params = None
+
+            if response.status_code == 410:
+                raise CursorExpired("Outlook delta token expired (HTTP 410)")
+            if response.status_code != 200:
+                raise Exception(f"Failed to fetch Outlook delta: {response.status_code} - {response.text}")
+
+            data = response.json()
+            for item in data.get("value", []):
+                if "@removed" in item:
+                    reason = item["@removed"].get("reason")
+                    removed[item["id"]] = "deleted" if reason == "deleted" else "moved"
+                    changed.pop(item["id"], None)
+                else:
+                    changed[item["id"]] = item
+                    removed.pop(item["id"], None)
+
+            url = data.get("@odata.nextLink")
+            delta_link = data.get("@odata.deltaLink", delta_link)
+
+        print(f"📧 Outlook delta returned {len(changed)} changed and {len(removed)} removed messages")
+
+        known = known_ids(list(changed.keys())) if changed else set()
+        new_ids = [message_id for message_id in changed if message_id not in known]
+        flag_updates = {message_id: self.parse_flags(changed[message_id]) for message_id in known}
+
+        messages, failed, batch_calls = await self.fetch_messages(new_ids)
+        api_calls += batch_calls
+        if failed:
+            # The delta won't return them again once the cursor moves past them
+            print(f"⚠️  {len(failed)} Outlook messages couldn't be fetched, keeping the delta cursor to retry them")
+            delta_link = None
+
+        new_emails = []
+        for message in messages:
+            try:
+                new_emails.append(self.parse_message(message))
+            except Exception as e:
+                print(f"   ❌ Error parsing Outlook message {message.get('id', 'unknown')}: {str(e)}")
+
+        return SyncBatch(
+            new_emails=new_emails,
+            flag_updates=flag_updates,
+            removed=removed,
+            cursor=delta_link or cursor,
+            api_calls=api_calls
+        )
+
+    async def fetch_messages(self, message_ids: List[str]) -> tuple:
+        """Retrieve full messages with $batch, running a few batches concurrently
+
+        Returns (messages, IDs that couldn't be fetched, api_calls)
+        """
+        if not message_ids:
+            return [], [], 0
+
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+        chunks = [message_ids[i:i + BATCH_SIZE] for i in range(0, len(message_ids), BATCH_SIZE)]
+
+        async def run(chunk):
+            async with semaphore:
+                return await self.fetch_batch(chunk)
+
+        print(f"📦 Fetching {len(message_ids)} Outlook messages in {len(chunks)} $batch requests")
+        results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+
+        messages = [message for batch, _, _ in results for message in batch]
+        failed = [message_id for _, batch_failed, _ in results for message_id in batch_failed]
+        api_calls = sum(calls for _, _, calls in results)
+        return messages, failed, api_calls
+
+    async def fetch_batch(self, message_ids: List[str]) -> tuple:
+        """Fetch up to 20 messages in one $batch call, retrying throttled items
+
+        Returns (messages, IDs that couldn't be fetched, api_calls). Messages
+        deleted since the delta (404) are neither.
+        """
+        pending = list(message_ids)
+        messages = []
+        failed = []
+        api_calls = 0
+
+        for attempt in range(MAX_BATCH_RETRIES):
+            requests = [
+                {
+                    "id": str(i),
+                    "method": "GET",
+                    "url": f"/me/messages/{quote(message_id, safe='')}?$select={MESSAGE_SELECT}"
+                }
+                for i, message_id in enumerate(pending)
+            ]
+
+            response = await self.client.post(f"{self.base_url}/$batch", json={"requests": requests})
+            api_calls += 1
+
+            if response.status_code != 200:
+                raise Exception(f"Outlook $batch failed: {response.status_code} - {response.text}")
+
+            retry = []
+            retry_after = 0
+            answered = set()
+            for item in response.json().get("responses", []):
+                message_id = pending[int(item["id"])]
+                answered.add(message_id)
+                if item.get("status") == 200:
+                    messages.append(item["body"])
+                elif item.get("status") in (429, 503, 504):
+                    retry.append(message_id)
+                    retry_after = max(retry_after, int(item.get("headers", {}).get("Retry-After", 1)))
+                elif item.get("status") != 404:
+                    print(f"   ❌ Failed to fetch Outlook message {message_id}: HTTP {item.get('status')}")
+                    failed.append(message_id)
+            failed.extend(message_id for message_id in pending if message_id not in answered)
+
+            if not retry:
+                break
+            if attempt == MAX_BATCH_RETRIES - 1:
+                print(f"   ❌ {len(retry)} Outlook messages still throttled after {MAX_BATCH_RETRIES} attempts")
+                failed.extend(retry)
+                break
+
+            print(f"   ⏳ {len(retry)} Outlook messages throttled, retrying in {retry_after}s")
+            await asyncio.sleep(retry_after)
+            pending = retry
+
+        return messages, failed, api_calls
+
+    def parse_flags(self, item: dict) -> dict:
+        """Email columns derived from a delta item's flags"""
+        return {
+            "is_read": bool(item.get("isRead")),
+            "is_starred": (item.get("flag") or {}).get("flagStatus") == "flagged",
+            "is_important": item.get("importance") == "high",
+        }
+
+    def parse_message(self, message: dict) -> dict:
+        """Parse a Graph message into our Email model format"""
+        def address(recipient: Optional[dict]) -> str:
+            email_address = (recipient or {}).get("emailAddress") or {}
+            name = email_address.get("name")
+            addr = email_address.get("address") or ""
+            return f"{name} <{addr}>" if name and name != addr else addr
+
+        flags = self.parse_flags(message)
+
+        labels = ["INBOX"]
+        if not flags["is_read"]:
+            labels.append("UNREAD")
+        if flags["is_starred"]:
+            labels.append("STARRED")
+        if flags["is_important"]:
+            labels.append("IMPORTANT")
+        if message.get("isDraft"):
+            labels.append("DRAFT")
+
+        data = {
+            "gmail_id": message["id"],
+            "thread_id": message.get("conversationId"),
+            "subject": message.get("subject") or "",
+            "from_address": address(message.get("from")),
+            "to_addresses": [address(r) for r in message.get("toRecipients") or []] or None,
+            "cc_addresses": [address(r) for r in message.get("ccRecipients") or []] or None,
+            "bcc_addresses": [address(r) for r in message.get("bccRecipients") or []] or None,
+            "snippet": message.get("bodyPreview", ""),
+            "labels": labels,
+            "is_draft": bool(message.get("isDraft")),
+            "is_sent": False,
+            "is_trash": False,
+            "has_attachments": bool(message.get("hasAttachments")),
+            **flags,
+        }
+
+        # Apply the same body size caps as Gmail bodies
+        body = message.get("body") or {}
+        kind = "html" if body.get("contentType") == "html" else "text"
+        bounded = BoundedBody(kind, message["id"], self.body_store)
+        bounded.feed_bytes((body.get("content") or "").encode("utf-8"))
+        content = bounded.finish()
+        data["body_text"] = content if kind == "text" else ""
+        data["body_html"] = content if kind == "html" else ""
+        data["body_truncated"] = bounded.truncated
+
+        data["sent_at"] = parse_graph_datetime(message.get("sentDateTime"))
+        data["received_at"] = parse_graph_datetime(message.get("receivedDateTime")) or datetime.utcnow()
+
+        return data
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def parse_graph_datetime(value: Optional[str]) -> Optional[datetime]:
+    """Parse Graph's UTC timestamps ("2024-01-01T10:00:00Z") into naive UTC datetimes"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
@@ -0,0 +1,31 @@
+"""
+Opaque pagination cursors
+
+A cursor is URL-safe base64 of a small JSON object. For mailbox listings it
+holds the (sent_at, id) of the last email returned (keyset pagination), or
+an offset for orderings that have no stable key (search relevance).
+"""
+
+import base64
+import binascii
+import json
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(position: dict) -> str:
+    raw = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+    except (binascii.Error, ValueError) as e:
+        raise InvalidCursor(f"Invalid cursor: {e}")
+    if not isinstance(position, dict):
+        raise InvalidCursor("Invalid cursor")
+    return position
@@ -0,0 +1,68 @@
+"""
+Read-your-writes for replica reads
+
+get_read_db sends a user's mailbox reads to a read replica, except within
+DB_READ_YOUR_WRITES_SECONDS of a write to that user's mailbox, when replica
+lag could still hide it. Every mailbox write publishes a mailbox event
+(services/invalidation.py) that reaches every API process, so whichever
+worker serves the follow-up read knows about the write, wherever it was
+made. Marks expire after the window.
+
+Events published while this process isn't listening are lost, so reads stay
+on the primary while the listener is disconnected and for one window after
+it (re)connects.
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.connection import replica_engines, READ_YOUR_WRITES_SECONDS
+from services.invalidation import on_invalidation, listening
+
+# user_id -> when their mailbox was last written (monotonic), oldest first
+_recent_writes: "OrderedDict[int, float]" = OrderedDict()
+_all_primary_until = 0.0
+# Events are dispatched from any thread (commits of sync sessions included)
+_lock = threading.Lock()
+
+
+def _expire(now: float):
+    while _recent_writes:
+        written_at = next(iter(_recent_writes.values()))
+        if now - written_at < READ_YOUR_WRITES_SECONDS:
+            break
+        _recent_writes.popitem(last=False)
+
+
+@on_invalidation("mailbox")
+def _note_mailbox_write(user_id: Optional[int], version: Optional[int]):
+    global _all_primary_until
+    now = time.monotonic()
+    with _lock:
+        if user_id is None:
+            _all_primary_until = now + READ_YOUR_WRITES_SECONDS
+            _recent_writes.clear()
+            return
+        _recent_writes[user_id] = now
+        _recent_writes.move_to_end(user_id)
+        _expire(now)
+
+
+def reads_need_primary(user_id: int) -> bool:
+    """Whether a replica might not have the user's latest mailbox writes yet"""
+    now = time.monotonic()
+    if not listening() or now < _all_primary_until:
+        return True
+    with _lock:
+        _expire(now)
+        return user_id in _recent_writes
+
+
+def route_reads_to_replica(db: AsyncSession, user_id: int):
+    """Route this session's reads to a replica, unless the user's mailbox changed recently"""
+    if not replica_engines or reads_need_primary(user_id):
+        return
+    db.info["replica"] = random.randrange(len(replica_engines))
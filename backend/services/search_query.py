@@ -0,0 +1,135 @@
+"""
+Gmail-style search queries
+
+Compiles queries like
+    from:alice has:attachment after:2025/01/01 is:unread label:work "quarterly report"
+into SQL predicates that each have a supporting index:
+
+    from:/subject:            trigram GIN indexes (substring match)
+    after:/before:            (user_id, is_trash, sent_at) listing index
+    older_than:/newer_than:   (user_id, is_trash, sent_at) listing index
+    is:unread/starred/important, has:attachment, in:trash
+                              partial indexes on (user_id, sent_at)
+    label:/in:/category:      label storage (services/labels.py)
+
+is:read matches most of a mailbox, so it is filtered during the listing index
+scan instead. Operators can be negated with a leading "-". Everything else (words,
+quoted phrases, unknown operators) is free text for the full-text index.
+"""
+
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import not_
+from models.email import Email
+from models.email_label import SYSTEM_LABEL_BITS
+from services.labels import has_label
+
+TOKEN_PATTERN = re.compile(r'(-?)([a-z_]+):("[^"]*"|\S+)|(-?"[^"]*")|(\S+)', re.IGNORECASE)
+
+DATE_FORMATS = ("%Y/%m/%d", "%Y-%m-%d", "%m/%d/%Y")
+RELATIVE_UNITS = {"d": 1, "w": 7, "m": 30, "y": 365}
+
+IN_ALIASES = {"drafts": "DRAFT", "draft": "DRAFT", "chats": "CHAT"}
+CATEGORY_ALIASES = {"primary": "CATEGORY_PERSONAL", "social": "CATEGORY_SOCIAL", "promotions": "CATEGORY_PROMOTIONS",
+                    "updates": "CATEGORY_UPDATES", "forums": "CATEGORY_FORUMS"}
+
+
+class CompiledSearch:
+    """Predicates for the operators of a query, plus its free text"""
+
+    def __init__(self):
+        self.filters: List = []
+        self.text: Optional[str] = None
+        self.include_trash = False
+        self.relative = False  # newer_than:/older_than: results change with the clock
+
+
+def parse_date(value: str) -> Optional[datetime]:
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_relative(value: str) -> Optional[timedelta]:
+    match = re.fullmatch(r"(\d+)([dwmy])", value.lower())
+    if not match:
+        return None
+    return timedelta(days=int(match.group(1)) * RELATIVE_UNITS[match.group(2)])
+
+
+def label_id(value: str) -> str:
+    # Gmail system label IDs are upper case; label:/in: accept them in any case
+    upper = value.upper()
+    return upper if upper in SYSTEM_LABEL_BITS else value
+
+
+def compile_operator(name: str, value: str, compiled: CompiledSearch):
+    """Predicate for one operator, or None if it isn't one we index"""
+    name = name.lower()
+    lowered = value.lower()
+
+    if name == "from":
+        return Email.from_address.ilike(f"%{value}%")
+    if name == "subject":
+        return Email.subject.ilike(f"%{value}%")
+    if name in ("after", "before"):
+        date = parse_date(value)
+        if date is None:
+            return None
+        return Email.sent_at >= date if name == "after" else Email.sent_at < date
+    if name in ("newer_than", "older_than"):
+        age = parse_relative(value)
+        if age is None:
+            return None
+        compiled.relative = True
+        since = datetime.utcnow() - age
+        return Email.sent_at >= since if name == "newer_than" else Email.sent_at < since
+    if name == "is":
+        return {
+            "unread": Email.is_read == False,
+            "read": Email.is_read == True,
+            "starred": Email.is_starred == True,
+            "important": Email.is_important == True,
+        }.get(lowered)
+    if name == "has" and lowered in ("attachment", "attachments"):
+        return Email.has_attachments == True
+    if name == "label":
+        return has_label(label_id(value))
+    if name == "category" and lowered in CATEGORY_ALIASES:
+        return has_label(CATEGORY_ALIASES[lowered])
+    if name == "in":
+        if lowered == "anywhere":
+            compiled.include_trash = True
+            return True
+        if lowered == "trash":
+            compiled.include_trash = True
+            return Email.is_trash == True
+        return has_label(IN_ALIASES.get(lowered, label_id(value)))
+    return None
+
+
+def compile_search(query: str) -> CompiledSearch:
+    """Split a search query into indexed predicates and free text"""
+    compiled = CompiledSearch()
+    text_parts = []
+
+    for match in TOKEN_PATTERN.finditer(query or ""):
+        negated, name, value, phrase, word = match.groups()
+        if name is None:
+            text_parts.append(phrase or word)
+            continue
+
+        predicate = compile_operator(name, value.strip('"'), compiled)
+        if predicate is None:
+            # Unknown operator or bad value: search for it as text
+            text_parts.append(match.group(0))
+        elif predicate is not True:
+            compiled.filters.append(not_(predicate) if negated else predicate)
+
+    text = " ".join(text_parts).strip()
+    compiled.text = text or None
+    return compiled
@@ -0,0 +1,60 @@
+"""
+Fast response encoding for bulk endpoints
+
+Listing rows arrive as plain tuples and are zipped into dicts, skipping
+pydantic validation; orjson encodes them, normalizing naive timestamps to
+UTC in the same pass. Clients that send Accept: application/msgpack get
+MessagePack instead.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Optional
+from fastapi import Request
+from fastapi.responses import Response
+import orjson
+import msgpack
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def encode_json(content: Any) -> bytes:
+    # Naive datetimes in the emails table are UTC, as EmailResponse assumes
+    return orjson.dumps(content, option=orjson.OPT_NAIVE_UTC)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+def _encode_datetime(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        # Timestamps as the same ISO strings the JSON responses carry
+        return msgpack.packb(content, default=_encode_datetime, datetime=False)
+
+
+def wants_msgpack(request: Request) -> bool:
+    return MSGPACK_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def fast_response(request: Request, content: Any, headers: Optional[dict] = None) -> Response:
+    """Encode content as msgpack when the client accepts it, otherwise as JSON"""
+    response_class = MsgPackResponse if wants_msgpack(request) else FastJSONResponse
+    return response_class(content, headers={**(headers or {}), "Vary": "Accept"})
+
+
+def rows_to_dicts(rows, fields) -> list:
+    """Zip result tuples into dicts; rows may carry extra trailing columns, which are dropped"""
+    return [dict(zip(fields, row)) for row in rows]
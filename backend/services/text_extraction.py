@@ -0,0 +1,48 @@
+"""
+Plain text extraction from HTML email bodies (for search indexing)
+"""
+
+from html.parser import HTMLParser
+
+# Content of these elements is never visible text
+SKIPPED_TAGS = {"script", "style", "head", "title", "noscript"}
+
+# Elements that separate words even without surrounding whitespace
+BLOCK_TAGS = {"br", "p", "div", "td", "th", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6", "table", "blockquote"}
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """Visible text of an HTML document, whitespace collapsed"""
+    if not html:
+        return ""
+    extractor = _TextExtractor()
+    try:
+        extractor.feed(html)
+        extractor.close()
+    except Exception:
+        # Malformed markup: keep whatever was extracted so far
+        pass
+    return " ".join("".join(extractor.parts).split())
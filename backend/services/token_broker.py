@@ -0,0 +1,265 @@
+"""
+Async OAuth token broker
+
+The single place where Google and Microsoft access tokens are refreshed.
+  * valid tokens are cached in memory, so callers normally get a token
+    without touching the database or the network
+  * concurrent callers needing a refresh for the same user/account share one
+    in-flight refresh request (single flight)
+  * a background loop renews recently used tokens before they expire, so
+    sync and API calls don't wait on a token round trip
+
+Tokens are keyed ("user", user_id) for the primary Google token on the users
+table and ("account", account_id) for connected accounts. All expiry times
+are naive UTC.
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from dotenv import load_dotenv
+from database.connection import SessionLocal
+from models.user import User
+from models.connected_account import ConnectedAccount
+from services.http_client import get_http_client
+
+load_dotenv()
+
+TokenKey = Tuple[str, int]
+
+GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
+MICROSOFT_PROVIDERS = ("outlook", "azure-ad")
+
+# A cached token is handed out only if it is valid for at least this long
+MIN_VALIDITY = timedelta(seconds=60)
+
+# The renewal loop refreshes tokens expiring within RENEW_AHEAD that were used
+# within RENEW_IF_USED_WITHIN, checking every RENEW_INTERVAL_SECONDS
+RENEW_AHEAD = timedelta(minutes=int(os.getenv("TOKEN_RENEW_AHEAD_MINUTES", "10")))
+RENEW_IF_USED_WITHIN = timedelta(hours=1)
+RENEW_INTERVAL_SECONDS = int(os.getenv("TOKEN_RENEW_INTERVAL_SECONDS", "60"))
+
+
+class TokenRefreshError(Exception):
+    pass
+
+
+class CachedToken:
+    def __init__(self, access_token: str, expires_at: Optional[datetime]):
+        self.access_token = access_token
+        self.expires_at = expires_at
+        self.last_used = datetime.utcnow()
+
+    def valid_for(self, margin: timedelta) -> bool:
+        # Tokens without a known expiry are trusted until a refresh is forced
+        return self.expires_at is None or self.expires_at > datetime.utcnow() + margin
+
+
+# The cache is shared by every loop in the process; access is guarded by a lock
+_cache: Dict[TokenKey, CachedToken] = {}
+_cache_lock = threading.Lock()
+
+
+def invalidate_cached_token(kind: str, id: int):
+    """Drop a cached token, e.g. after a login stored a new one in the database"""
+    with _cache_lock:
+        _cache.pop((kind, id), None)
+
+
+class TokenBroker:
+    def __init__(self):
+        self.inflight: Dict[TokenKey, asyncio.Task] = {}
+        self.renewal_task: Optional[asyncio.Task] = None
+
+    async def get_user_token(self, user_id: int) -> str:
+        """Valid Google access token for a user's primary mailbox"""
+        return await self.get_token(("user", user_id))
+
+    async def get_account_token(self, account_id: int) -> str:
+        """Valid access token for a connected Google or Microsoft account"""
+        return await self.get_token(("account", account_id))
+
+    async def get_token(self, key: TokenKey) -> str:
+        with _cache_lock:
+            cached = _cache.get(key)
+        if cached and cached.valid_for(MIN_VALIDITY):
+            cached.last_used = datetime.utcnow()
+            return cached.access_token
+
+        # Not cached yet: the database copy may still be good
+        if not cached:
+            cached = await asyncio.to_thread(self.load_token, key)
+            if cached and cached.valid_for(MIN_VALIDITY):
+                with _cache_lock:
+                    _cache[key] = cached
+                return cached.access_token
+
+        return await self.refresh(key)
+
+    async def refresh(self, key: TokenKey) -> str:
+        """Refresh a token, sharing one request between concurrent callers"""
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.do_refresh(key))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        # shield: one caller being cancelled must not cancel the shared refresh
+        return await asyncio.shield(task)
+
+    async def do_refresh(self, key: TokenKey) -> str:
+        provider, refresh_token, label = await asyncio.to_thread(self.load_refresh_token, key)
+        if not refresh_token:
+            raise TokenRefreshError(f"No refresh token available for {label}")
+
+        print(f"🔄 Refreshing {provider} token for {label}...")
+
+        if provider in MICROSOFT_PROVIDERS:
+            tenant_id = os.getenv("AZURE_AD_TENANT_ID", "common")
+            url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
+            data = {
+                "client_id": os.getenv("AZURE_AD_CLIENT_ID"),
+                "client_secret": os.getenv("AZURE_AD_CLIENT_SECRET"),
+                "refresh_token": refresh_token,
+                "grant_type": "refresh_token",
+                "scope": "offline_access https://graph.microsoft.com/Mail.ReadWrite",
+            }
+        else:
+            url = GOOGLE_TOKEN_URL
+            data = {
+                "client_id": os.getenv("GOOGLE_CLIENT_ID"),
+                "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
+                "refresh_token": refresh_token,
+                "grant_type": "refresh_token",
+            }
+
+        response = await get_http_client().post(url, data=data)
+        if response.status_code != 200:
+            raise TokenRefreshError(f"Token refresh failed: {response.status_code} - {response.text}")
+
+        token_data = response.json()
+        access_token = token_data["access_token"]
+        expires_at = datetime.utcnow() + timedelta(seconds=token_data.get("expires_in", 3600))
+
+        # Microsoft rotates refresh tokens on every refresh
+        await asyncio.to_thread(self.store_token, key, access_token, expires_at, token_data.get("refresh_token"))
+
+        with _cache_lock:
+            _cache[key] = CachedToken(access_token, expires_at)
+
+        print(f"✅ Token refreshed successfully for {label}")
+        return access_token
+
+    def load_token(self, key: TokenKey) -> Optional[CachedToken]:
+        """Read the stored access token (runs in a thread)"""
+        db = SessionLocal()
+        try:
+            kind, id = key
+            if kind == "user":
+                user = db.query(User).filter(User.id == id).first()
+                if not user or not user.google_access_token:
+                    return None
+                # A primary token without a recorded expiry is refreshed once to learn it
+                if not user.google_token_expires_at and user.google_refresh_token:
+                    return None
+                return CachedToken(user.google_access_token, user.google_token_expires_at)
+
+            account = db.query(ConnectedAccount).filter(ConnectedAccount.id == id).first()
+            if not account or not account.access_token:
+                return None
+            return CachedToken(account.access_token, account.token_expires_at)
+        finally:
+            db.close()
+
+    def load_refresh_token(self, key: TokenKey) -> Tuple[str, Optional[str], str]:
+        """Read (provider, refresh token, label for logging) (runs in a thread)"""
+        db = SessionLocal()
+        try:
+            kind, id = key
+            if kind == "user":
+                user = db.query(User).filter(User.id == id).first()
+                if not user:
+                    raise TokenRefreshError(f"User {id} not found")
+                return "google", user.google_refresh_token, user.email
+
+            account = db.query(ConnectedAccount).filter(ConnectedAccount.id == id).first()
+            if not account:
+                raise TokenRefreshError(f"Connected account {id} not found")
+            return account.provider, account.refresh_token, account.email
+        finally:
+            db.close()
+
+    def store_token(self, key: TokenKey, access_token: str, expires_at: datetime, refresh_token: Optional[str]):
+        """Persist a refreshed token (runs in a thread)"""
+        db = SessionLocal()
+        try:
+            kind, id = key
+            if kind == "user":
+                user = db.query(User).filter(User.id == id).first()
+                if user:
+                    user.google_access_token = access_token
+                    user.google_token_expires_at = expires_at
+                    if refresh_token:
+                        user.google_refresh_token = refresh_token
+            else:
+                account = db.query(ConnectedAccount).filter(ConnectedAccount.id == id).first()
+                if account:
+                    account.access_token = access_token
+                    account.token_expires_at = expires_at
+                    if refresh_token:
+                        account.refresh_token = refresh_token
+            db.commit()
+        finally:
+            db.close()
+
+    def start(self):
+        """Start proactive renewal on the running loop"""
+        if self.renewal_task is None or self.renewal_task.done():
+            self.renewal_task = asyncio.ensure_future(self.renewal_loop())
+
+    async def stop(self):
+        if self.renewal_task:
+            self.renewal_task.cancel()
+            try:
+                await self.renewal_task
+            except asyncio.CancelledError:
+                pass
+            self.renewal_task = None
+
+    async def renewal_loop(self):
+        """Refresh recently used tokens shortly before they expire"""
+        while True:
+            await asyncio.sleep(RENEW_INTERVAL_SECONDS)
+
+            now = datetime.utcnow()
+            with _cache_lock:
+                for key in [k for k, t in _cache.items() if now - t.last_used > RENEW_IF_USED_WITHIN]:
+                    del _cache[key]
+                due = [k for k, t in _cache.items() if not t.valid_for(RENEW_AHEAD)]
+
+            for key in due:
+                try:
+                    await self.refresh(key)
+                except Exception as e:
+                    print(f"⚠️  Proactive token renewal failed for {key}: {str(e)}")
+                    with _cache_lock:
+                        _cache.pop(key, None)
+
+
+_brokers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, TokenBroker]" = weakref.WeakKeyDictionary()
+
+
+def get_token_broker() -> TokenBroker:
+    """Get the broker for the running event loop
+
+    In-flight refreshes are tied to a loop, so each loop gets its own broker;
+    the token cache itself is shared process-wide.
+    """
+    loop = asyncio.get_running_loop()
+    broker = _brokers.get(loop)
+    if broker is None:
+        broker = TokenBroker()
+        _brokers[loop] = broker
+    return broker
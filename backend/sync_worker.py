@@ -1,65 +1,295 @@
 #!/usr/bin/env python3
 """
-Background worker for syncing emails from Gmail API to local database
+Background worker for syncing emails from Gmail API (and other providers) to local database
 """
 
 import asyncio
 import httpx
-import base64
 import json
 from datetime import datetime, timedelta
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from database.connection import SessionLocal
 from models.user import User
+from models.connected_account import ConnectedAccount
 from models.email import Email
 from models.sync_state import SyncState
 from services.email_service import EmailService
-from services.token_service import TokenService
+from services.token_broker import get_token_broker
+from services.http_client import close_http_client
+from database.instrumentation import current_endpoint
+from services.body_store import BodyStore
+from services.email_search import index_email
+from services.labels import set_flag
+from services.body_parser import BoundedBody, BODY_DB_MAX_BYTES
+from services.mail_provider import MailProvider, CursorExpired
+from services.outlook_provider import OutlookProvider
+from services.imap_provider import ImapProvider
+from services.credential_cipher import decrypt_credential
+from typing import Optional
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Messages requested per messages.list page (Gmail's maximum is 500)
+PAGE_SIZE = 500
+
+# How message details are fetched: "auto", "messages" or "threads".
+# In "auto" mode a page is fetched by thread when its new messages fall into
+# at most THREAD_CLUSTER_RATIO threads per message.
+FETCH_STRATEGY = os.getenv("GMAIL_FETCH_STRATEGY", "auto")
+THREAD_CLUSTER_RATIO = float(os.getenv("GMAIL_THREAD_CLUSTER_RATIO", "0.5"))
+
+# ConnectedAccount providers backed by the Gmail API
+GMAIL_PROVIDERS = ("gmail", "google")
+OUTLOOK_PROVIDERS = ("outlook", "azure-ad")
+IMAP_PROVIDERS = ("imap",)
+SYNCED_PROVIDERS = GMAIL_PROVIDERS + OUTLOOK_PROVIDERS + IMAP_PROVIDERS
+
+# Wait before reconnecting an IDLE watcher after an error
+IDLE_RETRY_SECONDS = 60
+
 class GmailSyncWorker:
     def __init__(self):
         self.db: Session = SessionLocal()
-        self.token_service = TokenService(self.db)
+        self.api_calls_saved = 0
+        self.body_store = BodyStore()
 
     async def sync_all_users(self):
         """Sync emails for all active users"""
         print("🔄 Starting email sync for all users...")
 
+        has_connected_account = self.db.query(ConnectedAccount.id).filter(
+            ConnectedAccount.user_id == User.id,
+            ConnectedAccount.is_active == True
+        ).exists()
+
         users = self.db.query(User).filter(
             User.is_active == True,
-            User.google_access_token.isnot(None)
+            or_(User.google_access_token.isnot(None), has_connected_account)
         ).all()
 
         print(f"📧 Found {len(users)} users to sync")
 
         for user in users:
             try:
-                await self.sync_user_emails(user)
+                await self.sync_user_all_accounts(user)
             except Exception as e:
                 print(f"❌ Error syncing user {user.email}: {str(e)}")
-                await self.log_sync_error(user.id, str(e))
 
-    async def sync_user_emails(self, user: User):
-        """Sync emails for a specific user"""
+    async def sync_user_all_accounts(self, user: User):
+        """Sync the user's primary mailbox and every active connected account concurrently
+
+        Each connected account is its own sync unit with its own SyncState and
+        runs on its own worker (and database session), since a Session must not
+        be shared between concurrently running tasks.
+        """
+        accounts = self.db.query(ConnectedAccount).filter(
+            ConnectedAccount.user_id == user.id,
+            ConnectedAccount.is_active == True
+        ).all()
+
+        units = []
+        if user.google_access_token:
+            units.append((user.email, self.sync_user_emails(user)))
+
+        for account in accounts:
+            if account.provider not in SYNCED_PROVIDERS:
+                print(f"⏭️  Skipping {account.provider} account {account.email} - provider not supported by sync")
+                continue
+
+            # The user's own Google mailbox is already synced from the users table
+            if account.provider in GMAIL_PROVIDERS and user.google_access_token \
+                    and account.email.lower() == user.email.lower():
+                continue
+
+            units.append((account.email, self.sync_connected_account(account.id)))
+
+        print(f"📬 Syncing {len(units)} mailboxes for {user.email} in parallel")
+
+        results = await asyncio.gather(*(unit for _, unit in units), return_exceptions=True)
+
+        for (mailbox, _), result in zip(units, results):
+            if isinstance(result, Exception):
+                print(f"❌ Error syncing mailbox {mailbox}: {str(result)}")
+
+    async def sync_connected_account(self, account_id: int):
+        """Sync one connected account on a dedicated worker and session"""
+        worker = GmailSyncWorker()
+        try:
+            account = worker.db.query(ConnectedAccount).filter(ConnectedAccount.id == account_id).first()
+            if not account or not account.is_active:
+                return
+
+            if account.provider in GMAIL_PROVIDERS:
+                await worker.sync_user_emails(account.user, account)
+            else:
+                await worker.sync_provider_account(account.user, account)
+        finally:
+            worker.close()
+
+    def create_provider(self, account: ConnectedAccount, access_token: str) -> MailProvider:
+        """Build the MailProvider that syncs a non-Gmail connected account
+
+        access_token is the stored token; for IMAP, the encrypted password.
+        """
+        if account.provider in OUTLOOK_PROVIDERS:
+            return OutlookProvider(access_token, body_store=self.body_store)
+        if account.provider in IMAP_PROVIDERS:
+            return ImapProvider(
+                account.id,
+                account.imap_host,
+                account.imap_port or 993,
+                account.email,
+                decrypt_credential(access_token),
+                body_store=self.body_store
+            )
+        raise Exception(f"No sync provider for {account.provider}")
+
+    async def watch_imap_accounts(self):
+        """Keep an IDLE connection per active IMAP account and sync as soon as it reports changes"""
+        account_ids = [
+            row[0] for row in self.db.query(ConnectedAccount.id).filter(
+                ConnectedAccount.provider.in_(IMAP_PROVIDERS),
+                ConnectedAccount.is_active == True
+            ).all()
+        ]
+
+        print(f"👀 Watching {len(account_ids)} IMAP accounts with IDLE")
+        await asyncio.gather(*(self.watch_imap_account(account_id) for account_id in account_ids))
+
+    async def watch_imap_account(self, account_id: int):
+        """IDLE on one IMAP account forever, syncing it whenever the mailbox changes"""
+        # Catch up on anything that arrived while we weren't watching
+        await self.sync_connected_account_safely(account_id)
+
+        while True:
+            # Short-lived session: watchers run concurrently and idle for minutes
+            db = SessionLocal()
+            try:
+                account = db.query(ConnectedAccount).filter(ConnectedAccount.id == account_id).first()
+                if not account or not account.is_active:
+                    print(f"⏹️  Stopped watching IMAP account {account_id}")
+                    return
+                mailbox = account.email
+                provider = self.create_provider(account, account.access_token)
+            finally:
+                db.close()
+
+            try:
+                # An IDLE timeout drops out to re-check the account and reconnect
+                while await provider.wait_for_changes():
+                    print(f"📬 IMAP account {mailbox} changed - syncing")
+                    await self.sync_connected_account_safely(account_id)
+            except Exception as e:
+                print(f"❌ IDLE connection for {mailbox} failed: {str(e)}")
+                await asyncio.sleep(IDLE_RETRY_SECONDS)
+            finally:
+                await provider.close()
+
+    async def sync_connected_account_safely(self, account_id: int):
+        try:
+            await self.sync_connected_account(account_id)
+        except Exception as e:
+            print(f"❌ Error syncing connected account {account_id}: {str(e)}")
+
+    async def sync_provider_account(self, user: User, account: ConnectedAccount):
+        """Sync a connected account through its MailProvider and the shared ingest pipeline"""
+        import time
+        start_time = time.time()
+        provider_name = account.provider
+
+        print(f"🚀 === STARTING {provider_name.upper()} SYNC FOR {account.email} ===")
+
+        sync_state = self.db.query(SyncState).filter(
+            SyncState.user_id == user.id,
+            SyncState.provider == provider_name,
+            SyncState.account_id == account.id
+        ).first()
+
+        if not sync_state:
+            print(f"🆕 Creating new sync state for {account.email}")
+            sync_state = SyncState(
+                user_id=user.id,
+                account_id=account.id,
+                provider=provider_name,
+                last_sync_token=None,
+                total_emails_synced=0
+            )
+            self.db.add(sync_state)
+            self.db.commit()
+
+        provider = None
+        try:
+            access_token = await get_token_broker().get_account_token(account.id)
+            provider = self.create_provider(account, access_token)
+
+            def known_ids(message_ids: list) -> set:
+                return self.known_message_ids(user.id, message_ids)
+
+            try:
+                batch = await provider.fetch_changes(sync_state.last_sync_token, known_ids)
+            except CursorExpired as e:
+                print(f"♻️  {str(e)} - restarting with a full sync")
+                batch = await provider.fetch_changes(None, known_ids)
+
+            await self.ingest_emails(user.id, batch.new_emails, account.id)
+            await self.apply_flag_updates(user.id, batch.flag_updates)
+            await self.apply_removals(user.id, batch.removed)
+
+            sync_state.last_sync_token = batch.cursor
+            sync_state.total_emails_synced += len(batch.new_emails)
+            sync_state.last_sync_at = datetime.utcnow()
+            sync_state.next_sync_at = datetime.utcnow() + timedelta(minutes=15)
+            sync_state.last_email_count = len(batch.new_emails)
+            sync_state.last_error = None
+            sync_state.error_count = 0
+            self.db.commit()
+
+            duration = time.time() - start_time
+            print(f"🎉 === {provider_name.upper()} SYNC COMPLETED FOR {account.email} ===")
+            print(f"   • Duration: {duration:.2f} seconds")
+            print(f"   • New emails this sync: {len(batch.new_emails)}")
+            print(f"   • Flag updates: {len(batch.flag_updates)}")
+            print(f"   • Removals: {len(batch.removed)}")
+            print(f"   • API calls: {batch.api_calls}")
+
+        except Exception as e:
+            duration = time.time() - start_time
+            print(f"💥 === {provider_name.upper()} SYNC FAILED FOR {account.email} ===")
+            print(f"   • Duration: {duration:.2f} seconds")
+            print(f"   • Error: {str(e)}")
+            self.db.rollback()
+            await self.log_sync_error(user.id, str(e), account.id, provider_name)
+            raise
+        finally:
+            if provider:
+                await provider.close()
+
+    async def sync_user_emails(self, user: User, account: Optional[ConnectedAccount] = None):
+        """Sync emails for a user's primary mailbox, or for one of their connected accounts"""
         import time
         start_time = time.time()
+        api_calls_saved_before = self.api_calls_saved
 
-        print(f"🚀 === STARTING EMAIL SYNC FOR {user.email} ===")
+        mailbox = account.email if account else user.email
+        account_id = account.id if account else None
+
+        print(f"🚀 === STARTING EMAIL SYNC FOR {mailbox} ===")
 
         # Get or create sync state
         sync_state = self.db.query(SyncState).filter(
             SyncState.user_id == user.id,
-            SyncState.provider == "gmail"
+            SyncState.provider == "gmail",
+            SyncState.account_id == account_id
         ).first()
 
         if not sync_state:
-            print(f"🆕 Creating new sync state for {user.email}")
+            print(f"🆕 Creating new sync state for {mailbox}")
             sync_state = SyncState(
                 user_id=user.id,
+                account_id=account_id,
                 provider="gmail",
                 last_sync_token=None,
                 total_emails_synced=0
@@ -70,22 +300,15 @@ class GmailSyncWorker:
             print(f"📊 Existing sync state: {sync_state.total_emails_synced} emails synced previously")
 
         try:
-            # Check if token is expired and refresh if needed
-            if user.google_token_expires_at and user.google_token_expires_at < datetime.utcnow():
-                print(f"🔄 Token expired, refreshing access token")
-                await self.refresh_access_token(user)
-            else:
-                print(f"✅ Access token is valid")
-
-            # Sync emails
-            new_emails = await self.fetch_new_emails(user, sync_state)
+            # Sync emails (fetch_new_emails gets a valid token from the broker)
+            new_emails = await self.fetch_new_emails(user, sync_state, account)
 
             if new_emails:
-                await self.store_emails(user.id, new_emails)
+                await self.store_emails(user.id, new_emails, account_id)
                 sync_state.total_emails_synced += len(new_emails)
-                print(f"✅ Successfully synced {len(new_emails)} new emails for {user.email}")
+                print(f"✅ Successfully synced {len(new_emails)} new emails for {mailbox}")
             else:
-                print(f"📭 No new emails found for {user.email}")
+                print(f"📭 No new emails found for {mailbox}")
 
             # Update sync state
             sync_state.last_sync_at = datetime.utcnow()
@@ -99,29 +322,35 @@ class GmailSyncWorker:
             # Final summary
             end_time = time.time()
             duration = end_time - start_time
-            print(f"🎉 === SYNC COMPLETED FOR {user.email} ===")
+            print(f"🎉 === SYNC COMPLETED FOR {mailbox} ===")
             print(f"   • Duration: {duration:.2f} seconds")
             print(f"   • New emails this sync: {len(new_emails) if new_emails else 0}")
             print(f"   • Total emails synced ever: {sync_state.total_emails_synced}")
+            print(f"   • API calls saved by thread fetch: {self.api_calls_saved - api_calls_saved_before}")
 
         except Exception as e:
             end_time = time.time()
             duration = end_time - start_time
-            print(f"💥 === SYNC FAILED FOR {user.email} ===")
+            print(f"💥 === SYNC FAILED FOR {mailbox} ===")
             print(f"   • Duration: {duration:.2f} seconds")
             print(f"   • Error: {str(e)}")
-            await self.log_sync_error(user.id, str(e))
+            self.db.rollback()
+            await self.log_sync_error(user.id, str(e), account_id)
             raise
 
-    async def fetch_new_emails(self, user: User, sync_state: SyncState) -> list:
+    async def fetch_new_emails(self, user: User, sync_state: SyncState, account: Optional[ConnectedAccount] = None) -> list:
         """Fetch new emails from Gmail API with continuation support"""
-        print(f"🔍 Starting email fetch for {user.email}")
+        mailbox = account.email if account else user.email
+        print(f"🔍 Starting email fetch for {mailbox}")
 
-        # Ensure we have a valid access token (auto-refresh if needed)
+        # Ensure we have a valid access token (cached, refreshed by the broker if needed)
         try:
-            access_token = self.token_service.ensure_valid_token(user.id)
+            if account:
+                access_token = await get_token_broker().get_account_token(account.id)
+            else:
+                access_token = await get_token_broker().get_user_token(user.id)
         except Exception as e:
-            print(f"❌ Failed to get valid token for {user.email}: {e}")
+            print(f"❌ Failed to get valid token for {mailbox}: {e}")
             raise
 
         headers = {
@@ -137,7 +366,7 @@ class GmailSyncWorker:
         while True:
             # Build query parameters
             params = {
-                "maxResults": 500,  # Gmail's maximum per request
+                "maxResults": PAGE_SIZE,  # Gmail's maximum per request
                 "q": "in:inbox"  # Only inbox emails for now
             }
 
@@ -189,56 +418,48 @@ class GmailSyncWorker:
         if not all_messages:
             return []
 
-        # Fetch full message details
+        # Fetch full message details, one list page at a time so the
+        # fetch strategy can be chosen per page
         full_messages = []
         duplicate_count = 0
         error_count = 0
+        api_calls = 0
+        api_calls_saved = 0
 
         print(f"🔄 Processing {len(all_messages)} messages:")
 
         async with httpx.AsyncClient() as client:
-            for i, message in enumerate(all_messages):
-                message_id = message["id"]
-                print(f"📨 [{i+1}/{len(all_messages)}] Processing message ID: {message_id}")
-
-                # Check if we already have this email
-                existing = self.db.query(Email).filter(
-                    Email.gmail_id == message_id,
-                    Email.user_id == user.id
-                ).first()
-
-                if existing:
-                    print(f"   ⏩ Skipping - email already exists in database")
-                    duplicate_count += 1
+            for page_index in range(0, len(all_messages), PAGE_SIZE):
+                page = all_messages[page_index:page_index + PAGE_SIZE]
+
+                # Check which of these we already have in one query
+                page_ids = [message["id"] for message in page]
+                existing_ids = {
+                    row[0] for row in self.db.query(Email.gmail_id).filter(
+                        Email.gmail_id.in_(page_ids),
+                        Email.user_id == user.id
+                    ).all()
+                }
+                new_messages = [m for m in page if m["id"] not in existing_ids]
+                duplicate_count += len(page) - len(new_messages)
+
+                if not new_messages:
+                    print(f"   ⏩ Skipping page - all {len(page)} emails already exist in database")
                     continue
 
-                try:
-                    # Fetch full message
-                    print(f"   🌐 Fetching full message details from Gmail API")
-                    msg_response = await client.get(
-                        f"https://gmail.googleapis.com/gmail/v1/users/me/messages/{message_id}",
-                        headers=headers
-                    )
-
-                    if msg_response.status_code == 200:
-                        full_msg = msg_response.json()
-
-                        # Extract basic info for logging
-                        payload = full_msg.get("payload", {})
-                        headers_dict = {h["name"]: h["value"] for h in payload.get("headers", [])}
-                        subject = headers_dict.get("Subject", "(No Subject)")[:50]
-                        from_addr = headers_dict.get("From", "(Unknown Sender)")[:30]
-                        date_str = headers_dict.get("Date", "(No Date)")
-
-                        print(f"   ✅ New email: '{subject}' from '{from_addr}' ({date_str})")
-                        full_messages.append(full_msg)
-                    else:
-                        print(f"   ❌ Failed to fetch message {message_id}: HTTP {msg_response.status_code}")
-                        error_count += 1
+                strategy = self.choose_fetch_strategy(new_messages)
 
-                except Exception as e:
-                    print(f"   ❌ Error fetching message {message_id}: {str(e)}")
-                    error_count += 1
+                if strategy == "threads":
+                    fetched, calls, errors = await self.fetch_messages_by_thread(client, headers, new_messages)
+                    api_calls_saved += len(new_messages) - calls
+                else:
+                    fetched, calls, errors = await self.fetch_messages_individually(client, headers, new_messages)
+
+                full_messages.extend(fetched)
+                api_calls += calls
+                error_count += errors
+
+            self.api_calls_saved += api_calls_saved
 
             print(f"📊 Final Fetch Summary:")
             print(f"   • Total pages processed: {page_num}")
@@ -246,40 +467,177 @@ class GmailSyncWorker:
             print(f"   • New messages to process: {len(full_messages)}")
             print(f"   • Duplicates skipped: {duplicate_count}")
             print(f"   • Fetch errors: {error_count}")
+            print(f"   • Detail API calls made: {api_calls}")
+            print(f"   • API calls saved by thread fetch: {api_calls_saved}")
 
             return full_messages
 
-    async def store_emails(self, user_id: int, gmail_messages: list):
-        """Store Gmail messages in local database"""
+    def choose_fetch_strategy(self, messages: list) -> str:
+        """Pick "threads" or "messages" for a page of new message references.
+
+        Thread fetching costs one call per conversation, so it pays off when
+        the page's messages cluster into few threads.
+        """
+        if FETCH_STRATEGY in ("threads", "messages"):
+            return FETCH_STRATEGY
+
+        thread_ids = {m.get("threadId") or m["id"] for m in messages}
+        if len(messages) > 1 and len(thread_ids) <= len(messages) * THREAD_CLUSTER_RATIO:
+            print(f"🧵 {len(messages)} new messages in {len(thread_ids)} threads - fetching by thread")
+            return "threads"
+
+        return "messages"
+
+    async def fetch_messages_individually(self, client: httpx.AsyncClient, headers: dict, messages: list) -> tuple:
+        """Fetch messages one by one via messages.get
+
+        Returns (full_messages, api_calls, error_count)
+        """
+        full_messages = []
+        error_count = 0
+
+        for i, message in enumerate(messages):
+            message_id = message["id"]
+            print(f"📨 [{i+1}/{len(messages)}] Processing message ID: {message_id}")
+
+            full_msg = await self.fetch_message(client, headers, message_id)
+            if full_msg:
+                self.log_fetched_message(full_msg)
+                full_messages.append(full_msg)
+            else:
+                error_count += 1
+
+        return full_messages, len(messages), error_count
+
+    async def fetch_messages_by_thread(self, client: httpx.AsyncClient, headers: dict, messages: list) -> tuple:
+        """Fetch whole conversations via threads.get, one call per thread
+
+        Only the messages we asked for are returned; threads.get also includes
+        messages we already have or that are outside the synced query.
+        Returns (full_messages, api_calls, error_count)
+        """
+        threads = {}
+        for message in messages:
+            threads.setdefault(message.get("threadId") or message["id"], set()).add(message["id"])
+
+        full_messages = []
+        api_calls = 0
+        error_count = 0
+
+        for i, (thread_id, wanted_ids) in enumerate(threads.items()):
+            print(f"🧵 [{i+1}/{len(threads)}] Processing thread ID: {thread_id} ({len(wanted_ids)} new messages)")
+            api_calls += 1
+
+            try:
+                response = await client.get(
+                    f"https://gmail.googleapis.com/gmail/v1/users/me/threads/{thread_id}",
+                    headers=headers,
+                    params={"format": "full"}
+                )
+            except Exception as e:
+                print(f"   ❌ Error fetching thread {thread_id}: {str(e)}")
+                response = None
+
+            if response is not None and response.status_code == 200:
+                for full_msg in response.json().get("messages", []):
+                    if full_msg.get("id") in wanted_ids:
+                        wanted_ids.discard(full_msg["id"])
+                        self.log_fetched_message(full_msg)
+                        full_messages.append(full_msg)
+            elif response is not None:
+                print(f"   ❌ Failed to fetch thread {thread_id}: HTTP {response.status_code}")
+
+            # Anything the thread call didn't return falls back to messages.get
+            for message_id in wanted_ids:
+                api_calls += 1
+                full_msg = await self.fetch_message(client, headers, message_id)
+                if full_msg:
+                    self.log_fetched_message(full_msg)
+                    full_messages.append(full_msg)
+                else:
+                    error_count += 1
+
+        return full_messages, api_calls, error_count
+
+    async def fetch_message(self, client: httpx.AsyncClient, headers: dict, message_id: str) -> Optional[dict]:
+        """Fetch a single full message via messages.get, or None on failure"""
+        try:
+            print(f"   🌐 Fetching full message details from Gmail API")
+            msg_response = await client.get(
+                f"https://gmail.googleapis.com/gmail/v1/users/me/messages/{message_id}",
+                headers=headers
+            )
+
+            if msg_response.status_code == 200:
+                return msg_response.json()
+
+            print(f"   ❌ Failed to fetch message {message_id}: HTTP {msg_response.status_code}")
+        except Exception as e:
+            print(f"   ❌ Error fetching message {message_id}: {str(e)}")
+
+        return None
+
+    def log_fetched_message(self, full_msg: dict):
+        """Log basic info about a fetched message"""
+        payload = full_msg.get("payload", {})
+        headers_dict = {h["name"]: h["value"] for h in payload.get("headers", [])}
+        subject = headers_dict.get("Subject", "(No Subject)")[:50]
+        from_addr = headers_dict.get("From", "(Unknown Sender)")[:30]
+        date_str = headers_dict.get("Date", "(No Date)")
+
+        print(f"   ✅ New email: '{subject}' from '{from_addr}' ({date_str})")
+
+    async def store_emails(self, user_id: int, gmail_messages: list, account_id: Optional[int] = None):
+        """Parse Gmail messages and store them in local database, tagged with the account they came from"""
         if not gmail_messages:
             print(f"📭 No emails to store")
             return
 
-        print(f"💾 Storing {len(gmail_messages)} emails in database")
-
-        stored_count = 0
+        parsed = []
         error_count = 0
 
         for i, msg in enumerate(gmail_messages):
             message_id = msg.get('id', 'unknown')
             try:
-                print(f"   📝 [{i+1}/{len(gmail_messages)}] Parsing and storing message {message_id}")
+                print(f"   📝 [{i+1}/{len(gmail_messages)}] Parsing message {message_id}")
+                parsed.append(self.parse_gmail_message(msg))
+            except Exception as e:
+                print(f"   ❌ Error parsing message {message_id}: {str(e)}")
+                error_count += 1
+
+        await self.ingest_emails(user_id, parsed, account_id, error_count)
+
+    async def ingest_emails(self, user_id: int, emails: list, account_id: Optional[int] = None, error_count: int = 0):
+        """Store parsed emails (Email model format) from any provider in local database"""
+        if not emails:
+            print(f"📭 No emails to store")
+            return
 
-                email_data = self.parse_gmail_message(msg)
+        print(f"💾 Storing {len(emails)} emails in database")
+
+        stored_count = 0
+
+        for email_data in emails:
+            try:
                 email_data["user_id"] = user_id
+                email_data["account_id"] = account_id
+                # Listings are ordered by sent_at; undated messages sort by arrival
+                if not email_data.get("sent_at"):
+                    email_data["sent_at"] = email_data.get("received_at") or datetime.utcnow()
 
                 email = Email(**email_data)
+                index_email(email)
                 self.db.add(email)
                 stored_count += 1
 
                 # Log key details about stored email
-                subject = email_data.get("subject", "(No Subject)")[:50]
-                from_addr = email_data.get("from_address", "(Unknown)")[:30]
+                subject = (email_data.get("subject") or "(No Subject)")[:50]
+                from_addr = (email_data.get("from_address") or "(Unknown)")[:30]
                 sent_at = email_data.get("sent_at", "Unknown Date")
                 print(f"      ✅ Stored: '{subject}' from '{from_addr}' sent {sent_at}")
 
             except Exception as e:
-                print(f"   ❌ Error parsing/storing message {message_id}: {str(e)}")
+                print(f"   ❌ Error storing message {email_data.get('gmail_id', 'unknown')}: {str(e)}")
                 error_count += 1
 
         try:
@@ -293,6 +651,55 @@ class GmailSyncWorker:
         print(f"   • Successfully stored: {stored_count} emails")
         print(f"   • Storage errors: {error_count} emails")
 
+    def known_message_ids(self, user_id: int, message_ids: list) -> set:
+        """Return the provider message IDs from message_ids that are already stored"""
+        known = set()
+        for start in range(0, len(message_ids), PAGE_SIZE):
+            chunk = message_ids[start:start + PAGE_SIZE]
+            known.update(
+                row[0] for row in self.db.query(Email.gmail_id).filter(
+                    Email.gmail_id.in_(chunk),
+                    Email.user_id == user_id
+                ).all()
+            )
+        return known
+
+    async def apply_flag_updates(self, user_id: int, updates: dict):
+        """Apply changed flags/labels reported by a provider to stored emails"""
+        if not updates:
+            return
+
+        emails = self.db.query(Email).filter(
+            Email.user_id == user_id,
+            Email.gmail_id.in_(list(updates.keys()))
+        ).all()
+
+        for email in emails:
+            for column, value in updates[email.gmail_id].items():
+                set_flag(email, column, value)
+
+        self.db.commit()
+        print(f"🔁 Updated flags on {len(emails)} emails")
+
+    async def apply_removals(self, user_id: int, removed: dict):
+        """Reflect messages deleted from or moved out of the remote inbox"""
+        if not removed:
+            return
+
+        emails = self.db.query(Email).filter(
+            Email.user_id == user_id,
+            Email.gmail_id.in_(list(removed.keys()))
+        ).all()
+
+        for email in emails:
+            if removed[email.gmail_id] == "deleted":
+                set_flag(email, "is_trash", True)
+            elif email.labels and "INBOX" in email.labels:
+                email.labels = [label for label in email.labels if label != "INBOX"]
+
+        self.db.commit()
+        print(f"🗑️  Applied {len(emails)} removals")
+
     def parse_gmail_message(self, gmail_msg: dict) -> dict:
         """Parse Gmail API message format into our Email model format"""
         payload = gmail_msg.get("payload", {})
@@ -322,9 +729,11 @@ class GmailSyncWorker:
             data["bcc_addresses"] = [addr.strip() for addr in bcc_addresses.split(",")]
 
         # Parse email body
-        body_text, body_html = self.extract_email_body(payload)
+        body_text, body_html, truncated = self.extract_email_body(payload, gmail_msg["id"])
         data["body_text"] = body_text
         data["body_html"] = body_html
+        data["body_truncated"] = truncated
+        data["has_attachments"] = self.has_attachments(payload)
 
         # Parse dates
         date_str = headers.get("Date")
@@ -357,25 +766,27 @@ class GmailSyncWorker:
 
         return data
 
-    def extract_email_body(self, payload: dict) -> tuple:
-        """Extract text and HTML body from Gmail message payload"""
-        body_text = ""
-        body_html = ""
+    def extract_email_body(self, payload: dict, message_id: Optional[str] = None) -> tuple:
+        """Extract text and HTML body from Gmail message payload
 
-        def extract_parts(part):
-            nonlocal body_text, body_html
+        Non-attachment parts of each type are concatenated under the size caps
+        in services.body_parser; oversized bodies are truncated and the full
+        content is spilled to the body store. Returns (body_text, body_html, truncated).
+        """
+        bodies = {
+            "text/plain": BoundedBody("text", message_id, self.body_store),
+            "text/html": BoundedBody("html", message_id, self.body_store),
+        }
 
+        def extract_parts(part):
             mime_type = part.get("mimeType", "")
+            body = bodies.get(mime_type)
 
-            if mime_type == "text/plain":
+            # Text parts with a filename are attachments, not the message body
+            if body is not None and not part.get("filename"):
                 body_data = part.get("body", {}).get("data", "")
                 if body_data:
-                    body_text = base64.urlsafe_b64decode(body_data).decode("utf-8", errors="ignore")
-
-            elif mime_type == "text/html":
-                body_data = part.get("body", {}).get("data", "")
-                if body_data:
-                    body_html = base64.urlsafe_b64decode(body_data).decode("utf-8", errors="ignore")
+                    body.feed_base64url(body_data)
 
             # Recursively process multipart messages
             if "parts" in part:
@@ -383,38 +794,28 @@ class GmailSyncWorker:
                     extract_parts(subpart)
 
         extract_parts(payload)
-        return body_text, body_html
 
-    async def refresh_access_token(self, user: User):
-        """Refresh expired access token"""
-        if not user.google_refresh_token:
-            raise Exception("No refresh token available")
+        body_text = bodies["text/plain"].finish()
+        body_html = bodies["text/html"].finish()
+        truncated = bodies["text/plain"].truncated or bodies["text/html"].truncated
 
-        token_url = "https://oauth2.googleapis.com/token"
-        data = {
-            "client_id": os.getenv("GOOGLE_CLIENT_ID"),
-            "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
-            "refresh_token": user.google_refresh_token,
-            "grant_type": "refresh_token"
-        }
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(token_url, data=data)
+        if truncated:
+            print(f"   ✂️  Body exceeds {BODY_DB_MAX_BYTES} bytes - stored truncated copy, full body spilled to disk")
 
-        if response.status_code != 200:
-            raise Exception(f"Failed to refresh token: {response.text}")
+        return body_text, body_html, truncated
 
-        tokens = response.json()
-        user.google_access_token = tokens["access_token"]
-        user.google_token_expires_at = datetime.utcnow() + timedelta(seconds=tokens.get("expires_in", 3600))
+    def has_attachments(self, payload: dict) -> bool:
+        """Whether any part of a Gmail message payload is a file attachment"""
+        if payload.get("filename") or payload.get("body", {}).get("attachmentId"):
+            return True
+        return any(self.has_attachments(part) for part in payload.get("parts", []))
 
-        self.db.commit()
-
-    async def log_sync_error(self, user_id: int, error_message: str):
+    async def log_sync_error(self, user_id: int, error_message: str, account_id: Optional[int] = None, provider: str = "gmail"):
         """Log sync error to sync_state table"""
         sync_state = self.db.query(SyncState).filter(
             SyncState.user_id == user_id,
-            SyncState.provider == "gmail"
+            SyncState.provider == provider,
+            SyncState.account_id == account_id
         ).first()
 
         if sync_state:
@@ -428,15 +829,27 @@ class GmailSyncWorker:
         self.db.close()
 
 async def main():
-    """Main function for running the sync worker"""
+    """Main function for running the sync worker
+
+    Pass --idle to keep running and push-sync IMAP accounts via IDLE.
+    """
+    import sys
+    current_endpoint.set("sync_worker")
     worker = GmailSyncWorker()
+    broker = get_token_broker()
+    broker.start()
 
     try:
         await worker.sync_all_users()
         print("✅ Email sync completed successfully")
+
+        if "--idle" in sys.argv:
+            await worker.watch_imap_accounts()
     except Exception as e:
         print(f"❌ Email sync failed: {str(e)}")
     finally:
+        await broker.stop()
+        await close_http_client()
         worker.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Test the IMAP sync provider against a pure-Python fake IMAP server
+
+The fake speaks enough IMAP4rev1 for the provider: LOGIN, CAPABILITY,
+ENABLE QRESYNC, SELECT with CONDSTORE/QRESYNC, UID SEARCH, pipelined
+UID FETCH (incl. CHANGEDSINCE) and IDLE. No database is needed.
+
+To run against a real server instead (e.g. a GreenMail or Dovecot container:
+docker run -p 3143:3143 greenmail/standalone), set IMAP_TEST_HOST,
+IMAP_TEST_PORT, IMAP_TEST_USER and IMAP_TEST_PASSWORD.
+"""
+
+import asyncio
+import os
+import re
+from services.imap_provider import ImapProvider
+
+
+def make_message(uid: int) -> bytes:
+    return (
+        f"From: Sender {uid} <sender{uid}@example.com>\r\n"
+        f"To: me@example.com\r\n"
+        f"Subject: Fake message {uid}\r\n"
+        f"Date: Mon, 06 Jan 2025 10:00:00 +0000\r\n"
+        f"Message-ID: <msg{uid}@example.com>\r\n"
+        f"Content-Type: text/plain; charset=utf-8\r\n"
+        f"\r\n"
+        f"Hello from message {uid}\r\n"
+    ).encode()
+
+
+class FakeImapServer:
+    """In-memory IMAP server for one INBOX"""
+
+    def __init__(self):
+        self.uidvalidity = 7
+        self.modseq = 10
+        self.messages = {uid: {"flags": set(), "modseq": 10} for uid in range(1, 251)}
+        self.vanished = {}  # uid -> modseq when expunged
+        self.fetch_commands = 0
+        self.max_pipelined = 0
+        self.idlers = []
+
+    def change(self):
+        self.modseq += 1
+        return self.modseq
+
+    def add_message(self):
+        uid = max(list(self.messages) + list(self.vanished)) + 1
+        self.messages[uid] = {"flags": set(), "modseq": self.change()}
+        for idler in self.idlers:
+            idler.set()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(b"* OK [CAPABILITY IMAP4rev1 IDLE CONDSTORE QRESYNC ENABLE] fake ready\r\n")
+        while True:
+            # Count commands that arrived before we answered any of them
+            line = await reader.readline()
+            if not line:
+                break
+            pipelined = 1 + reader._buffer.count(b"\r\n") if hasattr(reader, "_buffer") else 1
+            self.max_pipelined = max(self.max_pipelined, pipelined)
+
+            tag, command = line.decode().rstrip("\r\n").split(" ", 1)
+            verb = command.split(" ", 1)[0].upper()
+
+            if verb == "CAPABILITY":
+                writer.write(b"* CAPABILITY IMAP4rev1 IDLE CONDSTORE QRESYNC ENABLE\r\n")
+            elif verb in ("LOGIN", "ENABLE", "LOGOUT"):
+                if verb == "ENABLE":
+                    writer.write(b"* ENABLED QRESYNC\r\n")
+            elif verb == "SELECT":
+                self.select(command, writer)
+            elif command.upper().startswith("UID SEARCH"):
+                low = int(re.search(r"UID (\d+):\*", command).group(1))
+                uids = [uid for uid in sorted(self.messages) if uid >= low] or [max(self.messages)]
+                writer.write(("* SEARCH " + " ".join(map(str, uids)) + "\r\n").encode())
+            elif command.upper().startswith("UID FETCH"):
+                self.fetch_commands += 1
+                self.fetch(command, writer)
+            elif verb == "IDLE":
+                await self.idle(reader, writer)
+            writer.write(f"{tag} OK {verb} completed\r\n".encode())
+            await writer.drain()
+            if verb == "LOGOUT":
+                break
+        writer.close()
+
+    def select(self, command: str, writer: asyncio.StreamWriter):
+        writer.write(f"* {len(self.messages)} EXISTS\r\n".encode())
+        writer.write(f"* OK [UIDVALIDITY {self.uidvalidity}] ok\r\n".encode())
+        writer.write(f"* OK [UIDNEXT {max(self.messages) + 1}] ok\r\n".encode())
+        writer.write(f"* OK [HIGHESTMODSEQ {self.modseq}] ok\r\n".encode())
+        match = re.search(r"QRESYNC \((\d+) (\d+)\)", command)
+        if match and int(match.group(1)) == self.uidvalidity:
+            since = int(match.group(2))
+            gone = [uid for uid, modseq in self.vanished.items() if modseq > since]
+            if gone:
+                writer.write(f"* VANISHED (EARLIER) {','.join(map(str, gone))}\r\n".encode())
+            for seq, uid in enumerate(sorted(self.messages), 1):
+                message = self.messages[uid]
+                if message["modseq"] > since:
+                    flags = " ".join(sorted(message["flags"]))
+                    writer.write(f"* {seq} FETCH (UID {uid} FLAGS ({flags}) MODSEQ ({message['modseq']}))\r\n".encode())
+
+    def fetch(self, command: str, writer: asyncio.StreamWriter):
+        uid_set = command.split(" ")[2]
+        wanted = set()
+        for part in uid_set.split(","):
+            if ":" in part:
+                a, b = part.split(":")
+                wanted.update(range(int(a), (int(b) if b != "*" else max(self.messages)) + 1))
+            else:
+                wanted.add(int(part))
+        since = re.search(r"CHANGEDSINCE (\d+)", command)
+        for seq, uid in enumerate(sorted(self.messages), 1):
+            message = self.messages[uid]
+            if uid not in wanted or (since and message["modseq"] <= int(since.group(1))):
+                continue
+            flags = " ".join(sorted(message["flags"]))
+            if "BODY.PEEK[]" in command:
+                raw = make_message(uid)
+                writer.write(
+                    f'* {seq} FETCH (UID {uid} FLAGS ({flags}) INTERNALDATE "06-Jan-2025 10:00:05 +0000" BODY[]<0> {{{len(raw)}}}\r\n'.encode()
+                    + raw + b")\r\n"
+                )
+            else:
+                writer.write(f"* {seq} FETCH (UID {uid} FLAGS ({flags}) MODSEQ ({message['modseq']}))\r\n".encode())
+
+    async def idle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        event = asyncio.Event()
+        self.idlers.append(event)
+        writer.write(b"+ idling\r\n")
+        await writer.drain()
+        done = asyncio.ensure_future(reader.readline())
+        changed = asyncio.ensure_future(event.wait())
+        finished, _ = await asyncio.wait([done, changed], return_when=asyncio.FIRST_COMPLETED)
+        if changed in finished:
+            writer.write(f"* {len(self.messages)} EXISTS\r\n".encode())
+            await writer.drain()
+            await done
+        else:
+            changed.cancel()
+        self.idlers.remove(event)
+
+
+async def run_tests():
+    stored = set()
+
+    if os.getenv("IMAP_TEST_HOST"):
+        fake = None
+        host, port = os.getenv("IMAP_TEST_HOST"), int(os.getenv("IMAP_TEST_PORT", "993"))
+        username, password = os.getenv("IMAP_TEST_USER"), os.getenv("IMAP_TEST_PASSWORD")
+    else:
+        fake = FakeImapServer()
+        server = await asyncio.start_server(fake.handle, "127.0.0.1", 0)
+        host, port = "127.0.0.1", server.sockets[0].getsockname()[1]
+        username, password = "me@example.com", "secret"
+
+    def provider():
+        # The fake server has no TLS and listens on loopback
+        return ImapProvider(
+            1, host, port, username, password, use_ssl=port == 993,
+            allow_plaintext=fake is not None, allow_private_hosts=fake is not None
+        )
+
+    print("🔍 Test 1: Initial sync with pipelined UID FETCH")
+    imap = provider()
+    try:
+        batch = await imap.fetch_changes(None, lambda ids: stored & set(ids))
+    finally:
+        await imap.close()
+    stored.update(email["gmail_id"] for email in batch.new_emails)
+    print(f"   {len(batch.new_emails)} new emails, {batch.api_calls} commands, cursor {batch.cursor}")
+    if fake:
+        ok = len(batch.new_emails) == 250 and fake.max_pipelined > 1
+        print(f"{'✅' if ok else '❌'} fetched all messages; up to {fake.max_pipelined} commands were in flight at once")
+
+    if fake:
+        print("\n🔍 Test 2: QRESYNC incremental sync")
+        fake.messages[3]["flags"].add("\\Seen")
+        fake.messages[3]["modseq"] = fake.change()
+        del fake.messages[4]
+        fake.vanished[4] = fake.change()
+        fake.add_message()
+
+        imap = provider()
+        try:
+            batch = await imap.fetch_changes(batch.cursor, lambda ids: stored & set(ids))
+        finally:
+            await imap.close()
+        ok = (
+            len(batch.new_emails) == 1
+            and batch.flag_updates == {"imap:1:7:3": {"is_read": True, "is_starred": False, "is_trash": False}}
+            and batch.removed == {"imap:1:7:4": "deleted"}
+        )
+        print(f"{'✅' if ok else '❌'} new={len(batch.new_emails)} flag_updates={batch.flag_updates} removed={batch.removed}")
+
+        print("\n🔍 Test 3: IDLE wakes up on new mail")
+        imap = provider()
+        try:
+            asyncio.get_running_loop().call_later(0.2, fake.add_message)
+            changed = await imap.wait_for_changes(timeout=5)
+        finally:
+            await imap.close()
+        print(f"{'✅' if changed else '❌'} IDLE reported a change: {changed}")
+
+        server.close()
+
+
+def main():
+    print("🧪 Testing IMAP provider")
+    print("=" * 30)
+    asyncio.run(run_tests())
+
+
+if __name__ == "__main__":
+    main()
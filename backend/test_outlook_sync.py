@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test the Outlook (Microsoft Graph) sync provider against a local Graph stand-in
+
+The stand-in serves just enough of Graph for delta queries and $batch:
+  GET  /v1.0/me/mailFolders/inbox/messages/delta   (initial sync and deltaLink replay)
+  POST /v1.0/$batch                                (GET /me/messages/{id} sub-requests,
+                                                    429 for IDs in server.throttled)
+No Microsoft account or database is needed.
+"""
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+from services.outlook_provider import OutlookProvider
+
+MESSAGES = {
+    f"AAMk-{i}": {
+        "id": f"AAMk-{i}",
+        "conversationId": f"conv-{i // 3}",
+        "subject": f"Stand-in message {i}",
+        "from": {"emailAddress": {"name": "Sender", "address": "sender@example.com"}},
+        "toRecipients": [{"emailAddress": {"address": "me@example.com"}}],
+        "bodyPreview": f"Preview {i}",
+        "body": {"contentType": "html", "content": f"<p>Body {i}</p>"},
+        "isRead": i % 2 == 0,
+        "isDraft": False,
+        "flag": {"flagStatus": "notFlagged"},
+        "importance": "normal",
+        "sentDateTime": "2025-01-01T10:00:00Z",
+        "receivedDateTime": "2025-01-01T10:00:05Z",
+    }
+    for i in range(45)
+}
+
+
+class GraphStandIn(BaseHTTPRequestHandler):
+    """Minimal Graph stand-in; records request counts on the server"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status_code: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.server.calls["delta"] += 1
+        base = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}/v1.0"
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        ids = sorted(MESSAGES)
+
+        if "$deltatoken" in query:
+            # Second sync: one message read, one flagged, one deleted
+            return self.send_json(200, {
+                "value": [
+                    {"id": ids[0], "isRead": True, "flag": {"flagStatus": "flagged"}, "importance": "normal"},
+                    {"id": ids[1], "@removed": {"reason": "deleted"}},
+                    {"id": "AAMk-new", "isRead": False, "flag": {"flagStatus": "notFlagged"}, "importance": "high"},
+                ],
+                "@odata.deltaLink": f"{base}/me/mailFolders/inbox/messages/delta?$deltatoken=2",
+            })
+
+        # Initial sync: two pages of IDs
+        skip = int(query.get("$skiptoken", ["0"])[0])
+        page = ids[skip:skip + 25]
+        body = {"value": [{"id": i, "isRead": MESSAGES[i]["isRead"]} for i in page]}
+        if skip + 25 < len(ids):
+            body["@odata.nextLink"] = f"{base}/me/mailFolders/inbox/messages/delta?$skiptoken={skip + 25}"
+        else:
+            body["@odata.deltaLink"] = f"{base}/me/mailFolders/inbox/messages/delta?$deltatoken=1"
+        self.send_json(200, body)
+
+    def do_POST(self):
+        self.server.calls["batch"] += 1
+        length = int(self.headers["Content-Length"])
+        requests = json.loads(self.rfile.read(length))["requests"]
+        assert len(requests) <= 20, "Graph rejects $batch with more than 20 requests"
+
+        responses = []
+        for request in requests:
+            message_id = unquote(urlparse(request["url"]).path.rsplit("/", 1)[1])
+            if message_id in self.server.throttled:
+                responses.append({"id": request["id"], "status": 429, "headers": {"Retry-After": "0"}})
+                continue
+            message = MESSAGES.get(message_id) or {**MESSAGES["AAMk-0"], "id": message_id, "subject": "New"}
+            responses.append({"id": request["id"], "status": 200, "body": message})
+        self.send_json(200, {"responses": responses})
+
+
+async def run_sync(base_url: str, server: ThreadingHTTPServer):
+    stored = set()
+    provider = OutlookProvider("stand-in-token", base_url=base_url)
+    try:
+        print("🔍 Test 1: Initial delta sync")
+        batch = await provider.fetch_changes(None, lambda ids: stored & set(ids))
+        stored.update(email["gmail_id"] for email in batch.new_emails)
+        ok = len(batch.new_emails) == len(MESSAGES) and batch.cursor and "deltatoken=1" in batch.cursor
+        print(f"{'✅' if ok else '❌'} {len(batch.new_emails)} new emails, {batch.api_calls} API calls, cursor saved: {bool(batch.cursor)}")
+
+        print("\n🔍 Test 2: Unfetched message keeps the cursor")
+        server.throttled = {"AAMk-new"}
+        retried = await provider.fetch_changes(batch.cursor, lambda ids: stored & set(ids))
+        server.throttled = set()
+        ok = not retried.new_emails and retried.cursor == batch.cursor
+        print(f"{'✅' if ok else '❌'} new={len(retried.new_emails)}, cursor kept: {retried.cursor == batch.cursor}")
+
+        print("\n🔍 Test 3: Incremental sync from deltaLink")
+        batch = await provider.fetch_changes(retried.cursor, lambda ids: stored & set(ids))
+        ok = (
+            [email["gmail_id"] for email in batch.new_emails] == ["AAMk-new"]
+            and batch.flag_updates.get("AAMk-0", {}).get("is_starred") is True
+            and batch.removed == {"AAMk-1": "deleted"}
+        )
+        print(f"{'✅' if ok else '❌'} new={len(batch.new_emails)} flag_updates={len(batch.flag_updates)} removed={batch.removed}")
+    finally:
+        await provider.close()
+
+
+def main():
+    print("🧪 Testing Outlook provider against Graph stand-in")
+    print("=" * 50)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GraphStandIn)
+    server.calls = {"delta": 0, "batch": 0}
+    server.throttled = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        asyncio.run(run_sync(f"http://127.0.0.1:{server.server_address[1]}/v1.0", server))
+        print(f"\n📊 Stand-in saw {server.calls['delta']} delta requests and {server.calls['batch']} $batch requests")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Test that every search operator is answered from an index
+
+Seeds a throwaway mailbox of 50,000 emails, runs ANALYZE, and checks the
+EXPLAIN plan of the count query GET /emails runs for each operator (the
+query that must visit every match): it has to use the operator's index and
+must not sequentially scan emails. The page query (ORDER BY sent_at LIMIT)
+is checked for sequential scans too, and a deep cursor page must be an
+ordered range scan of the listing index.
+
+Needs PostgreSQL (DATABASE_URL) migrated to head (alembic upgrade head).
+Everything runs in one transaction that is rolled back, so the database is
+left unchanged.
+"""
+
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, text
+from database.connection import engine
+from database.explain import Explain, plan_of
+from services.email_service import EmailService
+
+MAILBOX_SIZE = 50000
+PER_PAGE = 50
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(conn, statement, nodes_out: list = None):
+    """(indexes used, whether emails is sequentially scanned)"""
+    plan = plan_of(conn.execute(Explain(statement)))
+    nodes = list(plan_nodes(plan))
+    if nodes_out is not None:
+        nodes_out.extend(nodes)
+    indexes = {node["Index Name"] for node in nodes if "Index Name" in node}
+    seq_scan = any(node["Node Type"] == "Seq Scan" and node.get("Relation Name") == "emails" for node in nodes)
+    return indexes, seq_scan
+
+
+def check_keyset_page(conn, user_id: int) -> bool:
+    """A deep cursor page must be an ordered range scan of the listing index (no sort, no offset)"""
+    query, ordering, _ = EmailService.list_query(user_id)
+    middle = datetime.utcnow() - timedelta(days=200)
+    page = query.filter(EmailService._after({"t": middle.isoformat(), "i": 1})).order_by(*ordering).limit(PER_PAGE + 1)
+    nodes = []
+    indexes, seq_scan = explain(conn, page, nodes)
+    sorted_in_memory = any(node["Node Type"] in ("Sort", "Incremental Sort") for node in nodes)
+    ok = "ix_emails_user_listing" in indexes and not seq_scan and not sorted_in_memory
+    print(f"{'✅' if ok else '❌'} keyset page (cursor 200 days back)")
+    print(f"     page:  {', '.join(sorted(indexes)) or 'no index'}{' + SORT' if sorted_in_memory else ''}")
+    return ok
+
+
+def seed_mailbox(conn) -> int:
+    user_id = conn.execute(
+        text("INSERT INTO users (email, name, is_active) VALUES (:email, 'Plan test', true) RETURNING id"),
+        {"email": f"plan-test-{uuid.uuid4().hex}@example.com"}
+    ).scalar()
+
+    # One email every 10 minutes going back ~350 days, with flags at known rates
+    conn.execute(text("""
+        INSERT INTO emails (
+            gmail_id, user_id, subject, from_address, snippet, labels, system_labels,
+            is_read, is_starred, is_important, is_draft, is_sent, is_trash,
+            has_attachments, body_truncated, sent_at, received_at, search_vector
+        )
+        SELECT
+            :prefix || g, :user_id,
+            CASE WHEN g % 200 = 0 THEN 'Quarterly report ' || g ELSE 'Newsletter issue ' || g END,
+            'sender' || (g % 500) || '@example.com',
+            'Snippet ' || g,
+            CASE
+                WHEN g % 50 = 0 THEN '["INBOX", "Label_work"]'
+                WHEN g % 25 = 0 THEN '["SENT"]'
+                WHEN g % 35 = 0 THEN '["INBOX", "CATEGORY_SOCIAL"]'
+                ELSE '["INBOX"]'
+            END::json,
+            CASE WHEN g % 50 = 0 THEN 1 WHEN g % 25 = 0 THEN 2 WHEN g % 35 = 0 THEN 1 | 1024 ELSE 1 END,
+            g % 20 <> 0, g % 100 = 0, g % 30 = 0, false, g % 25 = 0, g % 400 = 0,
+            g % 40 = 0, false,
+            now() - g * interval '10 minutes', now() - g * interval '10 minutes',
+            to_tsvector('english', CASE WHEN g % 200 = 0 THEN 'Quarterly report' ELSE 'Newsletter issue' END)
+        FROM generate_series(1, :size) AS g
+    """), {"prefix": f"plan-test-{uuid.uuid4().hex}-", "user_id": user_id, "size": MAILBOX_SIZE})
+    conn.execute(text("""
+        INSERT INTO email_labels (email_id, label, user_id)
+        SELECT emails.id, l.label, emails.user_id
+        FROM emails, json_array_elements_text(emails.labels) AS l(label)
+        WHERE emails.user_id = :user_id AND l.label = 'Label_work'
+    """), {"user_id": user_id})
+
+    conn.execute(text("ANALYZE emails"))
+    conn.execute(text("ANALYZE email_labels"))
+    return user_id
+
+
+def run_tests():
+    today = datetime.utcnow()
+    recent = (today - timedelta(days=3)).strftime("%Y/%m/%d")
+    old = (today - timedelta(days=340)).strftime("%Y/%m/%d")
+
+    # Query -> indexes that answer it (any one of them)
+    cases = [
+        ("from:sender42@example.com", {"ix_emails_from_address_trgm"}),
+        ("subject:quarterly", {"ix_emails_subject_trgm"}),
+        (f"after:{recent}", {"ix_emails_user_listing"}),
+        (f"before:{old}", {"ix_emails_user_listing"}),
+        ("newer_than:2d", {"ix_emails_user_listing"}),
+        ("older_than:11m", {"ix_emails_user_listing"}),
+        ("is:unread", {"ix_emails_user_unread"}),
+        ("is:starred", {"ix_emails_user_starred"}),
+        ("is:important", {"ix_emails_user_important"}),
+        ("has:attachment", {"ix_emails_user_attachments"}),
+        ("in:trash", {"ix_emails_user_trash"}),
+        ("label:Label_work", {"ix_email_labels_user_label"}),
+        ("label:STARRED", {"ix_emails_user_starred"}),
+        ("in:sent", {"ix_emails_user_label_sent"}),
+        ("category:social", {"ix_emails_user_label_category_social"}),
+        ('"quarterly report"', {"ix_emails_search_vector"}),
+        ("from:sender7@example.com is:unread has:attachment",
+         {"ix_emails_from_address_trgm", "ix_emails_user_unread", "ix_emails_user_attachments"}),
+        (f"from:sender7@example.com after:{old} quarterly",
+         {"ix_emails_from_address_trgm", "ix_emails_search_vector", "ix_emails_user_listing"}),
+    ]
+
+    passed = 0
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            print(f"🌱 Seeding {MAILBOX_SIZE} emails...")
+            user_id = seed_mailbox(conn)
+
+            for search, expected in cases:
+                query, ordering, _ = EmailService.list_query(user_id, search=search)
+                count_indexes, count_seq_scan = explain(conn, select(func.count()).select_from(query.subquery()))
+                page_indexes, page_seq_scan = explain(conn, query.order_by(*ordering).limit(PER_PAGE))
+
+                ok = bool(count_indexes & expected) and not count_seq_scan and not page_seq_scan
+                passed += ok
+                print(f"{'✅' if ok else '❌'} {search}")
+                print(f"     count: {', '.join(sorted(count_indexes)) or 'no index'}{' + SEQ SCAN' if count_seq_scan else ''}")
+                print(f"     page:  {', '.join(sorted(page_indexes)) or 'no index'}{' + SEQ SCAN' if page_seq_scan else ''}")
+
+            keyset_ok = check_keyset_page(conn, user_id)
+        finally:
+            transaction.rollback()
+
+    print(f"\n📊 {passed}/{len(cases)} operators use their indexes")
+    return passed == len(cases) and keyset_ok
+
+
+def main():
+    print("🧪 Testing search operator query plans")
+    print("=" * 40)
+    run_tests()
+
+
+if __name__ == "__main__":
+    main()
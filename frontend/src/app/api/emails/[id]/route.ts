@@ -0,0 +1,48 @@
+import { NextRequest, NextResponse } from 'next/server'
+import { getServerSession } from 'next-auth'
+import { authOptions } from '@/lib/auth'
+import { backendApi } from '@/lib/backend-api'
+
+export async function GET(
+  request: NextRequest,
+  { params }: { params: Promise<{ id: string }> }
+) {
+  try {
+    const session = await getServerSession(authOptions)
+
+    if (!session?.accessToken) {
+      return NextResponse.json({ error: 'Unauthorized' }, { status: 401 })
+    }
+
+    const { id: emailId } = await params
+    if (!emailId) {
+      return NextResponse.json({ error: 'Email ID is required' }, { status: 400 })
+    }
+
+    // Use backend JWT from session (multi-user) or fallback to environment
+    const backendJwt = session.backendToken || process.env.NEXT_PUBLIC_BACKEND_JWT_TOKEN
+
+    if (!backendJwt) {
+      return NextResponse.json({ error: 'Backend authentication required' }, { status: 401 })
+    }
+
+    backendApi.setJwtToken(backendJwt)
+
+    // Convert string ID to number for backend API
+    const numericEmailId = parseInt(emailId)
+    if (isNaN(numericEmailId)) {
+      return NextResponse.json({ error: 'Invalid email ID' }, { status: 400 })
+    }
+
+    // The list endpoint returns summaries; bodies are loaded here when an email is opened
+    const email = await backendApi.getEmail(numericEmailId)
+
+    return NextResponse.json({
+      body_text: email.body_text ?? null,
+      body_html: email.body_html ?? null
+    })
+  } catch (error) {
+    console.error('Error fetching email:', error)
+    return NextResponse.json({ error: 'Internal server error' }, { status: 500 })
+  }
+}
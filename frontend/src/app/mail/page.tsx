@@ -12,6 +12,7 @@ import Toast from '@/components/Toast'
 import KeyboardShortcutsHelp from '@/components/KeyboardShortcutsHelp'
 import AccountSwitcher, { AccountSwitcherRef } from '@/components/AccountSwitcher'
 import { Email } from '@/types/email'
+import { BackendEmail } from '@/lib/backend-api'
 import { useKeyboardShortcuts } from '@/hooks/useKeyboardShortcuts'
 
 export default function Home() {
@@ -79,20 +80,50 @@ export default function Home() {
     }
   }, [selectedEmail, filteredEmails])
 
-  useEffect(() => {
-    fetchEmailCounts()
-
-    // Refresh counts every 30 seconds
-    const interval = setInterval(fetchEmailCounts, 30000)
-    return () => clearInterval(interval)
-  }, [session])
-
   const handleRefresh = () => {
     fetchEmailCounts()
     // Force EmailList to refresh by clearing and refetching emails
     setEmails([])
   }
 
+  useEffect(() => {
+    const backendToken = session?.backendToken
+    if (!backendToken || typeof EventSource === 'undefined') {
+      fetchEmailCounts()
+
+      // Refresh counts every 30 seconds
+      const interval = setInterval(fetchEmailCounts, 30000)
+      return () => clearInterval(interval)
+    }
+
+    // The backend pushes counts and flag changes as they are committed
+    const backendUrl = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:8000'
+    const events = new EventSource(`${backendUrl}/emails/events?token=${encodeURIComponent(backendToken)}`)
+
+    events.addEventListener('counts', (event) => {
+      const { version, ...counts } = JSON.parse((event as MessageEvent).data)
+      setEmailCounts(counts)
+    })
+
+    events.addEventListener('changes', (event) => {
+      const { updated } = JSON.parse((event as MessageEvent).data)
+      const changed = new Map<number, BackendEmail>(updated.map((email: BackendEmail) => [email.id, email]))
+      if (changed.size === 0) return
+
+      setEmails(prev => prev.map(email => {
+        const change = email.backendId !== undefined ? changed.get(email.backendId) : undefined
+        return change
+          ? { ...email, isRead: change.is_read, isStarred: change.is_starred, labels: change.labels || [] }
+          : email
+      }))
+    })
+
+    // The stream couldn't catch up (e.g. after a long disconnect); it reconnects by itself
+    events.addEventListener('reload', handleRefresh)
+
+    return () => events.close()
+  }, [session])
+
   // Update selected index when selected email changes
   useEffect(() => {
     if (selectedEmail) {
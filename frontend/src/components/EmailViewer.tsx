@@ -1,6 +1,6 @@
 'use client'
 
-import { useState, useImperativeHandle, forwardRef } from 'react'
+import { useState, useEffect, useImperativeHandle, forwardRef } from 'react'
 import { Email, Attachment } from '@/types/email'
 import LabelManager from './LabelManager'
 import EmailRenderer from './EmailRenderer'
@@ -35,6 +35,31 @@ const EmailViewer = forwardRef<EmailViewerHandle, EmailViewerProps>(
   const [showLabelManager, setShowLabelManager] = useState(false)
   const [previewingPdf, setPreviewingPdf] = useState<Attachment | null>(null)
 
+  // List responses are summaries without bodies; load the body when an email is opened
+  useEffect(() => {
+    if (!email?.backendId || email.body_html || email.body_text || email.body) return
+
+    let cancelled = false
+    const emailId = email.id
+
+    fetch(`/api/emails/${email.backendId}`)
+      .then(response => {
+        if (!response.ok) throw new Error('Failed to load email body')
+        return response.json()
+      })
+      .then(({ body_html, body_text }) => {
+        if (cancelled) return
+        onEmailUpdate?.(emailId, {
+          body_html: body_html || undefined,
+          body_text: body_text || undefined,
+          body: body_html || body_text || ''
+        })
+      })
+      .catch(error => console.error('Error loading email body:', error))
+
+    return () => { cancelled = true }
+  }, [email?.id, email?.backendId])
+
   const handleMarkAsRead = async (markAsRead: boolean) => {
     if (!email) return
 
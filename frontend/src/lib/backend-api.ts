@@ -9,10 +9,11 @@ export interface BackendEmail {
   subject: string
   from_address: string
   to_addresses: string[]
-  cc_addresses: string[]
-  bcc_addresses: string[]
-  body_text: string | null
-  body_html: string | null
+  cc_addresses?: string[]
+  bcc_addresses?: string[]
+  // Only set by getEmail(); list responses are summaries without bodies
+  body_text?: string | null
+  body_html?: string | null
   snippet: string | null
   sent_at: string | null
   received_at: string | null
@@ -30,17 +31,43 @@ export interface BackendEmail {
 export interface BackendEmailResponse {
   emails: BackendEmail[]
   total: number
+  total_is_estimate?: boolean
+  next_cursor?: string | null
+  version?: number // Mailbox version of this page; pass to getChanges() as since
   page: number
   per_page: number
 }
 
+export interface BackendEmailChanges {
+  inserted: BackendEmail[]
+  updated: BackendEmail[]
+  deleted: number[] // Backend email IDs
+  version: number // Pass as since for the next changes
+  has_more: boolean
+}
+
+export type BackendBulkAction = 'read' | 'unread' | 'star' | 'unstar' | 'archive' | 'trash'
+
+// Same filters as getEmails(); search accepts Gmail-style operators such as from:
+export interface BackendBulkFilter {
+  search?: string
+  label?: string
+  is_read?: boolean
+  is_starred?: boolean
+  account_id?: number
+}
+
 export interface BackendEmailDetailResponse extends BackendEmail {
   // Full email details including body content
 }
 
+// Most recent ETag-validated GET responses, revalidated with If-None-Match
+const ETAG_CACHE_MAX_ENTRIES = 200
+
 class BackendApiClient {
   private baseUrl: string
   private jwtToken: string | null = null
+  private etagCache = new Map<string, { etag: string, body: unknown }>()
 
   constructor() {
     // Use localhost for development, can be configured for production
@@ -71,22 +98,44 @@ class BackendApiClient {
 
   private async request<T>(endpoint: string, options: RequestInit = {}): Promise<T> {
     const url = `${this.baseUrl}${endpoint}`
+
+    // Polled reads (email list, counts) carry ETags; unchanged mailboxes answer 304
+    const isGet = !options.method || options.method.toUpperCase() === 'GET'
+    const cacheKey = isGet ? `${this.jwtToken}|${endpoint}` : null
+    const cached = cacheKey ? this.etagCache.get(cacheKey) : undefined
+
     const config: RequestInit = {
       ...options,
       headers: {
         ...this.getHeaders(),
+        ...(cached ? { 'If-None-Match': cached.etag } : {}),
         ...options.headers,
       },
     }
 
     const response = await fetch(url, config)
 
+    if (response.status === 304 && cached) {
+      return cached.body as T
+    }
+
     if (!response.ok) {
       const errorText = await response.text()
       throw new Error(`API Error ${response.status}: ${errorText}`)
     }
 
-    return response.json()
+    const body = await response.json()
+
+    const etag = response.headers.get('ETag')
+    if (cacheKey && etag) {
+      this.etagCache.delete(cacheKey)
+      this.etagCache.set(cacheKey, { etag, body })
+      if (this.etagCache.size > ETAG_CACHE_MAX_ENTRIES) {
+        this.etagCache.delete(this.etagCache.keys().next().value as string)
+      }
+    }
+
+    return body
   }
 
   /**
@@ -95,6 +144,8 @@ class BackendApiClient {
   async getEmails(params: {
     page?: number
     per_page?: number
+    cursor?: string
+    count?: 'exact' | 'estimate' | 'none'
     search?: string
     is_read?: boolean
     is_archived?: boolean
@@ -105,6 +156,8 @@ class BackendApiClient {
 
     if (params.page) queryParams.append('page', params.page.toString())
     if (params.per_page) queryParams.append('per_page', params.per_page.toString())
+    if (params.cursor) queryParams.append('cursor', params.cursor)
+    if (params.count) queryParams.append('count', params.count)
     if (params.search) queryParams.append('search', params.search)
     if (params.is_read !== undefined) queryParams.append('is_read', params.is_read.toString())
     if (params.is_archived !== undefined) queryParams.append('is_archived', params.is_archived.toString())
@@ -117,6 +170,14 @@ class BackendApiClient {
     return this.request<BackendEmailResponse>(endpoint)
   }
 
+  /**
+   * Get emails inserted, updated or deleted since a mailbox version
+   * (throws API Error 410 when the mailbox must be reloaded instead)
+   */
+  async getChanges(since: number): Promise<BackendEmailChanges> {
+    return this.request<BackendEmailChanges>(`/emails/changes?since=${since}`)
+  }
+
   /**
    * Get single email details
    */
@@ -163,6 +224,20 @@ class BackendApiClient {
     })
   }
 
+  /**
+   * Apply an action to many emails at once: by backend ID (up to 1000) or to every
+   * email matching a listing filter. Resolves to the number of emails changed.
+   */
+  async bulkAction(
+    action: BackendBulkAction,
+    target: { ids: number[] } | { filter: BackendBulkFilter }
+  ): Promise<{ updated: number }> {
+    return this.request<{ updated: number }>('/emails/bulk', {
+      method: 'POST',
+      body: JSON.stringify({ action, ...target }),
+    })
+  }
+
   /**
    * Update email labels
    */
@@ -233,6 +308,7 @@ export const backendApi = new BackendApiClient()
 export function convertBackendEmailToFrontend(backendEmail: BackendEmail): any {
   return {
     id: backendEmail.gmail_id, // Use gmail_id as the ID for consistency
+    backendId: backendEmail.id, // Database ID, used to load the body on demand
     threadId: backendEmail.thread_id || backendEmail.gmail_id,
     subject: backendEmail.subject,
     from: backendEmail.from_address,
@@ -21,6 +21,7 @@ export interface Email {
   isStarred: boolean
   labels: string[]
   attachments?: Attachment[]
+  backendId?: number // Backend database ID; list responses omit bodies, load them from /api/emails/{backendId}
   // Multi-provider fields
   providerId?: string // 'gmail' | 'outlook' | 'yahoo'
   providerType?: 'gmail' | 'outlook' | 'yahoo'